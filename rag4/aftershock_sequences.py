@@ -0,0 +1,316 @@
+"""
+Aftershock sequence clustering for campaign triggers.
+Events are grouped into sequences with Gardner-Knopoff style windows: an event
+joins a sequence when it falls within the distance and time window of the
+sequence's mainshock, both of which grow with magnitude. Sequences are looked
+up through a grid index of mainshock locations, and only sequences whose
+window is still open stay in the index, so clustering is incremental and
+roughly linear in the number of events.
+"""
+
+import heapq
+import math
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from earthquake_queries import DAY_MS, DEFAULT_DB_PATH
+from event_dedup import KM_PER_DEGREE, haversine_km
+from target_query import nested_targets, rank_key
+
+# Grid cell size for the mainshock index
+CELL_DEGREES = 0.5
+
+# Magnitude used for events without one
+DEFAULT_MAGNITUDE = 2.5
+
+def window_distance_km(magnitude: float) -> float:
+    """Gardner-Knopoff (1974) spatial window."""
+    return 10 ** (0.1238 * magnitude + 0.983)
+
+def window_days(magnitude: float) -> float:
+    """Gardner-Knopoff (1974) temporal window."""
+    if magnitude >= 6.5:
+        return 10 ** (0.032 * magnitude + 2.7389)
+    return 10 ** (0.5409 * magnitude - 0.547)
+
+def window_ms(magnitude: float) -> int:
+    return int(window_days(magnitude) * DAY_MS)
+
+@dataclass
+class EarthquakeSequence:
+    sequence_id: str
+    mainshock_event_id: str
+    latitude: float
+    longitude: float
+    magnitude: float
+    mainshock_ms: int
+    start_ms: int
+    end_ms: int
+    event_count: int = 1
+
+    @property
+    def window_end_ms(self) -> int:
+        return self.mainshock_ms + window_ms(self.magnitude)
+
+class SequenceClusterer:
+    """Incremental sequence assignment; feed events in time order through add()."""
+
+    def __init__(self, sequences: Iterable[EarthquakeSequence] = ()):
+        self.sequences: Dict[str, EarthquakeSequence] = {}
+        self.grid: Dict[Tuple[int, int], List[str]] = {}
+        self.cell_of: Dict[str, Tuple[int, int]] = {}
+        # (window end, sequence id); entries for moved mainshocks are skipped lazily
+        self.expiry: List[Tuple[int, str]] = []
+        self.window_ends: Dict[str, int] = {}
+        # Largest mainshock magnitude per grid cell, which bounds how far that cell's windows reach
+        self.cell_max: Dict[Tuple[int, int], float] = {}
+        self.changed: Dict[str, EarthquakeSequence] = {}
+        for sequence in sequences:
+            self._index(sequence)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return int(math.floor(latitude / CELL_DEGREES)), int(math.floor(longitude / CELL_DEGREES))
+
+    def _index(self, sequence: EarthquakeSequence):
+        self.sequences[sequence.sequence_id] = sequence
+        cell = self._cell(sequence.latitude, sequence.longitude)
+        old_cell = self.cell_of.get(sequence.sequence_id)
+        if old_cell != cell:
+            if old_cell is not None:
+                self.grid[old_cell].remove(sequence.sequence_id)
+                self._update_cell_max(old_cell)
+            self.grid.setdefault(cell, []).append(sequence.sequence_id)
+            self.cell_of[sequence.sequence_id] = cell
+        if self.window_ends.get(sequence.sequence_id) != sequence.window_end_ms:
+            self.window_ends[sequence.sequence_id] = sequence.window_end_ms
+            heapq.heappush(self.expiry, (sequence.window_end_ms, sequence.sequence_id))
+        self.cell_max[cell] = max(self.cell_max.get(cell, sequence.magnitude), sequence.magnitude)
+
+    def _update_cell_max(self, cell: Tuple[int, int]):
+        sequence_ids = self.grid.get(cell)
+        if sequence_ids:
+            self.cell_max[cell] = max(self.sequences[sequence_id].magnitude for sequence_id in sequence_ids)
+        else:
+            self.grid.pop(cell, None)
+            self.cell_max.pop(cell, None)
+
+    def _expire(self, now_ms: int):
+        """Drop sequences whose window closed before now_ms from the index."""
+        while self.expiry and self.expiry[0][0] < now_ms:
+            window_end, sequence_id = heapq.heappop(self.expiry)
+            sequence = self.sequences.get(sequence_id)
+            if sequence is None or sequence.window_end_ms != window_end:
+                continue
+            cell = self.cell_of.pop(sequence_id)
+            self.grid[cell].remove(sequence_id)
+            del self.sequences[sequence_id]
+            del self.window_ends[sequence_id]
+            self._update_cell_max(cell)
+
+    def _candidates(self, latitude: float, longitude: float, magnitude: float) -> Iterable[EarthquakeSequence]:
+        """Open sequences in cells whose largest window (or the event's own) can reach the event."""
+        if not self.cell_max:
+            return
+        radius_km = window_distance_km(max(magnitude, max(self.cell_max.values())))
+        lat_cell, lon_cell = self._cell(latitude, longitude)
+        lat_reach = int(math.ceil(radius_km / (CELL_DEGREES * KM_PER_DEGREE)))
+        cos_lat = max(math.cos(math.radians(min(89.0, abs(latitude) + lat_reach * CELL_DEGREES))), 1e-3)
+        lon_cells = int(round(360 / CELL_DEGREES))
+        lon_reach = min(lon_cells // 2, int(math.ceil(lat_reach / cos_lat)))
+        for dlat in range(-lat_reach, lat_reach + 1):
+            for dlon in range(-lon_reach, lon_reach + 1):
+                cell = (lat_cell + dlat, (lon_cell + dlon + lon_cells // 2) % lon_cells - lon_cells // 2)
+                cell_magnitude = self.cell_max.get(cell)
+                if cell_magnitude is None:
+                    continue
+                # Latitude rows between the cells give a lower bound on the distance
+                if (abs(dlat) - 1) * CELL_DEGREES * KM_PER_DEGREE > window_distance_km(max(magnitude, cell_magnitude)):
+                    continue
+                for sequence_id in self.grid[cell]:
+                    yield self.sequences[sequence_id]
+
+    def add(self, event: Dict[str, Any]) -> str:
+        """Assign an event to an open sequence, or start one; returns the sequence id."""
+        time_ms = event["time_ms"]
+        magnitude = event.get("magnitude")
+        magnitude = DEFAULT_MAGNITUDE if magnitude is None or magnitude != magnitude else magnitude
+        self._expire(time_ms)
+
+        best = None
+        for sequence in self._candidates(event["latitude"], event["longitude"], magnitude):
+            if time_ms >= sequence.mainshock_ms:
+                in_time = time_ms - sequence.mainshock_ms <= window_ms(sequence.magnitude)
+            else:
+                # Late-arriving earlier event: a foreshock if the mainshock is inside its window
+                in_time = sequence.mainshock_ms - time_ms <= window_ms(magnitude)
+            if not in_time:
+                continue
+            distance = haversine_km(event["latitude"], event["longitude"], sequence.latitude, sequence.longitude)
+            if distance > window_distance_km(max(magnitude, sequence.magnitude)):
+                continue
+            if best is None or (sequence.magnitude, -distance) > (best[0].magnitude, -best[1]):
+                best = (sequence, distance)
+
+        if best is None:
+            sequence = EarthquakeSequence(
+                sequence_id=f"seq-{event['event_id']}",
+                mainshock_event_id=event["event_id"],
+                latitude=event["latitude"],
+                longitude=event["longitude"],
+                magnitude=magnitude,
+                mainshock_ms=time_ms,
+                start_ms=time_ms,
+                end_ms=time_ms
+            )
+        else:
+            sequence = best[0]
+            sequence.event_count += 1
+            sequence.start_ms = min(sequence.start_ms, time_ms)
+            sequence.end_ms = max(sequence.end_ms, time_ms)
+            if magnitude > sequence.magnitude:
+                # A larger event becomes the mainshock and widens the window
+                sequence.mainshock_event_id = event["event_id"]
+                sequence.latitude, sequence.longitude = event["latitude"], event["longitude"]
+                sequence.magnitude, sequence.mainshock_ms = magnitude, time_ms
+        self._index(sequence)
+        self.changed[sequence.sequence_id] = sequence
+        return sequence.sequence_id
+
+def ensure_sequence_tables(conn: sqlite3.Connection):
+    """Add earthquake_events.sequence_id and the earthquake_sequences table; idempotent."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(earthquake_events)")}
+    if "sequence_id" not in columns:
+        conn.execute("ALTER TABLE earthquake_events ADD COLUMN sequence_id TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_earthquake_sequence ON earthquake_events (sequence_id)")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS earthquake_sequences (
+        sequence_id TEXT PRIMARY KEY,
+        mainshock_event_id TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        magnitude REAL NOT NULL,
+        mainshock_ms INTEGER NOT NULL,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        window_end_ms INTEGER NOT NULL,
+        event_count INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sequences_window_end ON earthquake_sequences (window_end_ms)")
+
+SEQUENCE_FIELDS = (
+    "sequence_id", "mainshock_event_id", "latitude", "longitude", "magnitude",
+    "mainshock_ms", "start_ms", "end_ms", "event_count",
+)
+
+def assign_sequences(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Cluster events without a sequence_id, resuming from the sequences still open in the database.
+
+    Needs the time_ms column (earthquake_queries.migrate_time_columns).
+    """
+    ensure_sequence_tables(conn)
+    pending = conn.execute(
+        "SELECT event_id, latitude, longitude, magnitude, time_ms FROM earthquake_events "
+        "WHERE sequence_id IS NULL AND time_ms IS NOT NULL ORDER BY time_ms"
+    ).fetchall()
+    if not pending:
+        return {"assigned": 0, "sequences": 0}
+
+    first_ms = pending[0][4]
+    last_ms = pending[-1][4]
+    largest = max((row[3] for row in pending if row[3] is not None), default=DEFAULT_MAGNITUDE)
+    open_sequences = [
+        EarthquakeSequence(*row) for row in conn.execute(
+            f"SELECT {', '.join(SEQUENCE_FIELDS)} FROM earthquake_sequences "
+            "WHERE window_end_ms >= ? AND mainshock_ms <= ?",
+            (first_ms, last_ms + window_ms(largest))
+        )
+    ]
+    clusterer = SequenceClusterer(open_sequences)
+    assignments = []
+    for event_id, latitude, longitude, magnitude, time_ms in pending:
+        sequence_id = clusterer.add({
+            "event_id": event_id, "latitude": latitude, "longitude": longitude,
+            "magnitude": magnitude, "time_ms": time_ms
+        })
+        assignments.append((sequence_id, event_id))
+
+    conn.executemany("UPDATE earthquake_events SET sequence_id = ? WHERE event_id = ?", assignments)
+    # Counts and spans come from the member rows, so re-clustering the same events never double counts
+    changed_ids = list(clusterer.changed)
+    for start in range(0, len(changed_ids), 500):
+        chunk = changed_ids[start:start + 500]
+        for sequence_id, event_count, start_ms, end_ms in conn.execute(
+            f"SELECT sequence_id, COUNT(*), MIN(time_ms), MAX(time_ms) FROM earthquake_events "
+            f"WHERE sequence_id IN ({', '.join('?' for _ in chunk)}) GROUP BY sequence_id",
+            chunk
+        ):
+            sequence = clusterer.changed[sequence_id]
+            sequence.event_count, sequence.start_ms, sequence.end_ms = event_count, start_ms, end_ms
+    conn.executemany(
+        f"INSERT OR REPLACE INTO earthquake_sequences ({', '.join(SEQUENCE_FIELDS)}, window_end_ms) "
+        f"VALUES ({', '.join('?' for _ in SEQUENCE_FIELDS)}, ?)",
+        [
+            tuple(getattr(sequence, name) for name in SEQUENCE_FIELDS) + (sequence.window_end_ms,)
+            for sequence in clusterer.changed.values()
+        ]
+    )
+    conn.commit()
+    return {"assigned": len(assignments), "sequences": len(clusterer.changed)}
+
+def sequence_ids_for(event_ids: Sequence[str], db_path: str = DEFAULT_DB_PATH) -> Dict[str, str]:
+    """event_id -> sequence_id for the given events (unclustered events are left out)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(earthquake_events)")}
+        if "sequence_id" not in columns:
+            return {}
+        unique_ids = list(dict.fromkeys(event_ids))
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique_ids), 500):
+            chunk = unique_ids[start:start + 500]
+            found.update(conn.execute(
+                f"SELECT event_id, sequence_id FROM earthquake_events "
+                f"WHERE sequence_id IS NOT NULL AND event_id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            ).fetchall())
+        return found
+    finally:
+        conn.close()
+
+def one_target_per_sequence(result: Dict[str, Any], sequence_of: Dict[str, str]) -> Dict[str, Any]:
+    """Collapse person x event targets to one per person and sequence, keeping the event that ranks first
+    in the RANK_SORT order (risk level, then risk score or distance)."""
+    best: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+    best_rank: Dict[Tuple[Any, str], Tuple[int, float]] = {}
+    hits: Dict[Tuple[Any, str], int] = {}
+    event_targets = nested_targets(result)
+    scored = any(target.get("risk_score") is not None for target in event_targets)
+    for target in event_targets:
+        person, earthquake = target["person"], target["earthquake"]
+        event_id = earthquake.get("event_id")
+        sequence_id = earthquake.get("sequence_id") or sequence_of.get(event_id) or f"seq-{event_id}"
+        key = (person.get("person_id") or person.get("email") or person.get("id"), sequence_id)
+        hits[key] = hits.get(key, 0) + 1
+        rank = rank_key(target, scored)
+        if key not in best or rank < best_rank[key]:
+            best[key] = {**target, "sequence_id": sequence_id}
+            best_rank[key] = rank
+
+    targets = []
+    for key, target in best.items():
+        target["sequence_event_count"] = hits[key]
+        targets.append(target)
+    summary = {
+        **result.get("summary", {}),
+        "total_targets": len(targets),
+        "high_risk_targets": sum(t.get("risk_level") == "high" for t in targets),
+        "medium_risk_targets": sum(t.get("risk_level") == "medium" for t in targets),
+        "low_risk_targets": sum(t.get("risk_level") == "low" for t in targets),
+        "sequences": len({sequence_id for _, sequence_id in best}),
+        "per_sequence": True,
+        "event_targets": len(event_targets),
+    }
+    return {"targets": targets, "summary": summary}
@@ -0,0 +1,209 @@
+"""
+Server-side aggregates for dashboard charts.
+Instead of shipping every raw event to the UI, the server computes magnitude
+histogram bins, daily counts and grid-clustered map points, so chart payloads
+stay a constant size however large the catalog grows.
+"""
+
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Grid cells per 256px map tile when clustering map points
+CELLS_PER_TILE = 4
+
+# From this zoom level on, maps show individual points instead of clusters
+DETAIL_ZOOM = 10
+
+# Upper bound on markers in one map payload
+MAX_MAP_MARKERS = 2000
+
+def magnitude_bins(magnitudes: Sequence[float], bin_width: float = 0.25) -> List[Dict[str, Any]]:
+    """Histogram of magnitudes in fixed-width bins."""
+    values = np.asarray([m for m in magnitudes if m is not None], dtype=float)
+    if values.size == 0:
+        return []
+    bins = np.floor(values / bin_width).astype(np.int64)
+    starts, counts = np.unique(bins, return_counts=True)
+    return [
+        {"bin_start": round(start * bin_width, 3), "bin_end": round((start + 1) * bin_width, 3), "count": int(count)}
+        for start, count in zip(starts.tolist(), counts.tolist())
+    ]
+
+def daily_counts(times: Sequence[str]) -> List[Dict[str, Any]]:
+    """Events per UTC day; ISO timestamps are bucketed by their date prefix without parsing."""
+    counts = Counter(t[:10] for t in times if t)
+    return [{"date": day, "count": counts[day]} for day in sorted(counts)]
+
+def grid_cell_degrees(zoom: int) -> float:
+    """Grid cell size in degrees for a web-map zoom level."""
+    return 360.0 / ((2 ** max(0, int(zoom))) * CELLS_PER_TILE)
+
+def _in_bbox(lat: np.ndarray, lon: np.ndarray, bbox: Optional[Sequence[float]]) -> np.ndarray:
+    """Mask of points inside (south, west, north, east); west > east wraps the antimeridian."""
+    if bbox is None:
+        return np.ones(len(lat), dtype=bool)
+    south, west, north, east = bbox
+    in_lat = (lat >= south) & (lat <= north)
+    if west <= east:
+        return in_lat & (lon >= west) & (lon <= east)
+    return in_lat & ((lon >= west) | (lon <= east))
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    """Interleave zero bits between the low 32 bits of each value (for Z-order keys)."""
+    v = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+class ClusterLevel:
+    """Grid clusters at one zoom level, as parallel arrays over contiguous runs of Z-sorted points."""
+
+    def __init__(self, keys: np.ndarray, lat: np.ndarray, lon: np.ndarray, magnitude: np.ndarray, order: np.ndarray):
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        self.count = np.diff(np.r_[starts, len(keys)])
+        self.latitude = np.add.reduceat(lat, starts) / self.count
+        self.longitude = np.add.reduceat(lon, starts) / self.count
+        self.max_magnitude = np.maximum.reduceat(magnitude, starts)
+
+        # Representative (first strongest) point per cell for hover text
+        strongest = np.flatnonzero(magnitude == np.repeat(self.max_magnitude, self.count))
+        self.representative = order[strongest[np.searchsorted(strongest, starts)]]
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+class ClusterIndex:
+    """Clustered map markers for every zoom level, built once per data generation."""
+
+    def __init__(
+        self,
+        latitude: Sequence[float],
+        longitude: Sequence[float],
+        magnitude: Sequence[float],
+        labels: Sequence[Any],
+        detail_zoom: int = DETAIL_ZOOM,
+    ):
+        self.lat = np.asarray(latitude, dtype=float)
+        self.lon = np.asarray(longitude, dtype=float)
+        self.magnitude = np.nan_to_num(np.asarray(magnitude, dtype=float), nan=0.0)
+        self.labels = list(labels)
+        self.detail_zoom = detail_zoom
+        self.levels: List[ClusterLevel] = []
+        if len(self.lat) and detail_zoom > 0:
+            self._build_levels()
+
+    def _build_levels(self):
+        """Sort points once by Z-order cell at the finest level; every coarser cell is then a
+        contiguous run of that order, so each level is a single reduceat pass."""
+        finest = self.detail_zoom - 1
+        cell = grid_cell_degrees(finest)
+        rows = np.clip(np.floor((self.lat + 90.0) / cell), 0, None).astype(np.uint64)
+        cols = np.clip(np.floor((self.lon + 180.0) / cell), 0, None).astype(np.uint64)
+        z_keys = _spread_bits(rows) << np.uint64(1) | _spread_bits(cols)
+        order = np.argsort(z_keys, kind="stable")
+        z_keys = z_keys[order]
+        lat, lon, magnitude = self.lat[order], self.lon[order], self.magnitude[order]
+        for zoom in range(self.detail_zoom):
+            # Each zoom level out halves the cell size in both axes: drop two Z-order bits
+            keys = z_keys >> np.uint64(2 * (finest - zoom))
+            self.levels.append(ClusterLevel(keys, lat, lon, magnitude, order))
+
+    @classmethod
+    def from_events(cls, events: Sequence[Dict[str, Any]], detail_zoom: int = DETAIL_ZOOM) -> "ClusterIndex":
+        return cls(
+            [e["latitude"] for e in events],
+            [e["longitude"] for e in events],
+            [e.get("magnitude") or 0.0 for e in events],
+            [e.get("place") for e in events],
+            detail_zoom=detail_zoom,
+        )
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def _points(self, mask: np.ndarray) -> List[Dict[str, Any]]:
+        return [
+            {
+                "latitude": float(self.lat[i]),
+                "longitude": float(self.lon[i]),
+                "count": 1,
+                "max_magnitude": float(self.magnitude[i]),
+                "place": self.labels[i],
+            }
+            for i in np.flatnonzero(mask).tolist()
+        ]
+
+    def _clusters(self, zoom: int, mask: np.ndarray) -> List[Dict[str, Any]]:
+        level = self.levels[zoom]
+        return [
+            {
+                "latitude": round(float(level.latitude[i]), 5),
+                "longitude": round(float(level.longitude[i]), 5),
+                "count": int(level.count[i]),
+                "max_magnitude": float(level.max_magnitude[i]),
+                "place": self.labels[int(level.representative[i])],
+            }
+            for i in np.flatnonzero(mask).tolist()
+        ]
+
+    def markers(
+        self,
+        zoom: int,
+        bbox: Optional[Sequence[float]] = None,
+        max_markers: int = MAX_MAP_MARKERS,
+    ) -> Dict[str, Any]:
+        """Markers for a map view: individual points when zoomed in, else the finest
+        cluster level at or below `zoom` that fits in max_markers."""
+        result = {"zoom": int(zoom), "total": 0, "clustered": False, "truncated": False, "markers": []}
+        if not len(self):
+            return result
+
+        if zoom >= self.detail_zoom:
+            mask = _in_bbox(self.lat, self.lon, bbox)
+            result["total"] = int(mask.sum())
+            if result["total"] <= max_markers:
+                result["markers"] = self._points(mask)
+                return result
+            zoom = self.detail_zoom - 1
+
+        for level_zoom in range(min(int(zoom), self.detail_zoom - 1), -1, -1):
+            level = self.levels[level_zoom]
+            mask = _in_bbox(level.latitude, level.longitude, bbox)
+            if mask.sum() <= max_markers or level_zoom == 0:
+                break
+
+        if mask.sum() > max_markers:
+            # Even the coarsest level is too big: keep the largest clusters
+            keep = np.flatnonzero(mask)
+            keep = keep[np.argsort(-level.count[keep], kind="stable")[:max_markers]]
+            mask = np.zeros(len(level), dtype=bool)
+            mask[keep] = True
+            result["truncated"] = True
+
+        result.update({
+            "zoom": level_zoom,
+            "total": int(level.count[_in_bbox(level.latitude, level.longitude, bbox)].sum()),
+            "clustered": True,
+            "markers": self._clusters(level_zoom, mask),
+        })
+        return result
+
+def cluster_points(events: Sequence[Dict[str, Any]], zoom: int) -> List[Dict[str, Any]]:
+    """Aggregate events into one marker per grid cell at the given zoom level."""
+    if not events:
+        return []
+    index = ClusterIndex.from_events(events, detail_zoom=int(zoom) + 1)
+    return index._clusters(int(zoom), np.ones(len(index.levels[int(zoom)]), dtype=bool))
+
+def dashboard_aggregate(events: Sequence[Dict[str, Any]], kind: str, zoom: int = 5) -> List[Dict[str, Any]]:
+    """Dispatch one aggregate kind over a list of events."""
+    if kind == "magnitude_bins":
+        return magnitude_bins([e.get("magnitude") for e in events])
+    if kind == "daily_counts":
+        return daily_counts([e.get("time") for e in events])
+    if kind == "map_clusters":
+        return cluster_points(events, zoom)
+    raise ValueError(f"Unknown aggregate: {kind}")
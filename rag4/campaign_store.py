@@ -0,0 +1,172 @@
+"""
+Persistent campaign history store.
+Saved emails live in SQLite with indexes on timestamp, target and risk level
+plus an FTS5 index over subject, body and target. Listings are paginated and
+never include bodies; a body is loaded only when a campaign is opened.
+Per-campaign generation telemetry is kept alongside, merged in as sessions
+and batch jobs finish calls.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from telemetry import CampaignTelemetry
+
+class CampaignStore:
+    """SQLite-backed campaign history."""
+
+    def __init__(self, db_path: str = "db/campaign_history.db"):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS campaign_history (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                campaign TEXT,
+                target TEXT NOT NULL,
+                target_email TEXT,
+                risk_level TEXT,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL
+            )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON campaign_history (created_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_target ON campaign_history (target)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_history_risk_created ON campaign_history (risk_level, created_at)")
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS campaign_telemetry (
+                campaign TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL,
+                state TEXT NOT NULL
+            )
+            ''')
+            self.has_fts = self._create_fts()
+            self.conn.commit()
+
+    def _create_fts(self) -> bool:
+        """Create the full-text index and its sync triggers; False if FTS5 is unavailable."""
+        try:
+            self.conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS campaign_history_fts USING fts5(
+                subject, body, target, content='campaign_history', content_rowid='id'
+            )
+            ''')
+        except sqlite3.OperationalError:
+            return False
+        self.conn.executescript('''
+        CREATE TRIGGER IF NOT EXISTS campaign_history_ai AFTER INSERT ON campaign_history BEGIN
+            INSERT INTO campaign_history_fts (rowid, subject, body, target) VALUES (new.id, new.subject, new.body, new.target);
+        END;
+        CREATE TRIGGER IF NOT EXISTS campaign_history_ad AFTER DELETE ON campaign_history BEGIN
+            INSERT INTO campaign_history_fts (campaign_history_fts, rowid, subject, body, target) VALUES ('delete', old.id, old.subject, old.body, old.target);
+        END;
+        ''')
+        return True
+
+    def add(self, entry: Dict[str, Any]) -> int:
+        """Save one campaign ({"target", "subject", "body", "risk_level", ...}); returns its id."""
+        return self.add_many([entry])[0]
+
+    def add_many(self, entries: Iterable[Dict[str, Any]]) -> List[int]:
+        ids = []
+        with self.lock:
+            for entry in entries:
+                cursor = self.conn.execute('''
+                INSERT INTO campaign_history (created_at, campaign, target, target_email, risk_level, subject, body)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    entry.get("created_at", time.time()),
+                    entry.get("campaign"),
+                    entry["target"],
+                    entry.get("target_email"),
+                    entry.get("risk_level"),
+                    entry["subject"],
+                    entry["body"],
+                ))
+                ids.append(cursor.lastrowid)
+            self.conn.commit()
+        return ids
+
+    @staticmethod
+    def _fts_query(search: str) -> str:
+        # Quote each term so user input can't break FTS query syntax; prefix-match the last one
+        terms = [term.replace('"', '""') for term in search.split()]
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def list_page(
+        self,
+        offset: int = 0,
+        limit: int = 25,
+        search: Optional[str] = None,
+        risk_level: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Newest-first page of campaigns without bodies, plus the total matching count."""
+        conditions = []
+        params: List[Any] = []
+        if risk_level:
+            conditions.append("h.risk_level = ?")
+            params.append(risk_level)
+        if search and search.strip():
+            if self.has_fts:
+                conditions.append("h.id IN (SELECT rowid FROM campaign_history_fts WHERE campaign_history_fts MATCH ?)")
+                params.append(self._fts_query(search))
+            else:
+                conditions.append("(h.subject LIKE ? OR h.body LIKE ? OR h.target LIKE ?)")
+                params.extend([f"%{search.strip()}%"] * 3)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM campaign_history h {where}", params).fetchone()[0]
+            rows = self.conn.execute(f'''
+            SELECT h.id, h.created_at, h.campaign, h.target, h.target_email, h.risk_level, h.subject
+            FROM campaign_history h {where}
+            ORDER BY h.created_at DESC, h.id DESC
+            LIMIT ? OFFSET ?
+            ''', (*params, limit, offset)).fetchall()
+        return {"total": total, "offset": offset, "limit": limit, "rows": [dict(row) for row in rows]}
+
+    def get_body(self, campaign_id: int) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT body FROM campaign_history WHERE id = ?", (campaign_id,)).fetchone()
+        return row["body"] if row else None
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM campaign_history").fetchone()[0]
+
+    def clear(self) -> int:
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM campaign_history")
+            self.conn.commit()
+            return cursor.rowcount
+
+    def add_telemetry(self, telemetry: Dict[str, CampaignTelemetry]):
+        """Merge newly collected per-campaign telemetry into the stored totals and recent records."""
+        with self.lock:
+            for campaign, collected in telemetry.items():
+                row = self.conn.execute("SELECT state FROM campaign_telemetry WHERE campaign = ?", (campaign,)).fetchone()
+                stored = CampaignTelemetry.from_state(campaign, json.loads(row["state"])) if row else CampaignTelemetry(campaign)
+                stored.merge(collected)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO campaign_telemetry (campaign, updated_at, state) VALUES (?, ?, ?)",
+                    (campaign, time.time(), json.dumps(stored.to_state()))
+                )
+            self.conn.commit()
+
+    def load_telemetry(self) -> Dict[str, CampaignTelemetry]:
+        """Stored telemetry for every campaign, most recently updated first."""
+        with self.lock:
+            rows = self.conn.execute("SELECT campaign, state FROM campaign_telemetry ORDER BY updated_at DESC").fetchall()
+        return {row["campaign"]: CampaignTelemetry.from_state(row["campaign"], json.loads(row["state"])) for row in rows}
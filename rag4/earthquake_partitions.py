@@ -0,0 +1,480 @@
+"""
+Month-partitioned earthquake storage with retention and compaction.
+Events are written to one SQLite file per UTC month; time-window queries are
+routed to just the partitions the window touches, so recent-window reads cost
+the same however long the catalog gets. Partitions older than the retention
+window are compacted into a columnar archive (Parquet with pyarrow, else
+compressed .npz) and remain queryable. Late writes to an archived month go to
+a live file that reads merge over the archive until the next compaction
+folds it in. Compaction also prunes the archived months from the source
+earthquake_events table, so the main table only holds the retention window.
+
+    python earthquake_partitions.py import --source db/earthquake_rag.db
+    python earthquake_partitions.py compact --retain-months 12
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from earthquake_queries import DAY_MS, iso_to_epoch_ms, now_ms
+
+DEFAULT_PARTITION_DIR = os.path.join("db", "earthquake_partitions")
+
+# Columns of a partition, in earthquake_events order, including the parsed place and sequence
+EVENT_COLUMNS = (
+    "id", "time", "latitude", "longitude", "depth", "magnitude", "mag_type", "place",
+    "network", "event_id", "updated", "status", "time_ms", "updated_ms",
+    "place_offset_km", "place_bearing", "place_locality", "place_region", "sequence_id",
+)
+NUMERIC_COLUMNS = {"id", "latitude", "longitude", "depth", "magnitude", "time_ms", "updated_ms", "place_offset_km"}
+
+# Columns added after the first partition layout; older files get them on open
+ADDED_COLUMNS = {
+    "place_offset_km": "REAL", "place_bearing": "TEXT", "place_locality": "TEXT",
+    "place_region": "TEXT", "sequence_id": "TEXT",
+}
+
+Month = Tuple[int, int]
+
+def month_of(epoch_ms: int) -> Month:
+    moment = datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc)
+    return moment.year, moment.month
+
+def month_start_ms(month: Month) -> int:
+    year, mon = month
+    return int(datetime(year, mon, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+def next_month(month: Month) -> Month:
+    year, mon = month
+    return (year + 1, 1) if mon == 12 else (year, mon + 1)
+
+def previous_month(month: Month) -> Month:
+    year, mon = month
+    return (year - 1, 12) if mon == 1 else (year, mon - 1)
+
+def month_name(month: Month) -> str:
+    return f"{month[0]:04d}-{month[1]:02d}"
+
+def parse_month(name: str) -> Month:
+    year, mon = name.split("-")
+    return int(year), int(mon)
+
+def _archive_to_events(columns: Dict[str, np.ndarray], mask: np.ndarray) -> List[Dict[str, Any]]:
+    indices = np.flatnonzero(mask)
+    # Newest first, like the SQLite partitions
+    indices = indices[np.argsort(-columns["time_ms"][indices], kind="stable")]
+    events = []
+    for i in indices.tolist():
+        event = {}
+        for name in EVENT_COLUMNS:
+            value = columns[name][i]
+            if name in NUMERIC_COLUMNS:
+                value = None if value != value else (int(value) if name in ("id", "time_ms", "updated_ms") else float(value))
+            else:
+                value = str(value) if value != "" else None
+            event[name] = value
+        events.append(event)
+    return events
+
+def _events_to_columns(events: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    columns: Dict[str, np.ndarray] = {}
+    for name in EVENT_COLUMNS:
+        values = [event.get(name) for event in events]
+        if name in NUMERIC_COLUMNS:
+            columns[name] = np.array([np.nan if v is None else v for v in values], dtype=float)
+        else:
+            columns[name] = np.array(["" if v is None else str(v) for v in values], dtype=str)
+    return columns
+
+@lru_cache(maxsize=4)
+def _load_archive(path: str, mtime_ns: int) -> Dict[str, np.ndarray]:
+    """Columns of an archived partition; cached per file version. Columns older archives lack read as empty."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        stored = {
+            name: table.column(name).to_numpy(zero_copy_only=False).astype(float if name in NUMERIC_COLUMNS else str)
+            for name in EVENT_COLUMNS if name in table.column_names
+        }
+    else:
+        with np.load(path, allow_pickle=False) as archive:
+            stored = {name: archive[name] for name in EVENT_COLUMNS if name in archive.files}
+    size = len(stored["event_id"])
+    for name in EVENT_COLUMNS:
+        if name not in stored:
+            stored[name] = np.full(size, np.nan) if name in NUMERIC_COLUMNS else np.full(size, "", dtype=str)
+    return stored
+
+class EarthquakePartitions:
+    """Routing layer over monthly partition files and their columnar archives."""
+
+    def __init__(self, partition_dir: str = DEFAULT_PARTITION_DIR):
+        self.partition_dir = partition_dir
+        self.archive_dir = os.path.join(partition_dir, "archive")
+        self.write_lock = threading.Lock()
+
+    def partition_path(self, month: Month) -> str:
+        return os.path.join(self.partition_dir, f"{month_name(month)}.db")
+
+    def _archive_path(self, month: Month) -> Optional[str]:
+        for extension in (".parquet", ".npz"):
+            path = os.path.join(self.archive_dir, month_name(month) + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _months_in(self, directory: str, extensions: Tuple[str, ...]) -> List[Month]:
+        if not os.path.isdir(directory):
+            return []
+        months = []
+        for filename in os.listdir(directory):
+            stem, extension = os.path.splitext(filename)
+            if extension in extensions:
+                months.append(parse_month(stem))
+        return months
+
+    def live_months(self) -> List[Month]:
+        return sorted(self._months_in(self.partition_dir, (".db",)))
+
+    def archived_months(self) -> List[Month]:
+        return sorted(self._months_in(self.archive_dir, (".parquet", ".npz")))
+
+    def available(self) -> bool:
+        return bool(self.live_months() or self.archived_months())
+
+    def _connect(self, month: Month) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.partition_path(month))
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _create_partition(self, month: Month) -> sqlite3.Connection:
+        os.makedirs(self.partition_dir, exist_ok=True)
+        conn = self._connect(month)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS earthquake_events (
+            id INTEGER,
+            time TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            depth REAL,
+            magnitude REAL NOT NULL,
+            mag_type TEXT,
+            place TEXT,
+            network TEXT,
+            event_id TEXT PRIMARY KEY,
+            updated TEXT,
+            status TEXT,
+            time_ms INTEGER NOT NULL,
+            updated_ms INTEGER,
+            place_offset_km REAL,
+            place_bearing TEXT,
+            place_locality TEXT,
+            place_region TEXT,
+            sequence_id TEXT
+        )
+        ''')
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(earthquake_events)")}
+        for name, column_type in ADDED_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE earthquake_events ADD COLUMN {name} {column_type}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_partition_time_ms ON earthquake_events (time_ms)")
+        return conn
+
+    def insert_many(self, events: Iterable[Dict[str, Any]], revisions: bool = True) -> int:
+        """Write events into their month partitions (insert or replace by event_id).
+        Pass revisions=False for bulk loads of unique events to skip cross-month cleanup."""
+        by_month: Dict[Month, List[Tuple]] = {}
+        for event in events:
+            event = dict(event)
+            if event.get("time_ms") is None:
+                event["time_ms"] = iso_to_epoch_ms(event["time"])
+            if event.get("updated_ms") is None:
+                event["updated_ms"] = iso_to_epoch_ms(event.get("updated"))
+            by_month.setdefault(month_of(event["time_ms"]), []).append(tuple(event.get(name) for name in EVENT_COLUMNS))
+
+        placeholders = ", ".join("?" for _ in EVENT_COLUMNS)
+        written = 0
+        with self.write_lock:
+            for month, rows in by_month.items():
+                conn = self._create_partition(month)
+                try:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO earthquake_events ({', '.join(EVENT_COLUMNS)}) VALUES ({placeholders})",
+                        rows
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+                written += len(rows)
+                if revisions:
+                    self._remove_from_neighbours(month, [row[EVENT_COLUMNS.index("event_id")] for row in rows])
+        return written
+
+    def delete_many(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Delete events (event_id and time_ms) from their month partition and its neighbours,
+        rewriting the month's archive when it holds any of them."""
+        by_month: Dict[Month, List[str]] = {}
+        for event in events:
+            by_month.setdefault(month_of(event["time_ms"]), []).append(event["event_id"])
+
+        deleted = 0
+        with self.write_lock:
+            for month, event_ids in by_month.items():
+                if os.path.exists(self.partition_path(month)):
+                    conn = self._connect(month)
+                    try:
+                        deleted += conn.executemany(
+                            "DELETE FROM earthquake_events WHERE event_id = ?", [(event_id,) for event_id in event_ids]
+                        ).rowcount
+                        conn.commit()
+                    finally:
+                        conn.close()
+                deleted += self._delete_archived(month, event_ids)
+                self._remove_from_neighbours(month, event_ids)
+        return deleted
+
+    def _delete_archived(self, month: Month, event_ids: List[str]) -> int:
+        """Drop events from a month's archive by rewriting it; returns how many were dropped."""
+        path = self._archive_path(month)
+        if path is None:
+            return 0
+        columns = _load_archive(path, os.stat(path).st_mtime_ns)
+        drop = np.isin(columns["event_id"], list(event_ids))
+        if not drop.any():
+            return 0
+        self._write_archive(month, _archive_to_events(columns, ~drop))
+        return int(drop.sum())
+
+    def _remove_from_neighbours(self, month: Month, event_ids: List[str]):
+        """A revised origin time can cross a month boundary; drop the stale copy next door."""
+        for neighbour in (previous_month(month), next_month(month)):
+            self._delete_archived(neighbour, event_ids)
+            if not os.path.exists(self.partition_path(neighbour)):
+                continue
+            conn = self._connect(neighbour)
+            try:
+                conn.executemany("DELETE FROM earthquake_events WHERE event_id = ?", [(event_id,) for event_id in event_ids])
+                conn.commit()
+            finally:
+                conn.close()
+
+    def import_from(self, source_db: str, batch_size: int = 50_000) -> int:
+        """Partition every row of an earthquake_events table (time_ms columns are added if missing)."""
+        from earthquake_queries import migrate_time_columns
+
+        source = sqlite3.connect(source_db)
+        source.row_factory = sqlite3.Row
+        try:
+            migrate_time_columns(source)
+            present = {row[1] for row in source.execute("PRAGMA table_info(earthquake_events)")}
+            columns = [name for name in EVENT_COLUMNS if name in present]
+            cursor = source.execute(f"SELECT {', '.join(columns)} FROM earthquake_events")
+            imported = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return imported
+                imported += self.insert_many((dict(row) for row in rows), revisions=False)
+        finally:
+            source.close()
+
+    def _months_between(self, start_ms: int, end_ms: int) -> List[Month]:
+        """Existing (live or archived) months overlapping [start_ms, end_ms), newest first."""
+        months = set(self.live_months()) | set(self.archived_months())
+        return sorted(
+            (m for m in months if month_start_ms(m) < end_ms and month_start_ms(next_month(m)) > start_ms),
+            reverse=True
+        )
+
+    def between(
+        self,
+        start_ms: int,
+        end_ms: Optional[int] = None,
+        min_magnitude: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Events with start_ms <= time_ms < end_ms, newest first, reading only the touched partitions."""
+        end_ms = end_ms if end_ms is not None else now_ms() + DAY_MS
+        events: List[Dict[str, Any]] = []
+        for month in self._months_between(start_ms, end_ms):
+            remaining = None if limit is None else limit - len(events)
+            if remaining is not None and remaining <= 0:
+                break
+            events.extend(self._read_month(month, start_ms, end_ms, min_magnitude, remaining))
+        return events
+
+    def _live_ids(self, month: Month) -> set:
+        conn = self._connect(month)
+        try:
+            return {row[0] for row in conn.execute("SELECT event_id FROM earthquake_events")}
+        finally:
+            conn.close()
+
+    def _read_month(self, month: Month, start_ms: int, end_ms: int, min_magnitude: Optional[float],
+                    limit: Optional[int]) -> List[Dict[str, Any]]:
+        """A month's events in the window, newest first; a live file's rows supersede the archive's."""
+        live_exists = os.path.exists(self.partition_path(month))
+        path = self._archive_path(month)
+        events: List[Dict[str, Any]] = []
+        if live_exists:
+            sql = "SELECT * FROM earthquake_events WHERE time_ms >= ? AND time_ms < ?"
+            params: List[Any] = [start_ms, end_ms]
+            if min_magnitude is not None:
+                sql += " AND magnitude >= ?"
+                params.append(min_magnitude)
+            sql += " ORDER BY time_ms DESC"
+            if limit is not None and path is None:
+                sql += " LIMIT ?"
+                params.append(limit)
+            conn = self._connect(month)
+            try:
+                events = [dict(row) for row in conn.execute(sql, params)]
+            finally:
+                conn.close()
+        if path is None:
+            return events
+
+        columns = _load_archive(path, os.stat(path).st_mtime_ns)
+        mask = (columns["time_ms"] >= start_ms) & (columns["time_ms"] < end_ms)
+        if min_magnitude is not None:
+            mask &= columns["magnitude"] >= min_magnitude
+        if live_exists:
+            # Late writes to an archived month: the live copy of an event wins, even outside the window
+            mask &= ~np.isin(columns["event_id"], list(self._live_ids(month)))
+            events = sorted(events + _archive_to_events(columns, mask), key=lambda event: -event["time_ms"])
+        else:
+            events = _archive_to_events(columns, mask)
+        return events if limit is None else events[:limit]
+
+    def recent(self, days: float = 7, min_magnitude: Optional[float] = 3.0, now: Optional[int] = None,
+               limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Events from the last `days` days, newest first."""
+        now = now or now_ms()
+        return self.between(now - int(days * DAY_MS), now + DAY_MS, min_magnitude=min_magnitude, limit=limit)
+
+    def count_since(self, days: float = 7, now: Optional[int] = None) -> int:
+        now = now or now_ms()
+        start_ms = now - int(days * DAY_MS)
+        total = 0
+        for month in self._months_between(start_ms, now + DAY_MS):
+            if os.path.exists(self.partition_path(month)) and self._archive_path(month) is not None:
+                total += len(self._read_month(month, start_ms, now + DAY_MS, None, None))
+            elif os.path.exists(self.partition_path(month)):
+                conn = self._connect(month)
+                try:
+                    total += conn.execute("SELECT COUNT(*) FROM earthquake_events WHERE time_ms >= ?", (start_ms,)).fetchone()[0]
+                finally:
+                    conn.close()
+            else:
+                path = self._archive_path(month)
+                total += int((_load_archive(path, os.stat(path).st_mtime_ns)["time_ms"] >= start_ms).sum())
+        return total
+
+    def compact(self, retain_months: int = 12, now: Optional[int] = None, source_db: Optional[str] = None) -> List[str]:
+        """Archive partitions that end before the retention window; returns the archived month names.
+
+        With source_db, events before the window are also deleted from its earthquake_events
+        (and earthquake_duplicates), so the main table stops growing; the archive keeps them.
+        """
+        cutoff = month_of(now or now_ms())
+        for _ in range(retain_months):
+            cutoff = previous_month(cutoff)
+
+        archived = []
+        with self.write_lock:
+            for month in self.live_months():
+                if month >= cutoff:
+                    continue
+                self._archive_month(month)
+                os.remove(self.partition_path(month))
+                archived.append(month_name(month))
+        if source_db is not None:
+            self.prune_source(source_db, month_start_ms(cutoff))
+        return archived
+
+    def prune_source(self, source_db: str, before_ms: int) -> int:
+        """Delete events older than before_ms from the source tables; returns events deleted."""
+        conn = sqlite3.connect(source_db)
+        try:
+            deleted = conn.execute("DELETE FROM earthquake_events WHERE time_ms < ?", (before_ms,)).rowcount
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'earthquake_duplicates'").fetchone():
+                conn.execute("DELETE FROM earthquake_duplicates WHERE time_ms < ?", (before_ms,))
+            conn.commit()
+        finally:
+            conn.close()
+        return deleted
+
+    def _archive_month(self, month: Month) -> str:
+        """Write the month's live rows into its archive, merged over what the archive already holds."""
+        conn = self._connect(month)
+        try:
+            events = [dict(row) for row in conn.execute("SELECT * FROM earthquake_events")]
+        finally:
+            conn.close()
+        path = self._archive_path(month)
+        if path is not None:
+            columns = _load_archive(path, os.stat(path).st_mtime_ns)
+            keep = ~np.isin(columns["event_id"], [event["event_id"] for event in events])
+            events += _archive_to_events(columns, keep)
+        return self._write_archive(month, events)
+
+    def _write_archive(self, month: Month, events: List[Dict[str, Any]]) -> str:
+        """Replace a month's archive with the given events, oldest first."""
+        columns = _events_to_columns(sorted(events, key=lambda event: event["time_ms"]))
+        os.makedirs(self.archive_dir, exist_ok=True)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            path = os.path.join(self.archive_dir, month_name(month) + ".npz")
+            # Write then rename, so readers never see a half-written archive
+            with open(path + ".tmp", "wb") as f:
+                np.savez_compressed(f, **columns)
+            os.replace(path + ".tmp", path)
+            return path
+        path = os.path.join(self.archive_dir, month_name(month) + ".parquet")
+        pq.write_table(pa.table(columns), path + ".tmp", compression="zstd")
+        os.replace(path + ".tmp", path)
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        live = self.live_months()
+        archived = self.archived_months()
+        return {
+            "live_partitions": [month_name(m) for m in live],
+            "archived_partitions": [month_name(m) for m in archived],
+            "live_bytes": sum(os.path.getsize(self.partition_path(m)) for m in live),
+            "archive_bytes": sum(os.path.getsize(self._archive_path(m)) for m in archived),
+        }
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Manage month-partitioned earthquake storage")
+    parser.add_argument("--partition-dir", default=DEFAULT_PARTITION_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Partition an existing earthquake_events table")
+    import_parser.add_argument("--source", default=os.path.join("db", "earthquake_rag.db"))
+    compact_parser = subparsers.add_parser("compact", help="Archive partitions older than the retention window")
+    compact_parser.add_argument("--retain-months", type=int, default=12)
+    compact_parser.add_argument("--source", default=os.path.join("db", "earthquake_rag.db"),
+                                help="Database whose earthquake_events are pruned to the retention window")
+    compact_parser.add_argument("--keep-source", action="store_true", help="Archive only; don't prune the source table")
+    subparsers.add_parser("stats", help="Show partitions and archive sizes")
+    args = parser.parse_args()
+
+    partitions = EarthquakePartitions(args.partition_dir)
+    if args.command == "import":
+        print(f"Imported {partitions.import_from(args.source)} events")
+    elif args.command == "compact":
+        source_db = None if args.keep_source else args.source
+        print(f"Archived: {', '.join(partitions.compact(args.retain_months, source_db=source_db)) or 'nothing'}")
+    print(json.dumps(partitions.stats(), indent=2))
@@ -0,0 +1,176 @@
+"""
+Time-window queries over earthquake_events using epoch-millisecond columns.
+`time` and `updated` are stored as ISO text; `time_ms` and `updated_ms` mirror
+them as indexed integers so "last N days" filters are index range scans
+instead of per-row string comparison or date parsing.
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+DEFAULT_DB_PATH = os.path.join("db", "earthquake_rag.db")
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# (ISO text column, epoch-ms column)
+TIME_COLUMNS = (("time", "time_ms"), ("updated", "updated_ms"))
+
+def iso_to_epoch_ms(value: Optional[str]) -> Optional[int]:
+    """Epoch milliseconds for an ISO 8601 timestamp; naive timestamps are taken as UTC."""
+    if value is None or value != value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(round(parsed.timestamp() * 1000))
+
+def epoch_ms_to_iso(value: Optional[int]) -> Optional[str]:
+    """ISO 8601 UTC timestamp with milliseconds, as in the USGS feed."""
+    if value is None or value != value:
+        return None
+    moment = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+def _sql_epoch_ms(column: str) -> str:
+    """SQL expression converting an ISO text column to epoch milliseconds."""
+    return f"CAST(ROUND((julianday({column}) - 2440587.5) * {DAY_MS}) AS INTEGER)"
+
+def migrate_time_columns(conn: sqlite3.Connection) -> int:
+    """Add, backfill and index the epoch-ms columns; idempotent. Returns rows backfilled."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(earthquake_events)")}
+    for _, ms_column in TIME_COLUMNS:
+        if ms_column not in existing:
+            conn.execute(f"ALTER TABLE earthquake_events ADD COLUMN {ms_column} INTEGER")
+
+    backfilled = 0
+    for text_column, ms_column in TIME_COLUMNS:
+        cursor = conn.execute(
+            f"UPDATE earthquake_events SET {ms_column} = {_sql_epoch_ms(text_column)} "
+            f"WHERE {ms_column} IS NULL AND {text_column} IS NOT NULL"
+        )
+        backfilled = max(backfilled, cursor.rowcount)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_earthquake_time_ms ON earthquake_events (time_ms)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_earthquake_updated_ms ON earthquake_events (updated_ms)")
+
+    # Writers that only set the ISO columns still get the integer columns filled
+    conn.executescript(f'''
+    CREATE TRIGGER IF NOT EXISTS earthquake_events_time_ms_insert AFTER INSERT ON earthquake_events
+    WHEN new.time_ms IS NULL OR (new.updated_ms IS NULL AND new.updated IS NOT NULL) BEGIN
+        UPDATE earthquake_events
+        SET time_ms = coalesce(new.time_ms, {_sql_epoch_ms("new.time")}),
+            updated_ms = coalesce(new.updated_ms, {_sql_epoch_ms("new.updated")})
+        WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS earthquake_events_time_ms_update AFTER UPDATE OF time, updated ON earthquake_events
+    BEGIN
+        UPDATE earthquake_events
+        SET time_ms = {_sql_epoch_ms("new.time")}, updated_ms = {_sql_epoch_ms("new.updated")}
+        WHERE id = new.id;
+    END;
+    ''')
+    conn.commit()
+    return backfilled
+
+class EarthquakeQueries:
+    """Index-backed time-window reads of the earthquake catalog."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._has_time_columns = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def available(self) -> bool:
+        """Whether the database has been migrated to epoch-ms columns."""
+        if not self._has_time_columns and os.path.exists(self.db_path):
+            conn = self._connect()
+            try:
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(earthquake_events)")}
+            finally:
+                conn.close()
+            self._has_time_columns = {"time_ms", "updated_ms"} <= columns
+        return self._has_time_columns
+
+    def between(
+        self,
+        start_ms: int,
+        end_ms: Optional[int] = None,
+        min_magnitude: Optional[float] = None,
+        limit: Optional[int] = None,
+        region: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Events with start_ms <= time_ms < end_ms, newest first; region uses the (place_region, time_ms) index."""
+        conditions = ["time_ms >= ?"]
+        params: List[Any] = [start_ms]
+        if region is not None:
+            conditions.insert(0, "place_region = ?")
+            params.insert(0, region)
+        if end_ms is not None:
+            conditions.append("time_ms < ?")
+            params.append(end_ms)
+        if min_magnitude is not None:
+            conditions.append("magnitude >= ?")
+            params.append(min_magnitude)
+        sql = f"SELECT * FROM earthquake_events WHERE {' AND '.join(conditions)} ORDER BY time_ms DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def recent(self, days: float = 7, min_magnitude: Optional[float] = 3.0, now: Optional[int] = None,
+               limit: Optional[int] = None, region: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Events from the last `days` days, newest first."""
+        return self.between((now or now_ms()) - int(days * DAY_MS), min_magnitude=min_magnitude, limit=limit, region=region)
+
+    def count_since(self, days: float = 7, now: Optional[int] = None) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM earthquake_events WHERE time_ms >= ?",
+                ((now or now_ms()) - int(days * DAY_MS),)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    def region_counts(self, days: float = 7, min_magnitude: Optional[float] = None,
+                      now: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Event count and largest magnitude per parsed region over the last `days` days, busiest first."""
+        conditions = ["time_ms >= ?", "place_region IS NOT NULL"]
+        params: List[Any] = [(now or now_ms()) - int(days * DAY_MS)]
+        if min_magnitude is not None:
+            conditions.append("magnitude >= ?")
+            params.append(min_magnitude)
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(
+                "SELECT place_region AS region, COUNT(*) AS count, MAX(magnitude) AS max_magnitude "
+                f"FROM earthquake_events WHERE {' AND '.join(conditions)} "
+                "GROUP BY place_region ORDER BY count DESC, region",
+                params
+            )]
+        finally:
+            conn.close()
+
+    def updated_since(self, since_ms: int) -> List[Dict[str, Any]]:
+        """Events inserted or revised after since_ms, oldest revision first (for incremental consumers)."""
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM earthquake_events WHERE updated_ms > ? ORDER BY updated_ms", (since_ms,)
+            )]
+        finally:
+            conn.close()
@@ -0,0 +1,193 @@
+"""
+Precompiled Jinja2 rendering for campaign emails.
+Templates (subject, text body, compliance footer and HTML variant) are compiled
+once per process; bulk rendering streams results to JSONL and can fan out
+across a process pool for very large sends.
+"""
+
+import itertools
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from markupsafe import Markup, escape
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+DEFAULT_SENDER = {
+    "team": "Insurance Protection Team",
+    "address": "123 Insurance Street, Your City, State 12345",
+}
+
+@dataclass
+class RenderedEmail:
+    to: str
+    name: str
+    subject: str
+    text: str
+    html: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"to": self.to, "name": self.name, "subject": self.subject, "text": self.text, "html": self.html}
+
+def _nl2br(value: str) -> Markup:
+    return escape(value).replace("\n", Markup("<br>\n"))
+
+class EmailRenderer:
+    """Holds compiled email templates and renders them for targets."""
+
+    def __init__(self, template_dir: str = TEMPLATE_DIR, sender: Optional[Dict[str, str]] = None):
+        self.template_dir = template_dir
+        self.sender = dict(DEFAULT_SENDER, **(sender or {}))
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=lambda name: bool(name) and name.endswith(".html.j2"),
+            undefined=StrictUndefined,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False,
+        )
+        self.env.filters["nl2br"] = _nl2br
+
+        # Compile everything up front so rendering never touches the loader
+        self.subject_template = self.env.get_template("email_subject.txt.j2")
+        self.text_template = self.env.get_template("email_body.txt.j2")
+        self.html_template = self.env.get_template("email_body.html.j2")
+
+        # The footer only depends on the sender, so render it once
+        self.footer = self.env.get_template("email_footer.txt.j2").render(sender=self.sender).strip()
+        self.footer_html = _nl2br(self.footer)
+
+    def _context(self, content: Dict[str, Any], target: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        target = target or {}
+        body = content.get("body", "").strip()
+        return {
+            "subject": content.get("subject", ""),
+            "body": body,
+            # Paragraph splitting and escaping in Python is much cheaper than a template loop
+            "paragraphs": [_nl2br(paragraph.strip()) for paragraph in body.split("\n\n") if paragraph.strip()],
+            "footer": self.footer,
+            "footer_html": self.footer_html,
+            "sender": self.sender,
+            "person": target.get("person", {}),
+            "earthquake": target.get("earthquake", {}),
+            "distance_km": target.get("distance_km"),
+            "risk_level": target.get("risk_level"),
+        }
+
+    def render_text(self, content: Dict[str, Any], target: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+        """Render subject, plain-text body (with footer) and HTML for one email."""
+        context = self._context(content, target)
+        return {
+            "subject": self.subject_template.render(context).strip(),
+            "body": self.text_template.render(context),
+            "html": self.html_template.render(context),
+        }
+
+    def render(self, content: Dict[str, Any], target: Dict[str, Any]) -> RenderedEmail:
+        """Render a complete email addressed to the target's person."""
+        person = target.get("person", {})
+        rendered = self.render_text(content, target)
+        return RenderedEmail(
+            to=person.get("email", ""),
+            name=f"{person.get('first_name', '')} {person.get('last_name', '')}".strip(),
+            subject=rendered["subject"],
+            text=rendered["body"],
+            html=rendered["html"],
+        )
+
+    def render_chunk(self, items: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Render a list of {"target", "content"} items."""
+        return [self.render(item["content"], item["target"]).to_dict() for item in items]
+
+# Per-worker renderer for process pools, built once by the pool initializer
+_worker_renderer: Optional[EmailRenderer] = None
+
+def _init_worker(template_dir: str, sender: Dict[str, str]):
+    global _worker_renderer
+    _worker_renderer = EmailRenderer(template_dir, sender)
+
+def _render_chunk_in_worker(items: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    return _worker_renderer.render_chunk(items)
+
+def _chunks(items: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def render_many(
+    items: Iterable[Dict[str, Any]],
+    renderer: Optional[EmailRenderer] = None,
+    processes: int = 0,
+    chunk_size: int = 1000,
+) -> Iterator[Dict[str, str]]:
+    """
+    Render {"target", "content"} items in order, yielding rendered email dicts.
+
+    With processes > 1 chunks are rendered in a process pool; at most two chunks
+    per worker are in flight so memory stays bounded for arbitrarily large inputs.
+    """
+    renderer = renderer or EmailRenderer()
+
+    if processes <= 1:
+        for chunk in _chunks(items, chunk_size):
+            yield from renderer.render_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(renderer.template_dir, renderer.sender),
+    ) as pool:
+        in_flight = deque()
+        for chunk in _chunks(items, chunk_size):
+            in_flight.append(pool.submit(_render_chunk_in_worker, chunk))
+            if len(in_flight) >= processes * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+def render_to_file(
+    items: Iterable[Dict[str, Any]],
+    output_path: str,
+    renderer: Optional[EmailRenderer] = None,
+    processes: int = 0,
+    chunk_size: int = 1000,
+) -> int:
+    """Stream rendered emails to a JSONL file; returns the number written."""
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as output:
+        for email in render_many(items, renderer, processes, chunk_size):
+            output.write(json.dumps(email))
+            output.write("\n")
+            count += 1
+    return count
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Render campaign emails in bulk")
+    parser.add_argument("input", help="JSONL file of {\"target\": ..., \"content\": {\"subject\", \"body\"}} items")
+    parser.add_argument("output", help="JSONL file to write rendered emails to")
+    parser.add_argument("--processes", type=int, default=0, help="Worker processes (0 renders in-process)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = render_to_file(_read_jsonl(args.input), args.output, processes=args.processes, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {written} emails in {elapsed:.2f}s ({written / max(elapsed, 1e-9):,.0f}/s)")
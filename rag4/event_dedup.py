@@ -0,0 +1,275 @@
+"""
+Cross-network duplicate detection for earthquake ingest.
+The USGS feed can report one physical quake from several networks (ak, us,
+nc, ...), each with its own event id. Events are bucketed in a grid of time
+bucket x latitude cell x longitude cell sized to the match tolerances, so each
+event is only compared with events in neighbouring buckets. Matches are merged
+into groups and the preferred origin of each group is kept; two groups only
+merge when their preferred origins match too, so a run of aftershocks a few
+seconds apart is not chained into one quake.
+"""
+
+import math
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from earthquake_partitions import EarthquakePartitions
+from earthquake_queries import iso_to_epoch_ms
+from place_parser import PLACE_COLUMNS, migrate_place_columns, parse_place
+
+KM_PER_DEGREE = 111.195
+
+# Regional networks are authoritative where they operate, so they win over
+# the global "us" solution; unknown networks rank between them.
+DEFAULT_NETWORK_PREFERENCE = (
+    "ak", "ci", "nc", "hv", "nn", "uu", "uw", "pr", "nm", "se", "tx", "ok", "mb", "av", "us",
+)
+
+# Moment magnitudes first, then local/duration, then body/surface wave
+MAG_TYPE_PREFERENCE = ("mww", "mwc", "mwb", "mwr", "mw", "ml", "md", "mb", "ms", "mh")
+
+@dataclass
+class DedupConfig:
+    max_distance_km: float = 100.0
+    max_seconds: float = 16.0
+    max_magnitude_diff: Optional[float] = 1.0
+    network_preference: Tuple[str, ...] = DEFAULT_NETWORK_PREFERENCE
+
+@dataclass
+class DedupResult:
+    preferred: List[Dict[str, Any]]
+    # duplicate event_id -> preferred event_id
+    duplicate_of: Dict[str, str] = field(default_factory=dict)
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(a)))
+
+def preference_key(event: Dict[str, Any], config: DedupConfig) -> Tuple:
+    """Higher is preferred: reviewed, network rank, magnitude type, then most recently updated."""
+    networks = config.network_preference
+    network = (event.get("network") or "").lower()
+    network_rank = networks.index(network) if network in networks else len(networks) - 1.5
+    mag_type = event.get("mag_type")
+    # Pandas rows carry NaN for a missing magnitude type
+    mag_type = mag_type.lower() if isinstance(mag_type, str) else ""
+    mag_rank = MAG_TYPE_PREFERENCE.index(mag_type) if mag_type in MAG_TYPE_PREFERENCE else len(MAG_TYPE_PREFERENCE)
+    return (
+        (event.get("status") or "").lower() == "reviewed",
+        -network_rank,
+        -mag_rank,
+        event.get("updated_ms") or 0,
+        event.get("event_id") or "",
+    )
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+def _is_match(a: Dict[str, Any], b: Dict[str, Any], config: DedupConfig) -> bool:
+    if abs(a["time_ms"] - b["time_ms"]) > config.max_seconds * 1000:
+        return False
+    if config.max_magnitude_diff is not None and a.get("magnitude") is not None and b.get("magnitude") is not None:
+        if abs(a["magnitude"] - b["magnitude"]) > config.max_magnitude_diff:
+            return False
+    return haversine_km(a["latitude"], a["longitude"], b["latitude"], b["longitude"]) <= config.max_distance_km
+
+def find_duplicates(events: List[Dict[str, Any]], config: Optional[DedupConfig] = None) -> DedupResult:
+    """Group matching events and keep the preferred origin of each group; near-linear via a grid index."""
+    config = config or DedupConfig()
+    for event in events:
+        if event.get("time_ms") is None:
+            event["time_ms"] = iso_to_epoch_ms(event["time"])
+        if event.get("updated_ms") is None:
+            event["updated_ms"] = iso_to_epoch_ms(event.get("updated"))
+
+    bucket_ms = max(1, int(config.max_seconds * 1000))
+    cell_deg = max(config.max_distance_km / KM_PER_DEGREE, 1e-6)
+    lon_cells = int(round(360 / cell_deg))
+    grid: Dict[Tuple[int, int, int], List[int]] = {}
+    groups = _UnionFind(len(events))
+    # Group root -> index of the group's preferred origin
+    best_of = list(range(len(events)))
+
+    for i, event in enumerate(events):
+        t_bucket = event["time_ms"] // bucket_ms
+        lat_cell = int(math.floor(event["latitude"] / cell_deg))
+        lon_cell = int(math.floor(event["longitude"] / cell_deg))
+        # Longitude degrees shrink with latitude, so reach further east-west near the poles
+        cos_lat = max(math.cos(math.radians(min(89.0, abs(event["latitude"]) + cell_deg))), 1e-3)
+        lon_reach = min(lon_cells // 2, int(math.ceil(1 / cos_lat)))
+        for dt in (-1, 0, 1):
+            for dlat in (-1, 0, 1):
+                for dlon in range(-lon_reach, lon_reach + 1):
+                    key = (t_bucket + dt, lat_cell + dlat, (lon_cell + dlon) % lon_cells)
+                    for j in grid.get(key, ()):
+                        if not _is_match(event, events[j], config):
+                            continue
+                        root_i, root_j = groups.find(i), groups.find(j)
+                        if root_i == root_j:
+                            continue
+                        best_i, best_j = best_of[root_i], best_of[root_j]
+                        if not _is_match(events[best_i], events[best_j], config):
+                            continue
+                        groups.union(j, i)
+                        best_of[groups.find(i)] = max(best_i, best_j, key=lambda k: preference_key(events[k], config))
+        grid.setdefault((t_bucket, lat_cell, lon_cell % lon_cells), []).append(i)
+
+    members: Dict[int, List[int]] = {}
+    for i in range(len(events)):
+        members.setdefault(groups.find(i), []).append(i)
+
+    result = DedupResult(preferred=[])
+    for root, indices in members.items():
+        best = best_of[root]
+        result.preferred.append(events[best])
+        for i in indices:
+            if i != best:
+                result.duplicate_of[events[i]["event_id"]] = events[best]["event_id"]
+    result.preferred.sort(key=lambda event: event["time_ms"])
+    return result
+
+EVENT_FIELDS = (
+    "time", "latitude", "longitude", "depth", "magnitude", "mag_type", "place",
+    "network", "event_id", "updated", "status", "time_ms", "updated_ms",
+)
+
+# Written with the parsed place columns, so revisions that move the place are re-parsed
+UPSERT_FIELDS = EVENT_FIELDS + tuple(column for column, _ in PLACE_COLUMNS)
+
+# Revisions update the feed and place columns in place, keeping sequence_id
+UPSERT_EVENT_SQL = (
+    f"INSERT INTO earthquake_events ({', '.join(UPSERT_FIELDS)}) VALUES ({', '.join('?' for _ in UPSERT_FIELDS)}) "
+    "ON CONFLICT(event_id) DO UPDATE SET "
+    + ", ".join(f"{name} = excluded.{name}" for name in UPSERT_FIELDS if name != "event_id")
+)
+
+def _upsert_row(event: Dict[str, Any]) -> Tuple:
+    parsed = parse_place(event.get("place"))
+    return tuple(event.get(name) for name in EVENT_FIELDS) + tuple(getattr(parsed, field) for _, field in PLACE_COLUMNS)
+
+def ensure_duplicates_table(conn: sqlite3.Connection):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS earthquake_duplicates (
+        event_id TEXT PRIMARY KEY,
+        preferred_event_id TEXT NOT NULL,
+        network TEXT,
+        time_ms INTEGER,
+        detected_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_duplicates_preferred ON earthquake_duplicates (preferred_event_id)")
+
+def ingest_events(conn: sqlite3.Connection, events: Iterable[Dict[str, Any]], config: Optional[DedupConfig] = None,
+                  partitions: Optional[EarthquakePartitions] = None) -> Dict[str, int]:
+    """Insert a batch into earthquake_events, keeping one preferred origin per physical quake.
+
+    Stored events near the batch in time take part in matching, so a better origin
+    arriving later replaces the stored one. Places of inserted and revised rows are
+    parsed into the place_* columns (parse_place is cached, so repeats are free).
+    Dropped origins are logged in earthquake_duplicates. Inserts, revisions and
+    replacements are written through to the month partitions once they exist
+    (default directory unless `partitions` is given). New rows are assigned to
+    aftershock sequences incrementally. Needs the time_ms column (earthquake_queries.migrate_time_columns).
+    """
+    config = config or DedupConfig()
+    partitions = partitions or EarthquakePartitions()
+    ensure_duplicates_table(conn)
+    if "place_region" not in {row[1] for row in conn.execute("PRAGMA table_info(earthquake_events)")}:
+        migrate_place_columns(conn)
+    incoming = [dict(event) for event in events]
+    if not incoming:
+        return {"received": 0, "inserted": 0, "duplicates": 0, "replaced": 0}
+    for event in incoming:
+        event["time_ms"] = event.get("time_ms") or iso_to_epoch_ms(event["time"])
+        event["updated_ms"] = event.get("updated_ms") or iso_to_epoch_ms(event.get("updated"))
+
+    # Stored events within tolerance of the batch's time span (a time_ms range scan)
+    slack = int(config.max_seconds * 1000)
+    start = min(e["time_ms"] for e in incoming) - slack
+    end = max(e["time_ms"] for e in incoming) + slack
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    incoming_ids = {e["event_id"] for e in incoming}
+    stored = [
+        dict(row) for row in cursor.execute(
+            f"SELECT {', '.join(EVENT_FIELDS)} FROM earthquake_events WHERE time_ms BETWEEN ? AND ?", (start, end)
+        )
+        if row["event_id"] not in incoming_ids
+    ]
+    stored_ids = {e["event_id"] for e in stored}
+    # Incoming revisions of stored events; one that now loses to another origin must be removed
+    revised_ms: Dict[str, int] = {}
+    incoming_list = list(incoming_ids)
+    for start in range(0, len(incoming_list), 500):
+        chunk = incoming_list[start:start + 500]
+        revised_ms.update(
+            (row["event_id"], row["time_ms"]) for row in cursor.execute(
+                f"SELECT event_id, time_ms FROM earthquake_events WHERE event_id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )
+        )
+
+    result = find_duplicates(stored + incoming, config)
+    to_insert = [e for e in result.preferred if e["event_id"] not in stored_ids]
+    replaced = [event_id for event_id in result.duplicate_of if event_id in stored_ids or event_id in revised_ms]
+    events_by_id = {e["event_id"]: e for e in stored + incoming}
+
+    conn.executemany("DELETE FROM earthquake_events WHERE event_id = ?", [(event_id,) for event_id in replaced])
+    conn.executemany(
+        UPSERT_EVENT_SQL,
+        [_upsert_row(event) for event in to_insert]
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO earthquake_duplicates (event_id, preferred_event_id, network, time_ms) VALUES (?, ?, ?, ?)",
+        [
+            (event_id, preferred_id, events_by_id[event_id].get("network"), events_by_id[event_id]["time_ms"])
+            for event_id, preferred_id in result.duplicate_of.items()
+        ]
+    )
+    # Earlier duplicates of a replaced origin now point at its replacement
+    conn.executemany(
+        "UPDATE earthquake_duplicates SET preferred_event_id = ? WHERE preferred_event_id = ?",
+        [(result.duplicate_of[event_id], event_id) for event_id in replaced]
+    )
+    conn.commit()
+    # Imported here: aftershock_sequences imports this module for haversine_km
+    from aftershock_sequences import assign_sequences
+    # New rows join their sequences before the write-through, so partitions carry sequence_id
+    assign_sequences(conn)
+
+    if partitions.available():
+        # Time-window reads go to the partitions, so they must see the same inserts and deletes
+        # A demoted revision is filed under its stored time, which the revision may have moved
+        partitions.delete_many(
+            {"event_id": event_id, "time_ms": revised_ms.get(event_id, events_by_id[event_id]["time_ms"])}
+            for event_id in replaced
+        )
+        written_ids = [event["event_id"] for event in to_insert]
+        rows = []
+        for start in range(0, len(written_ids), 500):
+            chunk = written_ids[start:start + 500]
+            rows.extend(dict(row) for row in cursor.execute(
+                f"SELECT * FROM earthquake_events WHERE event_id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            ))
+        partitions.insert_many(rows)
+    return {
+        "received": len(incoming),
+        "inserted": len(to_insert),
+        "duplicates": sum(1 for event_id in result.duplicate_of if event_id in incoming_ids),
+        "replaced": len(replaced),
+    }
@@ -0,0 +1,254 @@
+"""
+Gridded earthquake exposure layer.
+Each cell of a regular lat/lon grid stores the maximum predicted shaking
+intensity (MMI, risk_model.intensity), the number of felt events and the time
+of the last felt event. The layers are memory-mapped .npy files, updated
+incrementally as events are ingested, so a person's exposure is a direct cell
+lookup and population-wide stats are one pass over the grid.
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from earthquake_queries import DEFAULT_DB_PATH
+from risk_model import HIGH_RISK_MMI, MEDIUM_RISK_MMI, haversine_km, intensity
+
+DEFAULT_RASTER_DIR = os.path.join("db", "exposure")
+
+# Cell size in degrees (about 11 km at the equator)
+DEFAULT_RESOLUTION_DEG = 0.1
+
+# Shaking below this is not counted as a felt event
+FELT_MMI = 2.0
+
+# Distance beyond which no event reaches FELT_MMI is looked up at these steps
+RADIUS_SEARCH_KM = np.arange(0.0, 2000.0, 5.0)
+
+# layer name -> (dtype, fill value)
+LAYERS = {
+    "max_mmi": (np.float32, 0.0),
+    "event_count": (np.uint32, 0),
+    "last_event_ms": (np.int64, 0),
+}
+
+def felt_radius_km(magnitude: float, depth_km: float) -> float:
+    """Largest epicentral distance at which the event still reaches FELT_MMI."""
+    mmi = intensity(magnitude, np.sqrt(RADIUS_SEARCH_KM ** 2 + depth_km ** 2))
+    felt = np.nonzero(mmi >= FELT_MMI)[0]
+    return float(RADIUS_SEARCH_KM[felt[-1]] + 5.0) if len(felt) else 0.0
+
+class ExposureRaster:
+    """Memory-mapped max intensity / event count / last event time per grid cell."""
+
+    def __init__(self, raster_dir: str = DEFAULT_RASTER_DIR, resolution_deg: float = DEFAULT_RESOLUTION_DEG):
+        self.raster_dir = raster_dir
+        self.lock = threading.Lock()
+        self.header_path = os.path.join(raster_dir, "header.json")
+        if os.path.exists(self.header_path):
+            with open(self.header_path) as f:
+                self.header = json.load(f)
+        else:
+            self.header = {"resolution_deg": resolution_deg, "last_row_id": 0, "events": 0}
+        self.resolution = self.header["resolution_deg"]
+        self.shape = (int(round(180 / self.resolution)), int(round(360 / self.resolution)))
+        self.layers: Dict[str, np.memmap] = {}
+
+    def _layer_path(self, name: str) -> str:
+        return os.path.join(self.raster_dir, f"{name}.npy")
+
+    def available(self) -> bool:
+        return os.path.exists(self.header_path)
+
+    def _open(self, writable: bool = False):
+        """Map the layers, creating zeroed files on first write."""
+        if self.layers and (not writable or self.layers["max_mmi"].mode != "r"):
+            return
+        if writable:
+            os.makedirs(self.raster_dir, exist_ok=True)
+        self.layers = {}
+        for name, (dtype, _) in LAYERS.items():
+            path = self._layer_path(name)
+            if os.path.exists(path):
+                self.layers[name] = np.lib.format.open_memmap(path, mode="r+" if writable else "r")
+            elif writable:
+                # Fresh files are sparse; zero is every layer's fill value
+                self.layers[name] = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=self.shape)
+            else:
+                raise FileNotFoundError(path)
+
+    def _save_header(self):
+        with open(self.header_path + ".tmp", "w") as f:
+            json.dump(self.header, f)
+        os.replace(self.header_path + ".tmp", self.header_path)
+
+    def cell_of(self, latitude, longitude):
+        """Row and column arrays for coordinates (clamped to the grid)."""
+        rows = np.clip(((90.0 - np.asarray(latitude, dtype=float)) // self.resolution).astype(np.int64), 0, self.shape[0] - 1)
+        cols = ((np.asarray(longitude, dtype=float) + 180.0) // self.resolution).astype(np.int64) % self.shape[1]
+        return rows, cols
+
+    def add_events(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Burn events into the grid: only the cells within each event's felt radius are touched."""
+        added = 0
+        with self.lock:
+            self._open(writable=True)
+            max_mmi, event_count, last_event_ms = (self.layers[name] for name in LAYERS)
+            for event in events:
+                magnitude, time_ms = event.get("magnitude"), event.get("time_ms")
+                if magnitude is None or event.get("latitude") is None:
+                    continue
+                depth = 10.0 if event.get("depth") is None else float(event["depth"])
+                radius_km = felt_radius_km(magnitude, depth)
+                if radius_km <= 0:
+                    continue
+                lat, lon = float(event["latitude"]), float(event["longitude"])
+                lat_span = radius_km / 111.195
+                lon_span = min(180.0, lat_span / max(math.cos(math.radians(min(89.9, abs(lat) + lat_span))), 1e-3))
+                row_lo, _ = self.cell_of(min(90.0, lat + lat_span), lon)
+                row_hi, _ = self.cell_of(max(-90.0, lat - lat_span), lon)
+                rows = np.arange(int(row_lo), int(row_hi) + 1)
+                n_cols = min(self.shape[1], int(math.ceil(2 * lon_span / self.resolution)) + 1)
+                _, first_col = self.cell_of(lat, lon - lon_span)
+                cols = (int(first_col) + np.arange(n_cols)) % self.shape[1]
+
+                # Intensity at cell centres for the window around the event
+                center_lat = 90.0 - (rows + 0.5) * self.resolution
+                center_lon = (cols + 0.5) * self.resolution - 180.0
+                distance = haversine_km(center_lat[:, None], center_lon[None, :], lat, lon)
+                mmi = intensity(magnitude, np.sqrt(distance ** 2 + depth ** 2)).astype(np.float32)
+                felt = mmi >= FELT_MMI
+
+                window = np.ix_(rows, cols)
+                max_mmi[window] = np.maximum(max_mmi[window], np.where(felt, mmi, 0.0))
+                event_count[window] += felt.astype(np.uint32)
+                if time_ms is not None:
+                    last_event_ms[window] = np.where(felt, np.maximum(last_event_ms[window], int(time_ms)), last_event_ms[window])
+                added += 1
+            for layer in self.layers.values():
+                layer.flush()
+            self.header["events"] += added
+            self._save_header()
+        return added
+
+    def _burned_conn(self) -> sqlite3.Connection:
+        """Event ids already in the grid, so revisions (re-inserted rows) aren't counted twice."""
+        os.makedirs(self.raster_dir, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.raster_dir, "events.db"))
+        conn.execute("CREATE TABLE IF NOT EXISTS burned_events (event_id TEXT PRIMARY KEY)")
+        return conn
+
+    def sync(self, db_path: str = DEFAULT_DB_PATH) -> int:
+        """Add events inserted since the last sync (by row id); returns how many were added.
+
+        Max intensity and counts only grow: a revised event is not burned again and
+        a removed one is not subtracted; rebuild() recomputes from the table.
+        """
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = [dict(row) for row in conn.execute(
+                "SELECT id, event_id, latitude, longitude, depth, magnitude, time_ms FROM earthquake_events "
+                "WHERE id > ? ORDER BY id",
+                (self.header["last_row_id"],)
+            )]
+        finally:
+            conn.close()
+
+        burned = self._burned_conn()
+        try:
+            new_rows = []
+            for start in range(0, len(rows), 500):
+                chunk = rows[start:start + 500]
+                seen = {row[0] for row in burned.execute(
+                    f"SELECT event_id FROM burned_events WHERE event_id IN ({', '.join('?' for _ in chunk)})",
+                    [row["event_id"] for row in chunk]
+                )}
+                new_rows.extend(row for row in chunk if row["event_id"] not in seen)
+            added = self.add_events(new_rows)
+            burned.executemany("INSERT OR IGNORE INTO burned_events VALUES (?)", [(row["event_id"],) for row in new_rows])
+            burned.commit()
+        finally:
+            burned.close()
+
+        with self.lock:
+            if rows:
+                self.header["last_row_id"] = rows[-1]["id"]
+            self._open(writable=True)
+            self._save_header()
+        return added
+
+    def rebuild(self, db_path: str = DEFAULT_DB_PATH) -> int:
+        """Zero the grid and burn in every stored event."""
+        with self.lock:
+            self._open(writable=True)
+            for name, (_, fill) in LAYERS.items():
+                self.layers[name][:] = fill
+            self.header.update(last_row_id=0, events=0)
+            self._save_header()
+        burned = self._burned_conn()
+        try:
+            burned.execute("DELETE FROM burned_events")
+            burned.commit()
+        finally:
+            burned.close()
+        return self.sync(db_path)
+
+    def lookup(self, latitude, longitude) -> Dict[str, np.ndarray]:
+        """Exposure at the given coordinates: one cell read per point."""
+        with self.lock:
+            self._open()
+            rows, cols = self.cell_of(latitude, longitude)
+            return {name: np.asarray(self.layers[name][rows, cols]) for name in LAYERS}
+
+    def stats(self, latitude=None, longitude=None) -> Dict[str, Any]:
+        """Grid-wide exposed area by intensity class, plus the same for people at the given coordinates."""
+        with self.lock:
+            self._open()
+            max_mmi = np.asarray(self.layers["max_mmi"])
+            stats: Dict[str, Any] = {
+                "resolution_deg": self.resolution,
+                "events": self.header["events"],
+                "cells": {
+                    "high": int(np.count_nonzero(max_mmi >= HIGH_RISK_MMI)),
+                    "medium": int(np.count_nonzero((max_mmi >= MEDIUM_RISK_MMI) & (max_mmi < HIGH_RISK_MMI))),
+                    "felt": int(np.count_nonzero(max_mmi >= FELT_MMI)),
+                },
+                "max_mmi": round(float(max_mmi.max()), 2),
+            }
+        if latitude is not None:
+            people = self.lookup(latitude, longitude)
+            mmi = people["max_mmi"]
+            stats["people"] = {
+                "total": int(len(mmi)),
+                "high": int(np.count_nonzero(mmi >= HIGH_RISK_MMI)),
+                "medium": int(np.count_nonzero((mmi >= MEDIUM_RISK_MMI) & (mmi < HIGH_RISK_MMI))),
+                "felt": int(np.count_nonzero(mmi >= FELT_MMI)),
+                "mean_event_count": round(float(people["event_count"].mean()), 3) if len(mmi) else 0.0,
+            }
+        return stats
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Build or update the earthquake exposure raster")
+    parser.add_argument("command", choices=["sync", "rebuild", "stats"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--dir", default=DEFAULT_RASTER_DIR)
+    parser.add_argument("--resolution", type=float, default=DEFAULT_RESOLUTION_DEG)
+    args = parser.parse_args(argv)
+
+    raster = ExposureRaster(args.dir, args.resolution)
+    if args.command == "sync":
+        print(f"Added {raster.sync(args.db)} events")
+    elif args.command == "rebuild":
+        print(f"Rebuilt from {raster.rebuild(args.db)} events")
+    else:
+        print(json.dumps(raster.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+GeoJSON region filters for targeting.
+A region (Polygon, MultiPolygon, Feature or FeatureCollection) is prepared
+once into edge arrays and a bounding box and cached by its canonical JSON, so
+repeated campaigns over the same drawn region skip parsing. Containment tests
+drop points outside the bounding box first, then run an even-odd ray cast
+(holes are handled by the same rule) in which each edge only tests the
+points in its latitude band, found by binary search over sorted latitudes.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+
+# Prepared regions kept across calls
+MAX_CACHED_REGIONS = 64
+
+@dataclass(frozen=True)
+class PreparedRegion:
+    key: str
+    # min_lon, min_lat, max_lon, max_lat
+    bbox: Tuple[float, float, float, float]
+    # Edge endpoints, one entry per ring edge across all polygons
+    x1: np.ndarray
+    y1: np.ndarray
+    x2: np.ndarray
+    y2: np.ndarray
+
+    def contains(self, latitude, longitude) -> np.ndarray:
+        """Boolean mask of points inside the region (points on an edge may fall either way)."""
+        lat = np.asarray(latitude, dtype=float)
+        lon = np.asarray(longitude, dtype=float)
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        candidates = np.nonzero(inside)[0]
+        if not len(candidates):
+            return inside
+        # Sorted by latitude, each edge only visits the points in its latitude band
+        order = np.argsort(lat[candidates], kind="stable")
+        px, py = lon[candidates][order], lat[candidates][order]
+        y_low, y_high = np.minimum(self.y1, self.y2), np.maximum(self.y1, self.y2)
+        starts = np.searchsorted(py, y_low, side="left")
+        stops = np.searchsorted(py, y_high, side="left")
+        crossings = np.zeros(len(candidates), dtype=bool)
+        for edge in np.nonzero(stops > starts)[0].tolist():
+            start, stop = starts[edge], stops[edge]
+            x1, y1, x2, y2 = self.x1[edge], self.y1[edge], self.x2[edge], self.y2[edge]
+            x_cross = x1 + (py[start:stop] - y1) * (x2 - x1) / (y2 - y1)
+            crossings[start:stop] ^= px[start:stop] < x_cross
+        crossings[order] = crossings.copy()
+        inside[candidates] = crossings
+        return inside
+
+def _polygons(geojson: Dict[str, Any]) -> List[List[List[List[float]]]]:
+    """Polygon coordinate lists (rings of [lon, lat]) in any supported GeoJSON object."""
+    kind = geojson.get("type")
+    if kind == "FeatureCollection":
+        return [polygon for feature in geojson.get("features", []) for polygon in _polygons(feature)]
+    if kind == "Feature":
+        return _polygons(geojson.get("geometry") or {})
+    if kind == "Polygon":
+        return [geojson["coordinates"]]
+    if kind == "MultiPolygon":
+        return list(geojson["coordinates"])
+    raise ValueError(f"Unsupported GeoJSON region type: {kind}")
+
+@lru_cache(maxsize=MAX_CACHED_REGIONS)
+def _prepare(canonical: str) -> PreparedRegion:
+    edges = []
+    for polygon in _polygons(json.loads(canonical)):
+        for ring in polygon:
+            points = np.asarray(ring, dtype=float)[:, :2]
+            if len(points) < 3:
+                continue
+            if not np.array_equal(points[0], points[-1]):
+                points = np.vstack([points, points[:1]])
+            edges.append(np.hstack([points[:-1], points[1:]]))
+    if not edges:
+        raise ValueError("GeoJSON region has no polygon rings")
+    edges = np.vstack(edges)
+    x1, y1, x2, y2 = (np.ascontiguousarray(edges[:, i]) for i in range(4))
+    bbox = (
+        float(min(x1.min(), x2.min())), float(min(y1.min(), y2.min())),
+        float(max(x1.max(), x2.max())), float(max(y1.max(), y2.max()))
+    )
+    return PreparedRegion(hashlib.sha1(canonical.encode()).hexdigest()[:16], bbox, x1, y1, x2, y2)
+
+def prepare_region(region: Union[str, Dict[str, Any]]) -> PreparedRegion:
+    """Prepared region for a GeoJSON object or JSON string, cached across calls."""
+    geojson = json.loads(region) if isinstance(region, str) else region
+    return _prepare(json.dumps(geojson, sort_keys=True, separators=(",", ":")))
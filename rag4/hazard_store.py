@@ -0,0 +1,485 @@
+"""
+Multi-hazard event store and targeting.
+Earthquakes and weather events (storm, flood, cyclone, rain, heatwave) share
+one hazard_events table with a severity scale and a spatio-temporal index: a
+grid cell id plus event end time, and hazard type plus end time. Earthquakes
+are mirrored incrementally from earthquake_events; weather events are
+ingested from WeatherData records (the shape the web app's weather API
+returns).
+
+find_targets() serves any number of hazard campaigns from one pass over the
+population: homes are loaded and bucketed once, each event's distances are
+computed once against nearby homes, and the pairs are scored in one
+vectorized call per hazard type (shaking intensity for earthquakes, the
+calculateWeatherRiskLevel points of the web app for weather) before being
+split per campaign.
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from earthquake_queries import DEFAULT_DB_PATH, epoch_ms_to_iso
+from event_dedup import KM_PER_DEGREE
+from risk_model import RISK_LEVELS, haversine_km, score_pairs
+from target_query import TARGET_COLUMNS, TARGET_FIELDS
+from targeting_engine import PeopleGrid, object_array
+
+WEATHER_TYPES = ("storm", "flood", "cyclone", "rain", "heatwave")
+HAZARD_TYPES = ("earthquake",) + WEATHER_TYPES
+
+SEVERITY_LEVELS = ("light", "moderate", "heavy", "severe")
+
+# Magnitude at which an earthquake reaches each severity level
+EARTHQUAKE_SEVERITY_MAGNITUDES = (0.0, 4.0, 5.0, 6.0)
+
+# calculateWeatherRiskLevel points (web app): event type, distance steps, home value steps
+WEATHER_TYPE_POINTS = {"cyclone": 3, "flood": 3, "storm": 2, "rain": 1, "heatwave": 0}
+WEATHER_DISTANCE_POINTS = ((10, 3), (25, 2), (50, 1))
+WEATHER_VALUE_POINTS = ((1000000, 2), (500000, 1))
+WEATHER_HIGH_POINTS, WEATHER_MEDIUM_POINTS = 7, 4
+WEATHER_MAX_POINTS = 11
+
+# Spatial index cell size in degrees
+INDEX_CELL_DEG = 1.0
+INDEX_LON_CELLS = int(360 / INDEX_CELL_DEG)
+
+# Cells listed per `cell IN (...)` query
+CELL_QUERY_CHUNK = 500
+
+EVENT_COLUMNS = (
+    "event_id", "hazard_type", "severity", "latitude", "longitude", "start_ms", "end_ms",
+    "magnitude", "depth", "location", "description", "source", "cell", "source_row_id", "source_updated_ms"
+)
+
+@dataclass(frozen=True)
+class HazardCampaign:
+    """Targeting criteria for one hazard campaign (defaults follow the weather-targets route)."""
+    hazard_types: Tuple[str, ...] = HAZARD_TYPES
+    min_severity: str = "light"
+    max_distance_km: float = 100
+    min_house_value: float = 100000
+    require_uninsured: bool = True
+    # Only events active within the last `days` (None: all stored events)
+    days: Optional[float] = None
+
+    def __post_init__(self):
+        if not self.hazard_types:
+            raise ValueError("A campaign needs at least one hazard type")
+        unknown = set(self.hazard_types) - set(HAZARD_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown hazard types: {sorted(unknown)}")
+        if self.min_severity not in SEVERITY_LEVELS:
+            raise ValueError(f"Unknown severity: {self.min_severity}")
+
+def index_cell(latitude, longitude) -> np.ndarray:
+    """Spatial index cell id of coordinates."""
+    rows = np.clip(np.floor((np.asarray(latitude, dtype=float) + 90.0) / INDEX_CELL_DEG), 0, 180 / INDEX_CELL_DEG - 1)
+    cols = np.floor((np.asarray(longitude, dtype=float) + 180.0) / INDEX_CELL_DEG) % INDEX_LON_CELLS
+    return (rows * INDEX_LON_CELLS + cols).astype(np.int64)
+
+def cells_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[int]:
+    """Index cells overlapping a bounding box (min_lon > max_lon wraps the antimeridian)."""
+    row_lo, row_hi = (int(index_cell(lat, 0) // INDEX_LON_CELLS) for lat in (min_lat, max_lat))
+    col_lo, col_hi = (int(index_cell(0, lon) % INDEX_LON_CELLS) for lon in (min_lon, max_lon))
+    cols = range(col_lo, col_hi + 1) if col_lo <= col_hi else [*range(col_lo, INDEX_LON_CELLS), *range(0, col_hi + 1)]
+    return [row * INDEX_LON_CELLS + col for row in range(row_lo, row_hi + 1) for col in cols]
+
+def earthquake_severity(magnitude) -> np.ndarray:
+    """Severity level index for magnitudes."""
+    magnitude = np.nan_to_num(np.asarray(magnitude, dtype=float))
+    return (np.searchsorted(EARTHQUAKE_SEVERITY_MAGNITUDES, magnitude, side="right") - 1).astype(np.int8)
+
+def weather_points(distance_km, severity, hazard_type: str, house_value) -> np.ndarray:
+    """calculateWeatherRiskLevel points for pairs of one weather type."""
+    distance_km = np.asarray(distance_km, dtype=float)
+    house_value = np.asarray(house_value, dtype=float)
+    points = np.asarray(severity, dtype=np.int64) + WEATHER_TYPE_POINTS.get(hazard_type, 0)
+    points = points + np.select([distance_km <= limit for limit, _ in WEATHER_DISTANCE_POINTS], [p for _, p in WEATHER_DISTANCE_POINTS], 0)
+    points = points + np.select([house_value >= limit for limit, _ in WEATHER_VALUE_POINTS], [p for _, p in WEATHER_VALUE_POINTS], 0)
+    return points
+
+def score_hazard_pairs(hazard_type: str, distance_km, severity, house_value, magnitude=None, depth_km=None) -> Dict[str, np.ndarray]:
+    """0-1 score and risk level index (0 high, 1 medium, 2 low) for pairs of one hazard type."""
+    if hazard_type == "earthquake":
+        scores = score_pairs(distance_km, magnitude, depth_km)
+        return {"risk": scores["risk"], "score": scores["score"], "mmi": scores["mmi"]}
+    points = weather_points(distance_km, severity, hazard_type, house_value)
+    risk = np.where(points >= WEATHER_HIGH_POINTS, 0, np.where(points >= WEATHER_MEDIUM_POINTS, 1, 2)).astype(np.int8)
+    return {"risk": risk, "score": np.minimum(points / WEATHER_MAX_POINTS, 1.0)}
+
+def _parse_ms(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+
+def weather_event(record: Dict[str, Any]) -> Dict[str, Any]:
+    """hazard_events row for a WeatherData record (camelCase, as the weather API returns)."""
+    hazard_type = record.get("eventType") or record.get("hazard_type")
+    if hazard_type not in WEATHER_TYPES:
+        raise ValueError(f"Unknown weather event type: {hazard_type}")
+    severity = record.get("severity") or "light"
+    if severity not in SEVERITY_LEVELS:
+        raise ValueError(f"Unknown severity: {severity}")
+    return {
+        "event_id": str(record.get("id") or record["event_id"]),
+        "hazard_type": hazard_type,
+        "severity": SEVERITY_LEVELS.index(severity),
+        "latitude": float(record["latitude"]),
+        "longitude": float(record["longitude"]),
+        "start_ms": _parse_ms(record.get("startTime", record.get("start_ms"))),
+        "end_ms": _parse_ms(record.get("endTime", record.get("end_ms"))),
+        "magnitude": None,
+        "depth": None,
+        "location": record.get("location") or record.get("affectedArea"),
+        "description": record.get("description"),
+        "source": record.get("source"),
+    }
+
+class HazardStore:
+    """hazard_events table in the earthquake database, and multi-campaign targeting over it."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_table(self, conn: sqlite3.Connection):
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS hazard_events (
+            id INTEGER PRIMARY KEY,
+            event_id TEXT UNIQUE NOT NULL,
+            hazard_type TEXT NOT NULL,
+            severity INTEGER NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            start_ms INTEGER,
+            end_ms INTEGER,
+            magnitude REAL,
+            depth REAL,
+            location TEXT,
+            description TEXT,
+            source TEXT,
+            cell INTEGER NOT NULL,
+            source_row_id INTEGER,
+            source_updated_ms INTEGER
+        )
+        ''')
+        # Window reads by type, and by area through the cells a bounding box covers
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_hazard_type_end ON hazard_events (hazard_type, end_ms)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_hazard_cell_end ON hazard_events (cell, end_ms)")
+
+    def _upsert(self, conn: sqlite3.Connection, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        cells = index_cell([row["latitude"] for row in rows], [row["longitude"] for row in rows]).tolist()
+        # Updating in place keeps each event's row id stable across revisions
+        updates = ", ".join(f"{column} = excluded.{column}" for column in EVENT_COLUMNS if column != "event_id")
+        conn.executemany(
+            f"INSERT INTO hazard_events ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' for _ in EVENT_COLUMNS)}) "
+            f"ON CONFLICT(event_id) DO UPDATE SET {updates}",
+            [
+                tuple({**row, "cell": cell}.get(column) for column in EVENT_COLUMNS)
+                for row, cell in zip(rows, cells)
+            ]
+        )
+
+    def ingest_weather(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Insert or replace weather events; returns how many were stored."""
+        rows = [weather_event(record) for record in records]
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            self._upsert(conn, rows)
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
+
+    def sync_earthquakes(self) -> Dict[str, int]:
+        """Mirror earthquakes inserted, replaced or revised since the last sync, and drop removed ones."""
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            last_row_id, last_updated_ms = conn.execute(
+                "SELECT COALESCE(MAX(source_row_id), 0), COALESCE(MAX(source_updated_ms), 0) "
+                "FROM hazard_events WHERE hazard_type = 'earthquake'"
+            ).fetchone()
+            quakes = [dict(row) for row in conn.execute(
+                "SELECT id, event_id, latitude, longitude, depth, magnitude, place, time_ms, updated_ms "
+                "FROM earthquake_events WHERE (id > ? OR updated_ms > ?) AND latitude IS NOT NULL AND longitude IS NOT NULL",
+                (last_row_id, last_updated_ms)
+            )]
+            severity = earthquake_severity([quake["magnitude"] for quake in quakes]).tolist()
+            self._upsert(conn, [
+                {
+                    "event_id": quake["event_id"],
+                    "hazard_type": "earthquake",
+                    "severity": severity[i],
+                    "latitude": quake["latitude"],
+                    "longitude": quake["longitude"],
+                    "start_ms": quake["time_ms"],
+                    "end_ms": quake["time_ms"],
+                    "magnitude": quake["magnitude"],
+                    "depth": quake["depth"],
+                    "location": quake["place"],
+                    "source": "earthquake_events",
+                    "source_row_id": quake["id"],
+                    "source_updated_ms": quake["updated_ms"],
+                }
+                for i, quake in enumerate(quakes)
+            ])
+            # Replaced duplicates and deleted events leave the earthquake table
+            removed = conn.execute(
+                "DELETE FROM hazard_events WHERE hazard_type = 'earthquake' "
+                "AND event_id NOT IN (SELECT event_id FROM earthquake_events)"
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return {"synced": len(quakes), "removed": removed}
+
+    def events(
+        self,
+        hazard_types: Sequence[str] = HAZARD_TYPES,
+        min_severity: str = "light",
+        since_ms: Optional[int] = None,
+        bbox: Optional[Sequence[float]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Events of the types at or above the severity, active since since_ms, inside bbox (min_lat, min_lon, max_lat, max_lon)."""
+        sql = (
+            f"SELECT * FROM hazard_events WHERE hazard_type IN ({', '.join('?' for _ in hazard_types)}) AND severity >= ?"
+        )
+        params: List[Any] = [*hazard_types, SEVERITY_LEVELS.index(min_severity)]
+        if since_ms is not None:
+            # Events without an end are ongoing
+            sql += " AND (end_ms >= ? OR end_ms IS NULL)"
+            params.append(int(since_ms))
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            if bbox is None:
+                rows = [dict(row) for row in conn.execute(sql, params)]
+            else:
+                cells = cells_in_bbox(*bbox)
+                rows = []
+                for start in range(0, len(cells), CELL_QUERY_CHUNK):
+                    chunk = cells[start:start + CELL_QUERY_CHUNK]
+                    rows.extend(dict(row) for row in conn.execute(
+                        sql + f" AND cell IN ({', '.join('?' for _ in chunk)})", params + chunk
+                    ))
+        finally:
+            conn.close()
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            in_lon = (lambda lon: min_lon <= lon <= max_lon) if min_lon <= max_lon else (lambda lon: lon >= min_lon or lon <= max_lon)
+            rows = [row for row in rows if min_lat <= row["latitude"] <= max_lat and in_lon(row["longitude"])]
+        for row in rows:
+            row["severity"] = SEVERITY_LEVELS[row["severity"]]
+        return rows
+
+    def _load_people(self, campaigns: Sequence[HazardCampaign], events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Homes any campaign could target: the loosest criteria, within reach of some event."""
+        sql = "SELECT * FROM demographics WHERE house_value >= ? AND latitude IS NOT NULL AND longitude IS NOT NULL"
+        params: List[Any] = [min(campaign.min_house_value for campaign in campaigns)]
+        if all(campaign.require_uninsured for campaign in campaigns):
+            sql += " AND has_insurance = 0"
+        reach_deg = max(campaign.max_distance_km for campaign in campaigns) / KM_PER_DEGREE
+        lats = [event["latitude"] for event in events]
+        min_lat, max_lat = max(-90.0, min(lats) - reach_deg), min(90.0, max(lats) + reach_deg)
+        if max(abs(min_lat), abs(max_lat)) < 89.0:
+            sql += " AND latitude BETWEEN ? AND ?"
+            params += [min_lat, max_lat]
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def _earthquake_rows(self, event_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """earthquake_events rows by event_id, for earthquake targets in find_earthquake_ad_targets form."""
+        rows = {}
+        conn = self._connect()
+        try:
+            for start in range(0, len(event_ids), 500):
+                chunk = event_ids[start:start + 500]
+                rows.update(
+                    (row["event_id"], dict(row)) for row in conn.execute(
+                        f"SELECT * FROM earthquake_events WHERE event_id IN ({', '.join('?' for _ in chunk)})", chunk
+                    )
+                )
+        finally:
+            conn.close()
+        return rows
+
+    def find_targets(self, campaigns: Sequence[HazardCampaign]) -> List[Dict[str, Any]]:
+        """Columnar targets for each campaign (see target_query), from one pass over the population."""
+        now_ms = int(time.time() * 1000)
+        since = [None if campaign.days is None else now_ms - int(campaign.days * 86400000) for campaign in campaigns]
+        hazard_types = sorted({hazard_type for campaign in campaigns for hazard_type in campaign.hazard_types})
+        min_severity = min((campaign.min_severity for campaign in campaigns), key=SEVERITY_LEVELS.index)
+        events = self.events(hazard_types, min_severity, None if None in since else min(since)) if campaigns else []
+        if not events:
+            return [self._result(campaign) for campaign in campaigns]
+
+        # The population is loaded and bucketed once for every campaign
+        people = PeopleGrid(self._load_people(campaigns, events), max(campaign.max_distance_km for campaign in campaigns))
+        max_distance = max(campaign.max_distance_km for campaign in campaigns)
+        person_index, event_index, distance = [], [], []
+        for i, event in enumerate(events):
+            candidates = people.near(event["latitude"], event["longitude"])
+            if not len(candidates):
+                continue
+            d = haversine_km(people.latitude[candidates], people.longitude[candidates], event["latitude"], event["longitude"])
+            within = d <= max_distance
+            person_index.append(candidates[within])
+            event_index.append(np.full(int(within.sum()), i, dtype=np.int64))
+            distance.append(d[within])
+        if not person_index:
+            return [self._result(campaign) for campaign in campaigns]
+        person_index, event_index, distance = np.concatenate(person_index), np.concatenate(event_index), np.concatenate(distance)
+
+        # Per-pair event attributes, then one scoring call per hazard type
+        event_type = np.array([event["hazard_type"] for event in events])[event_index]
+        event_severity = np.array([SEVERITY_LEVELS.index(event["severity"]) for event in events], dtype=np.int64)[event_index]
+        event_end = np.array(
+            [np.inf if event["end_ms"] is None else event["end_ms"] for event in events], dtype=float
+        )[event_index]
+        house_value = people.house_value[person_index]
+        uninsured = np.array([not person.get("has_insurance") for person in people.people], dtype=bool)[person_index]
+        risk = np.full(len(distance), 2, dtype=np.int8)
+        score = np.zeros(len(distance))
+        mmi = np.full(len(distance), np.nan)
+        for hazard_type in np.unique(event_type).tolist():
+            pairs = event_type == hazard_type
+            magnitude = depth = None
+            if hazard_type == "earthquake":
+                magnitude = np.array([np.nan if e["magnitude"] is None else e["magnitude"] for e in events])[event_index[pairs]]
+                depth = np.array([np.nan if e["depth"] is None else e["depth"] for e in events])[event_index[pairs]]
+            scores = score_hazard_pairs(hazard_type, distance[pairs], event_severity[pairs], house_value[pairs], magnitude, depth)
+            risk[pairs], score[pairs] = scores["risk"], scores["score"]
+            if "mmi" in scores:
+                mmi[pairs] = scores["mmi"]
+
+        targeted = np.unique(event_index).tolist()
+        earthquakes = self._earthquake_rows([events[i]["event_id"] for i in targeted if events[i]["hazard_type"] == "earthquake"])
+        # Per-event objects and fields, gathered per campaign by pair; earthquake targets keep the shape
+        # find_earthquake_ad_targets returns: the earthquake_events row, else the mirrored event with
+        # its time fields mapped back
+        hazards = object_array(events)
+        quakes = object_array([
+            (earthquakes.get(event["event_id"]) or {
+                **event,
+                "time": epoch_ms_to_iso(event["start_ms"]),
+                "time_ms": event["start_ms"],
+                "place": event["location"],
+            }) if event["hazard_type"] == "earthquake" else None
+            for event in events
+        ])
+        severities = object_array([event["severity"] for event in events])
+        quake_fields = {
+            key: object_array([None if quake is None else quake.get(key) for quake in quakes.tolist()])
+            for _, source, key in TARGET_COLUMNS if source == "earthquake"
+        }
+        is_quake = event_type == "earthquake"
+
+        results = []
+        for campaign, since_ms in zip(campaigns, since):
+            keep = (
+                np.isin(event_type, campaign.hazard_types)
+                & (event_severity >= SEVERITY_LEVELS.index(campaign.min_severity))
+                & (distance <= campaign.max_distance_km)
+                & (house_value >= campaign.min_house_value)
+            )
+            if campaign.require_uninsured:
+                keep &= uninsured
+            if since_ms is not None:
+                keep &= event_end >= since_ms
+            pairs = np.nonzero(keep)[0]
+            pair_people, pair_events = person_index[pairs], event_index[pairs]
+            # Columns are filled straight from the pair arrays; nested targets are built only for rows asked for
+            values = {
+                "distance_km": [round(d, 1) for d in distance[pairs].tolist()],
+                "risk_level": RISK_LEVELS[risk[pairs]].tolist(),
+                "risk_score": [round(value, 4) for value in score[pairs].tolist()],
+                "mmi": [round(m, 2) if quake else None for m, quake in zip(mmi[pairs].tolist(), is_quake[pairs].tolist())],
+                "hazard_type": event_type[pairs].tolist(),
+                "severity": severities[pair_events].tolist(),
+                "sequence_id": [None] * len(pairs),
+            }
+            for field, source, key in TARGET_COLUMNS:
+                if source == "person":
+                    values[field] = people.column(key)[pair_people].tolist()
+                elif source == "earthquake":
+                    values[field] = quake_fields[key][pair_events].tolist()
+            values["has_insurance"] = [bool(value) for value in values["has_insurance"]]
+            sources = {
+                "person": people.objects[pair_people].tolist(),
+                "hazard": hazards[pair_events].tolist(),
+                "earthquake": quakes[pair_events].tolist(),
+            }
+            results.append(self._result(campaign, {field: values[field] for field in TARGET_FIELDS}, sources))
+        return results
+
+    def _result(self, campaign: HazardCampaign, columns: Optional[Dict[str, List[Any]]] = None,
+                sources: Optional[Dict[str, List[Any]]] = None) -> Dict[str, Any]:
+        """Columnar result (see target_query) with the campaign's summary; no columns means no targets."""
+        if columns is None:
+            columns = {field: [] for field in TARGET_FIELDS}
+            sources = {"person": [], "hazard": [], "earthquake": []}
+        levels, hazard_types = columns["risk_level"], columns["hazard_type"]
+        summary = {
+            "total_targets": len(levels),
+            "high_risk_targets": levels.count("high"),
+            "medium_risk_targets": levels.count("medium"),
+            "low_risk_targets": levels.count("low"),
+            "by_hazard": {
+                hazard_type: count
+                for hazard_type in campaign.hazard_types
+                if (count := hazard_types.count(hazard_type))
+            },
+            "criteria": {
+                "hazard_types": list(campaign.hazard_types),
+                "min_severity": campaign.min_severity,
+                "max_distance_km": float(campaign.max_distance_km),
+                "min_house_value": float(campaign.min_house_value),
+                "require_uninsured": bool(campaign.require_uninsured),
+                "days": campaign.days,
+            },
+        }
+        return {"columns": columns, "sources": sources, "summary": summary}
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Load hazard events into the hazard store")
+    parser.add_argument("command", choices=["sync-earthquakes", "ingest-weather", "stats"])
+    parser.add_argument("path", nargs="?", help="JSON file of WeatherData records (ingest-weather)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args(argv)
+
+    store = HazardStore(args.db)
+    if args.command == "sync-earthquakes":
+        print(json.dumps(store.sync_earthquakes()))
+    elif args.command == "ingest-weather":
+        with open(args.path) as f:
+            records = json.load(f)
+        # Accept the weather API response as well as a bare list
+        print(f"Stored {store.ingest_weather(records.get('weatherEvents', []) if isinstance(records, dict) else records)} weather events")
+    else:
+        counts: Dict[str, int] = {}
+        for event in store.events():
+            counts[event["hazard_type"]] = counts.get(event["hazard_type"], 0) + 1
+        print(json.dumps(counts, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Background job runner for long targeting and batch generation work.
+Jobs run on a local worker pool and their status, progress and results are
+kept in a SQLite job table, so they survive page reloads and can be fetched
+by job id from any session.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+class JobProgress:
+    """Handle given to job handlers for reporting progress and checking cancellation."""
+
+    def __init__(self, store: "JobStore", job_id: str, min_interval: float = 0.25):
+        self.store = store
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.last_write = 0.0
+
+    def update(self, done: int, total: int, message: str = "", force: bool = False):
+        """Record progress; writes are throttled so tight loops don't hammer SQLite."""
+        now = time.monotonic()
+        if not force and done < total and now - self.last_write < self.min_interval:
+            return
+        self.last_write = now
+        self.store.update(self.job_id, done=done, total=total, message=message)
+
+    def check_cancelled(self):
+        if self.store.status(self.job_id) == CANCELLED:
+            raise JobCancelled(self.job_id)
+
+class JobStore:
+    """SQLite job table."""
+
+    def __init__(self, db_path: str = "db/jobs.db"):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                params TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+            self.conn.commit()
+
+    def create(self, kind: str, params: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, params, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), time.time())
+            )
+            self.conn.commit()
+        return job_id
+
+    def update(self, job_id: str, **fields: Any):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+            self.conn.commit()
+
+    def status(self, job_id: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job metadata and progress, without the (possibly large) result."""
+        with self.lock:
+            row = self.conn.execute('''
+            SELECT job_id, kind, status, done, total, message, params, error, created_at, started_at, finished_at
+            FROM jobs WHERE job_id = ?
+            ''', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"] or "{}")
+        job["progress"] = job["done"] / job["total"] if job["total"] else (1.0 if job["status"] == SUCCEEDED else 0.0)
+        return job
+
+    def result(self, job_id: str) -> Any:
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row["result"]) if row and row["result"] else None
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute('''
+            SELECT job_id, kind, status, done, total, message, created_at, finished_at
+            FROM jobs ORDER BY created_at DESC LIMIT ?
+            ''', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim_orphans(self) -> List[str]:
+        """Fail jobs left running by a dead process and return queued jobs to resubmit."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ?",
+                (FAILED, "Interrupted by restart", time.time(), RUNNING)
+            )
+            self.conn.commit()
+            rows = self.conn.execute("SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [row["job_id"] for row in rows]
+
+class JobRunner:
+    """Runs registered job handlers on a local worker pool."""
+
+    def __init__(self, db_path: str = "db/jobs.db", max_workers: int = 2):
+        self.store = JobStore(db_path)
+        self.handlers: Dict[str, Callable[[Dict[str, Any], JobProgress], Any]] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any], JobProgress], Any]):
+        """Register handler(params, progress) -> JSON-serializable result for a job kind."""
+        self.handlers[kind] = handler
+
+    def resume_queued(self) -> int:
+        """Resubmit jobs still queued from a previous process; call after registering handlers."""
+        job_ids = self.store.claim_orphans()
+        for job_id in job_ids:
+            job = self.store.get(job_id)
+            if job["kind"] in self.handlers:
+                self.executor.submit(self._run, job_id, job["kind"], job["params"])
+        return len(job_ids)
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.create(kind, params)
+        self.executor.submit(self._run, job_id, kind, params)
+        return job_id
+
+    def cancel(self, job_id: str):
+        """Request cancellation; handlers stop at their next check_cancelled()."""
+        if self.store.status(job_id) not in FINISHED_STATES:
+            self.store.update(job_id, status=CANCELLED, finished_at=time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def result(self, job_id: str) -> Any:
+        return self.store.result(job_id)
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.store.recent(limit)
+
+    def _run(self, job_id: str, kind: str, params: Dict[str, Any]):
+        if self.store.status(job_id) == CANCELLED:
+            return
+        self.store.update(job_id, status=RUNNING, started_at=time.time())
+        progress = JobProgress(self.store, job_id)
+        try:
+            result = self.handlers[kind](params, progress)
+        except JobCancelled:
+            return
+        except Exception as e:
+            self.store.update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            return
+        if self.store.status(job_id) != CANCELLED:
+            self.store.update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
@@ -0,0 +1,23 @@
+"""
+Deferred imports for heavy optional dependencies.
+lazy_module returns a module whose code runs on first attribute access, so a
+session only pays for google.generativeai, plotly or pandas once it actually
+generates email or draws a chart.
+"""
+
+import importlib.util
+import sys
+
+def lazy_module(name: str):
+    """Return module `name`, executing it on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
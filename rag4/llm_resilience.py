@@ -0,0 +1,296 @@
+"""
+Resilience layer for LLM calls made by the Streamlit app.
+Wraps provider calls with jittered exponential backoff, hedged duplicate
+requests for slow calls, and a circuit breaker that sheds load while the
+provider is degraded. Tail-latency and retry statistics are kept per campaign.
+"""
+
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional, Sequence
+
+# Exception class names (google.api_core and friends) that indicate a
+# transient provider problem worth retrying.
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "TooManyRequests",
+    "GatewayTimeout",
+    "Aborted",
+}
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls are being shed."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM provider circuit is open; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+def is_retryable(error: BaseException) -> bool:
+    """Return True if the error is a transient provider failure."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for the given attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in [0, 1]. None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+class LatencyWindow:
+    """Rolling window of recent latencies with percentile lookups."""
+
+    def __init__(self, size: int = 500):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile, q in [0, 1]. None when empty."""
+        with self.lock:
+            samples = list(self.samples)
+        return percentile(samples, q)
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        # While half-open, only the caller holding the probe gets through
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through."""
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def ready(self) -> bool:
+        """Whether allow() would currently let a call through (without claiming the probe)."""
+        with self.lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not (self.state == self.HALF_OPEN and self.probe_in_flight)
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed; in half-open state the first caller takes the probe."""
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self.probe_in_flight:
+                    return False
+                self.probe_in_flight = True
+            return True
+
+    def release_probe(self):
+        """End a probe that neither proved nor disproved provider health (e.g. a bad request)."""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.probe_in_flight = False
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def wait_until_closed(self, poll_interval: float = 0.5, timeout: Optional[float] = None) -> bool:
+        """Block a batch until the circuit lets calls through again."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(min(poll_interval, max(self.retry_after(), 0.01)))
+        return True
+
+@dataclass
+class CampaignCallStats:
+    calls: int = 0
+    successes: int = 0
+    failures: int = 0
+    retries: int = 0
+    hedges_sent: int = 0
+    hedges_won: int = 0
+    circuit_rejections: int = 0
+    latencies: LatencyWindow = field(default_factory=LatencyWindow)
+    # Counters are bumped from caller and hedge worker threads
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def count(self, *names: str):
+        """Increment the named counters by one."""
+        with self.lock:
+            for name in names:
+                setattr(self, name, getattr(self, name) + 1)
+
+    def summary(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        with self.lock:
+            counters = {
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "hedges_sent": self.hedges_sent,
+                "hedges_won": self.hedges_won,
+                "circuit_rejections": self.circuit_rejections,
+            }
+        return {
+            **counters,
+            "p50_latency_ms": ms(self.latencies.percentile(0.50)),
+            "p95_latency_ms": ms(self.latencies.percentile(0.95)),
+            "p99_latency_ms": ms(self.latencies.percentile(0.99)),
+        }
+
+class ResilientCaller:
+    """Runs provider calls with retries, hedging and a shared circuit breaker."""
+
+    def __init__(
+        self,
+        retry_policy: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_percentile: float = 0.95,
+        min_hedge_samples: int = 20,
+        min_hedge_delay: float = 1.0,
+        max_workers: int = 8,
+    ):
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.latencies = LatencyWindow()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self.stats: Dict[str, CampaignCallStats] = {}
+        self.stats_lock = threading.Lock()
+
+    def stats_for(self, campaign: str) -> CampaignCallStats:
+        with self.stats_lock:
+            if campaign not in self.stats:
+                self.stats[campaign] = CampaignCallStats()
+            return self.stats[campaign]
+
+    def campaign_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Summaries of call statistics keyed by campaign."""
+        with self.stats_lock:
+            campaigns = dict(self.stats)
+        return {name: stats.summary() for name, stats in campaigns.items()}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Latency after which a duplicate request is sent, or None to disable."""
+        if len(self.latencies) < self.min_hedge_samples:
+            return None
+        tail = self.latencies.percentile(self.hedge_percentile)
+        return max(self.min_hedge_delay, tail)
+
+    def _call_hedged(self, fn: Callable[[], Any], stats: CampaignCallStats) -> Any:
+        primary = self.executor.submit(fn)
+        delay = self.hedge_delay()
+        if delay is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        stats.count("hedges_sent")
+        hedge = self.executor.submit(fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        stats.count("hedges_won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, fn: Callable[[], Any], campaign: str = "default") -> Any:
+        """Call fn with retries, hedging and circuit breaking; returns its result."""
+        stats = self.stats_for(campaign)
+        stats.count("calls")
+
+        if not self.breaker.allow():
+            stats.count("circuit_rejections")
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        for attempt in range(self.retry_policy.max_attempts):
+            start = time.monotonic()
+            try:
+                result = self._call_hedged(fn, stats)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The provider answered, so this says nothing about its health
+                    self.breaker.release_probe()
+                    stats.count("failures")
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.retry_policy.max_attempts - 1:
+                    stats.count("failures")
+                    raise
+                if not self.breaker.allow():
+                    stats.count("failures", "circuit_rejections")
+                    raise CircuitOpenError(self.breaker.retry_after()) from e
+                stats.count("retries")
+                time.sleep(self.retry_policy.backoff(attempt))
+                continue
+
+            elapsed = time.monotonic() - start
+            self.latencies.add(elapsed)
+            stats.latencies.add(elapsed)
+            stats.count("successes")
+            self.breaker.record_success()
+            return result
@@ -3,16 +3,116 @@ Local MCP client for communicating with the earthquake marketing MCP server.
 This allows Streamlit to interact with the MCP server locally.
 """
 
+import abc
 import asyncio
+import importlib.util
 import json
+import urllib.parse
 import subprocess
 import threading
 import time
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 import queue
+import sqlite3
 import sys
 import os
+from collections import OrderedDict
+
+from earthquake_queries import EarthquakeQueries
+from lazy_import import lazy_module
+from place_parser import normalize_region
+from result_store import ResultExpired, ResultStore
+
+# The numpy-backed engines load when a request first needs them, not when the app starts
+aftershock_sequences = lazy_module("aftershock_sequences")
+aggregates = lazy_module("aggregates")
+earthquake_partitions = lazy_module("earthquake_partitions")
+exposure_raster = lazy_module("exposure_raster")
+geo_regions = lazy_module("geo_regions")
+hazard_store = lazy_module("hazard_store")
+risk_scoring = lazy_module("risk_model")
+target_query = lazy_module("target_query")
+targeting_engine = lazy_module("targeting_engine")
+
+# SQLite database written by setup_database.py and read by the RAG server
+DEFAULT_DB_PATH = os.path.join("db", "earthquake_rag.db")
+
+def database_version(db_path: str = DEFAULT_DB_PATH, partition_dir: Optional[str] = None) -> str:
+    """Cheap version key for cached data: changes whenever the database or partition files change."""
+    partition_dir = partition_dir or earthquake_partitions.DEFAULT_PARTITION_DIR
+    parts = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+            parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            parts.append("-")
+    try:
+        # Newest partition write, plus the count so compaction also changes the key
+        entries = [entry.stat() for entry in os.scandir(partition_dir) if entry.is_file()]
+        parts.append(f"{max((e.st_mtime_ns for e in entries), default=0)}:{len(entries)}")
+    except OSError:
+        pass
+    return "/".join(parts)
+
+# Results over a rolling "last N days" window are recomputed at least this often, even without new data
+WINDOW_BUCKET_SECONDS = 60 * 60
+
+def window_bucket(now: Optional[float] = None) -> int:
+    """Current time bucket; cache keys of rolling-window results include it so the window advances."""
+    return int((now if now is not None else time.time()) // WINDOW_BUCKET_SECONDS)
+
+# Serialized dashboard aggregates kept (one per resource URI of the latest data)
+MAX_CACHED_AGGREGATES = 64
+
+# Earthquake cluster indexes kept (one per days/min_mag query of the latest data)
+MAX_CACHED_CLUSTER_INDEXES = 4
+
+# Materialized target sets kept for incremental refresh, one per criteria
+MAX_TARGETING_ENGINES = 4
+
+# Individual changes listed in a refresh_targets response
+MAX_REPORTED_CHANGES = 50
+
+def parse_bbox(value: Optional[str]) -> Optional[List[float]]:
+    """Parse a "south,west,north,east" bounding box query parameter."""
+    if not value:
+        return None
+    bbox = [float(part) for part in value.split(",")]
+    if len(bbox) != 4:
+        raise ValueError(f"bbox needs south,west,north,east: {value}")
+    return bbox
+
+def parse_region(value: Any) -> Optional["geo_regions.PreparedRegion"]:
+    """Prepared (cached) region for a GeoJSON object or string argument, if one was given."""
+    return geo_regions.prepare_region(value) if value else None
+
+def region_key(region: Optional["geo_regions.PreparedRegion"]) -> Optional[str]:
+    return region.key if region is not None else None
+
+def hazard_campaign(arguments: Dict[str, Any]) -> "hazard_store.HazardCampaign":
+    """Campaign criteria from find_hazard_targets arguments; hazard_type may be one type or a list."""
+    hazard_types = arguments.get("hazard_type", list(hazard_store.HAZARD_TYPES))
+    return hazard_store.HazardCampaign(
+        hazard_types=tuple([hazard_types] if isinstance(hazard_types, str) else hazard_types),
+        min_severity=arguments.get("min_severity", "light"),
+        max_distance_km=float(arguments.get("max_distance_km", 100)),
+        min_house_value=float(arguments.get("min_house_value", 100000)),
+        require_uninsured=bool(arguments.get("require_uninsured", True)),
+        days=arguments.get("days")
+    )
+
+def parse_query_params(uri: str) -> Dict[str, str]:
+    """Parse the query string of a resource URI into a dict."""
+    params = {}
+    if "?" in uri:
+        query_string = uri.split("?", 1)[1]
+        for param in query_string.split("&"):
+            if "=" in param:
+                key, value = param.split("=", 1)
+                params[key] = urllib.parse.unquote_plus(value)
+    return params
 
 @dataclass
 class MCPResource:
@@ -27,15 +127,575 @@ class MCPTool:
     description: str
     input_schema: Dict[str, Any]
 
-class LocalMCPClient:
+class ClientTargetingLayer(abc.ABC):
+    """
+    Targeting layer shared by both MCP clients.
+    Result handles, paging, dashboard aggregates, map clusters and incremental,
+    region and hazard targeting run here, on top of the server's raw
+    find_targets and earthquakes/recent results and the local database, so the
+    app gets the same resources and tools whichever client is connected.
+    Subclasses supply the raw server access.
+    """
+    
+    def __init__(self):
+        # Targeting results live here under handles; sessions keep only the handle
+        self.results = ResultStore()
+        self.aggregate_cache = OrderedDict()
+        self.aggregate_cache_lock = threading.Lock()
+        self.cluster_indexes = OrderedDict()
+        self.cluster_indexes_lock = threading.Lock()
+        self.targeting_engines = OrderedDict()
+        self.targeting_engines_lock = threading.Lock()
+        self.queries = EarthquakeQueries(DEFAULT_DB_PATH)
+        self.partitions = earthquake_partitions.EarthquakePartitions(earthquake_partitions.DEFAULT_PARTITION_DIR)
+        self.exposure = exposure_raster.ExposureRaster(exposure_raster.DEFAULT_RASTER_DIR)
+        self.exposure_version = None
+        self.exposure_lock = threading.Lock()
+        # (data version, latitudes, longitudes) of demographic homes
+        self.home_coordinates = None
+        # Hazard store with earthquakes mirrored as of hazards_version
+        self.hazards = None
+        self.hazards_version = None
+        self.hazards_lock = threading.Lock()
+    
+    @property
+    def db_path(self) -> str:
+        """SQLite database the server reads."""
+        return DEFAULT_DB_PATH
+    
+    def data_version(self) -> str:
+        """Version key for caching data read from the server."""
+        return database_version(self.db_path)
+    
+    @abc.abstractmethod
+    def _server_resources(self) -> List[MCPResource]:
+        """Resources the server itself provides."""
+    
+    @abc.abstractmethod
+    def _server_read_resource(self, uri: str) -> Optional[str]:
+        """Read a resource from the server itself."""
+    
+    @abc.abstractmethod
+    def _server_tools(self) -> List[MCPTool]:
+        """Tools the server itself provides."""
+    
+    @abc.abstractmethod
+    def _server_call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        """Call a tool on the server itself."""
+    
+    def _server_statistics(self) -> Dict[str, Any]:
+        """The server's stats/overview."""
+        text = self._server_read_resource("stats/overview")
+        if text is None:
+            raise RuntimeError("Server returned no statistics")
+        return json.loads(text)
+    
+    def _server_recent_earthquakes(self, days: float, min_magnitude: float) -> List[Dict[str, Any]]:
+        """The server's earthquakes/recent list."""
+        text = self._server_read_resource(f"earthquakes/recent?days={days:g}&min_mag={min_magnitude:g}")
+        if text is None:
+            raise RuntimeError("Server returned no earthquakes")
+        return json.loads(text)
+    
+    def _server_find_targets(self, min_magnitude: float, max_distance_km: float, min_house_value: float,
+                             require_uninsured: bool) -> Dict[str, Any]:
+        """The server's nested find_targets result ({"targets", "summary"}) for the four base criteria."""
+        result = json.loads(self._server_call_tool("find_targets", {
+            "min_magnitude": min_magnitude,
+            "max_distance_km": max_distance_km,
+            "min_house_value": min_house_value,
+            "require_uninsured": require_uninsured
+        }))
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result
+    
+    def list_resources(self) -> List[MCPResource]:
+        """List the server's resources plus the ones served by this layer."""
+        resources = self._server_resources()
+        uris = {resource.uri for resource in resources}
+        return resources + [
+            resource for resource in [
+                MCPResource("stats/overview", "Statistics Overview", "Earthquake and demographic statistics"),
+                MCPResource("earthquakes/recent", "Recent Earthquakes", "Recent earthquake events"),
+                MCPResource("exposure/lookup", "Exposure Lookup", "Max shaking, felt event count and last event time at coordinates"),
+                MCPResource("stats/regions", "Regional Statistics", "Earthquake counts and largest magnitude per region"),
+                MCPResource("targets/preview", "Target Preview", "Preview of potential campaign targets"),
+                MCPResource("targets/page", "Target Page", "One sorted, filtered page of campaign targets"),
+                MCPResource("targets/get", "Target", "One target of a stored result by index"),
+                MCPResource("targets/ranked", "Top Targets", "Highest-risk, closest targets of a stored result"),
+                MCPResource("earthquakes/aggregate", "Earthquake Aggregates", "Magnitude bins, daily counts or clustered map points"),
+                MCPResource("earthquakes/clusters", "Earthquake Map Markers", "Clustered earthquake markers for a zoom level and bounding box"),
+                MCPResource("targets/clusters", "Target Map Markers", "Clustered target home markers for a zoom level and bounding box")
+            ]
+            if resource.uri not in uris
+        ]
+    
+    def read_resource(self, uri: str) -> Optional[str]:
+        """Read a resource, serving handles, pages and aggregates here and the rest from the server."""
+        try:
+            if uri == "stats/overview":
+                stats = self._server_statistics()
+                time_store = self._time_store()
+                if time_store is not None and "earthquake_stats" in stats:
+                    # Index seek on time_ms instead of comparing ISO strings per row
+                    stats["earthquake_stats"]["recent_earthquakes_7_days"] = time_store.count_since(days=7)
+                exposure = self._exposure_raster()
+                if exposure is not None:
+                    # One cell read per home against the precomputed shaking grid
+                    latitude, longitude = self._demographic_coordinates()
+                    stats["exposure_stats"] = exposure.stats(latitude, longitude)
+                return json.dumps(stats, indent=2)
+            elif uri.startswith("exposure/lookup"):
+                params = parse_query_params(uri)
+                exposure = self._exposure_raster()
+                if exposure is None:
+                    return json.dumps({"error": "Exposure raster not built"})
+                cells = exposure.lookup(
+                    [float(value) for value in params["lat"].split(",")],
+                    [float(value) for value in params["lon"].split(",")]
+                )
+                return json.dumps({name: values.tolist() for name, values in cells.items()})
+            elif uri.startswith("stats/regions") and self.queries.available():
+                params = parse_query_params(uri)
+                # GROUP BY over the parsed place_region column, no place-string parsing per row
+                return json.dumps(self.queries.region_counts(
+                    days=float(params.get("days", 7)),
+                    min_magnitude=float(params["min_mag"]) if "min_mag" in params else None
+                ), indent=2)
+            elif uri.startswith("earthquakes/aggregate"):
+                return self._earthquake_aggregate(uri)
+            elif uri.startswith("earthquakes/clusters"):
+                params = parse_query_params(uri)
+                index = self._earthquake_cluster_index(
+                    days=float(params.get("days", 7)),
+                    min_magnitude=float(params.get("min_mag", 3.0))
+                )
+                return json.dumps(index.markers(
+                    int(params.get("zoom", 5)),
+                    bbox=parse_bbox(params.get("bbox")),
+                    max_markers=int(params.get("limit", aggregates.MAX_MAP_MARKERS))
+                ))
+            elif uri.startswith("targets/clusters"):
+                params = parse_query_params(uri)
+                view = self._target_view(params)
+                return json.dumps(view.cluster_index().markers(
+                    int(params.get("zoom", 5)),
+                    bbox=parse_bbox(params.get("bbox")),
+                    max_markers=int(params.get("limit", aggregates.MAX_MAP_MARKERS))
+                ))
+            elif uri.startswith("earthquakes/recent"):
+                params = parse_query_params(uri)
+                if params.get("region") and self.queries.available():
+                    # Region filters are a (place_region, time_ms) index range scan
+                    return json.dumps(self.queries.recent(
+                        days=float(params.get("days", 7)),
+                        min_magnitude=float(params.get("min_mag", 3.0)),
+                        # Same spelling as the parsed place_region column ("CA" -> "California")
+                        region=normalize_region(params["region"])
+                    ), indent=2)
+                earthquakes = self._recent_earthquakes(
+                    days=float(params.get("days", 7)),
+                    min_magnitude=float(params.get("min_mag", 3.0))
+                )
+                return json.dumps(earthquakes, indent=2)
+            elif uri.startswith("targets/page"):
+                params = parse_query_params(uri)
+                view = self._target_view(params)
+                page = view.query(
+                    offset=int(params.get("offset", 0)),
+                    limit=int(params.get("limit", 50)),
+                    sort_by=params.get("sort") or None,
+                    descending=params.get("desc", "false").lower() == "true",
+                    risk_levels=[r for r in params.get("risk", "").split(",") if r] or None,
+                    search=params.get("q") or None,
+                    result_format=params.get("format", "rows")
+                )
+                return json.dumps(page)
+            elif uri.startswith("targets/get"):
+                params = parse_query_params(uri)
+                view = self._target_view(params)
+                return json.dumps(view.target(int(params["index"])))
+            elif uri.startswith("targets/ranked"):
+                params = parse_query_params(uri)
+                view = self._target_view(params)
+                return json.dumps(view.ranked(int(params.get("limit", 10))))
+            return self._server_read_resource(uri)
+        except ResultExpired as e:
+            return json.dumps({"error": f"Result handle expired: {e.args[0]}", "expired": True})
+        except Exception as e:
+            print(f"Error reading resource: {e}")
+            return None
+    
+    def list_tools(self) -> List[MCPTool]:
+        """List the tools served by this layer plus any other tools the server has."""
+        tools = [
+            MCPTool(
+                name="find_targets",
+                description="Find people who should be targeted for earthquake insurance ads",
+                input_schema={
+                    "type": "object",
+                    "properties": {
+                        "min_magnitude": {"type": "number", "default": 3.5},
+                        "max_distance_km": {"type": "number", "default": 100},
+                        "min_house_value": {"type": "number", "default": 500000},
+                        "require_uninsured": {"type": "boolean", "default": True},
+                        "per_sequence": {"type": "boolean", "default": False},
+                        "risk_model": {"type": "string", "enum": list(risk_scoring.RISK_MODELS), "default": risk_scoring.DEFAULT_RISK_MODEL},
+                        "quake_region": {"type": ["object", "string"], "description": "GeoJSON (Multi)Polygon, Feature or FeatureCollection earthquakes must fall in"},
+                        "people_region": {"type": ["object", "string"], "description": "GeoJSON (Multi)Polygon, Feature or FeatureCollection homes must fall in"},
+                        "result_format": {"type": "string", "enum": ["nested", "columns", "arrow", "handle"], "default": "nested"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="refresh_targets",
+                description="Update a materialized target set with earthquakes ingested since the last refresh",
+                input_schema={
+                    "type": "object",
+                    "properties": {
+                        "min_magnitude": {"type": "number", "default": 3.5},
+                        "max_distance_km": {"type": "number", "default": 100},
+                        "min_house_value": {"type": "number", "default": 500000},
+                        "require_uninsured": {"type": "boolean", "default": True},
+                        "per_sequence": {"type": "boolean", "default": False},
+                        "risk_model": {"type": "string", "enum": list(risk_scoring.RISK_MODELS), "default": risk_scoring.DEFAULT_RISK_MODEL},
+                        "quake_region": {"type": ["object", "string"], "description": "GeoJSON region earthquakes must fall in"},
+                        "people_region": {"type": ["object", "string"], "description": "GeoJSON region homes must fall in"},
+                        "days": {"type": "number", "description": "Only target events from the last N days (default: every stored event)"},
+                        "since_handle": {"type": "string", "description": "Report the delta against this stored result instead of the last refresh"}
+                    }
+                }
+            ),
+            MCPTool(
+                name="find_hazard_targets",
+                description="Find people to target for earthquake or weather (storm, flood, cyclone, rain, heatwave) insurance campaigns",
+                input_schema={
+                    "type": "object",
+                    "properties": {
+                        "hazard_type": {
+                            "type": ["string", "array"],
+                            "items": {"type": "string", "enum": list(hazard_store.HAZARD_TYPES)},
+                            "default": list(hazard_store.HAZARD_TYPES)
+                        },
+                        "min_severity": {"type": "string", "enum": list(hazard_store.SEVERITY_LEVELS), "default": "light"},
+                        "max_distance_km": {"type": "number", "default": 100},
+                        "min_house_value": {"type": "number", "default": 100000},
+                        "require_uninsured": {"type": "boolean", "default": True},
+                        "days": {"type": "number", "description": "Only events active in the last N days"},
+                        "campaigns": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "Several campaigns (each with the criteria above), served by one pass over the population"
+                        }
+                    }
+                }
+            )
+        ]
+        names = {tool.name for tool in tools}
+        return tools + [tool for tool in self._server_tools() if tool.name not in names]
+    
+    def _target_handle(self, min_magnitude: float, max_distance_km: float, min_house_value: float, require_uninsured: bool,
+                       per_sequence: bool = False, risk_model: Optional[str] = None,
+                       quake_region: Optional["geo_regions.PreparedRegion"] = None,
+                       people_region: Optional["geo_regions.PreparedRegion"] = None) -> str:
+        """Handle of the targeting result for the criteria, computed once per data version."""
+        risk_model = risk_model or risk_scoring.DEFAULT_RISK_MODEL
+        if risk_model not in risk_scoring.RISK_MODELS:
+            raise ValueError(f"Unknown risk model: {risk_model}")
+        key = (
+            float(min_magnitude), float(max_distance_km), float(min_house_value), bool(require_uninsured),
+            bool(per_sequence), risk_model, region_key(quake_region), region_key(people_region), self.data_version()
+        )
+        handle = self.results.find(key)
+        if handle is not None:
+            return handle
+        
+        if quake_region is not None or people_region is not None:
+            # Region campaigns run on the local engine: people outside the region are never scored
+            engine = self._targeting_engine(*key[:4], risk_model, quake_region, people_region)
+            engine.sync(self.data_version())
+            result = engine.result()
+        else:
+            result = self._server_find_targets(
+                min_magnitude=key[0],
+                max_distance_km=key[1],
+                min_house_value=key[2],
+                require_uninsured=key[3]
+            )
+        if risk_model == "attenuation" and result["summary"].get("risk_model") != "attenuation":
+            # Shaking intensity from magnitude and hypocentral distance replaces the step function
+            result = risk_scoring.rescore_targets(result)
+        if per_sequence:
+            # One target per person and aftershock sequence instead of per event
+            targets = target_query.nested_targets(result)
+            sequence_of = aftershock_sequences.sequence_ids_for(
+                [target["earthquake"].get("event_id") for target in targets], self.db_path
+            )
+            result = aftershock_sequences.one_target_per_sequence({"targets": targets, "summary": result["summary"]}, sequence_of)
+        return self.results.put(target_query.TargetResultView(result), key=key)
+    
+    def _target_view(self, params: Dict[str, str]) -> "target_query.TargetResultView":
+        """Targeting result named by a handle= parameter, or computed from the criteria parameters."""
+        if params.get("handle"):
+            return self.results.get(params["handle"])
+        return self.results.get(self._target_handle(
+            min_magnitude=float(params.get("min_mag", 3.5)),
+            max_distance_km=float(params.get("max_km", 100)),
+            min_house_value=float(params.get("min_value", 500000)),
+            require_uninsured=params.get("uninsured", "true").lower() == "true",
+            per_sequence=params.get("per_sequence", "false").lower() == "true",
+            risk_model=params.get("risk_model")
+        ))
+    
+    def _targeting_engine(self, min_magnitude: float, max_distance_km: float, min_house_value: float,
+                          require_uninsured: bool, risk_model: str, quake_region: Optional["geo_regions.PreparedRegion"] = None,
+                          people_region: Optional["geo_regions.PreparedRegion"] = None,
+                          days: Optional[float] = None) -> "targeting_engine.TargetingEngine":
+        """Materialized targets for the criteria; built (a full run) on first use, then kept current by sync()."""
+        key = (
+            float(min_magnitude), float(max_distance_km), float(min_house_value), bool(require_uninsured), risk_model,
+            region_key(quake_region), region_key(people_region), None if days is None else float(days)
+        )
+        with self.targeting_engines_lock:
+            engine = self.targeting_engines.get(key)
+            if engine is None:
+                engine = targeting_engine.TargetingEngine(
+                    *key[:4],
+                    risk_model=risk_model,
+                    db_path=self.db_path,
+                    quake_region=quake_region,
+                    people_region=people_region,
+                    days=days
+                )
+                self.targeting_engines[key] = engine
+                while len(self.targeting_engines) > MAX_TARGETING_ENGINES:
+                    self.targeting_engines.popitem(last=False)
+            self.targeting_engines.move_to_end(key)
+        return engine
+    
+    def _refresh_targets(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Sync the criteria's target set with new events; returns a handle to it and the delta.
+
+        The delta is against the result named by since_handle when that is still stored,
+        else against the engine's previous sync ("delta_since" says which).
+        """
+        risk_model = arguments.get("risk_model") or risk_scoring.DEFAULT_RISK_MODEL
+        per_sequence = arguments.get("per_sequence", False)
+        engine = self._targeting_engine(
+            min_magnitude=arguments.get("min_magnitude", 3.5),
+            max_distance_km=arguments.get("max_distance_km", 100),
+            min_house_value=arguments.get("min_house_value", 500000),
+            require_uninsured=arguments.get("require_uninsured", True),
+            risk_model=risk_model,
+            quake_region=parse_region(arguments.get("quake_region")),
+            people_region=parse_region(arguments.get("people_region")),
+            days=arguments.get("days")
+        )
+        delta = engine.sync(self.data_version())
+        key = (
+            "incremental", *engine.criteria.values(), bool(per_sequence), risk_model,
+            region_key(engine.quake_region), region_key(engine.people_region), engine.days, engine.version
+        )
+        handle = self.results.find(key)
+        if handle is None:
+            result = engine.result()
+            if per_sequence:
+                targets = target_query.nested_targets(result)
+                sequence_of = aftershock_sequences.sequence_ids_for(
+                    [target["earthquake"].get("event_id") for target in targets], engine.db_path
+                )
+                result = aftershock_sequences.one_target_per_sequence({"targets": targets, "summary": result["summary"]}, sequence_of)
+            handle = self.results.put(target_query.TargetResultView(result), key=key)
+        delta_since = "last_refresh"
+        if arguments.get("since_handle"):
+            try:
+                previous = self.results.get(arguments["since_handle"])
+            except ResultExpired:
+                previous = None
+            if previous is not None:
+                delta = targeting_engine.diff_targets(previous.targets, self.results.get(handle).targets)
+                delta.events = len({
+                    target["earthquake"].get("event_id") for target in delta.added + delta.changed + delta.removed
+                })
+                delta_since = "since_handle"
+        changes = [
+            {
+                "change": change,
+                "person_id": target["person"].get("person_id"),
+                "event_id": target["earthquake"].get("event_id"),
+                "risk_level": target["risk_level"],
+                "distance_km": target["distance_km"]
+            }
+            for change, targets in (("added", delta.added), ("changed", delta.changed), ("removed", delta.removed))
+            for target in targets
+        ]
+        return {
+            "handle": handle,
+            "summary": self.results.get(handle).summary,
+            "expires_in": self.results.expires_in(handle),
+            "delta": delta.summary(),
+            "delta_since": delta_since,
+            "changes": changes[:MAX_REPORTED_CHANGES]
+        }
+    
+    def _hazard_store(self) -> "hazard_store.HazardStore":
+        """Hazard store with earthquakes ingested since the last data version mirrored in."""
+        version = self.data_version()
+        with self.hazards_lock:
+            if self.hazards is None:
+                self.hazards = hazard_store.HazardStore(self.db_path)
+            if self.hazards_version != version:
+                self.hazards.sync_earthquakes()
+                # Mirroring writes to the database, so take the version after it
+                self.hazards_version = self.data_version()
+        return self.hazards
+    
+    def _hazard_targets(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Handles and summaries of one or more hazard campaigns; uncached ones share one population pass."""
+        campaigns = [hazard_campaign(campaign) for campaign in arguments.get("campaigns") or [arguments]]
+        hazards = self._hazard_store()
+        keys = [("hazard", campaign, self.hazards_version) for campaign in campaigns]
+        handles = [self.results.find(key) for key in keys]
+        missing = [i for i, handle in enumerate(handles) if handle is None]
+        if missing:
+            for i, result in zip(missing, hazards.find_targets([campaigns[i] for i in missing])):
+                handles[i] = self.results.put(target_query.TargetResultView(result), key=keys[i])
+        return {
+            "campaigns": [
+                {"handle": handle, "summary": self.results.get(handle).summary, "expires_in": self.results.expires_in(handle)}
+                for handle in handles
+            ]
+        }
+    
+    def _exposure_raster(self) -> Optional["exposure_raster.ExposureRaster"]:
+        """Exposure raster with events ingested since the last data version burned in; None before setup built it."""
+        if not self.exposure.available():
+            return None
+        version = self.data_version()
+        with self.exposure_lock:
+            if self.exposure_version != version:
+                self.exposure.sync(self.db_path)
+                self.exposure_version = version
+        return self.exposure
+    
+    def _demographic_coordinates(self):
+        """Home coordinates of everyone in demographics, read once per data version."""
+        version = self.data_version()
+        if self.home_coordinates is None or self.home_coordinates[0] != version:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                rows = conn.execute(
+                    "SELECT latitude, longitude FROM demographics WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+                ).fetchall()
+            finally:
+                conn.close()
+            self.home_coordinates = (version, [row[0] for row in rows], [row[1] for row in rows])
+        return self.home_coordinates[1], self.home_coordinates[2]
+    
+    def _time_store(self):
+        """Store for time-window reads: month partitions, else the migrated events table, else None."""
+        if self.partitions.available():
+            return self.partitions
+        if self.queries.available():
+            return self.queries
+        return None
+    
+    def _recent_earthquakes(self, days: float, min_magnitude: float) -> List[Dict[str, Any]]:
+        """Recent events by range scan on time_ms, reading only the partitions the window touches."""
+        time_store = self._time_store()
+        if time_store is not None:
+            return time_store.recent(days=days, min_magnitude=min_magnitude)
+        return self._server_recent_earthquakes(days=days, min_magnitude=min_magnitude)
+    
+    def _earthquake_aggregate(self, uri: str) -> str:
+        """Serialized dashboard aggregate for an earthquakes/aggregate URI, once per data version and time bucket."""
+        # Aggregates change with the data and as the days window moves on
+        key = (uri, self.data_version(), window_bucket())
+        with self.aggregate_cache_lock:
+            if key in self.aggregate_cache:
+                self.aggregate_cache.move_to_end(key)
+                return self.aggregate_cache[key]
+        
+        params = parse_query_params(uri)
+        earthquakes = self._recent_earthquakes(
+            days=float(params.get("days", 7)),
+            min_magnitude=float(params.get("min_mag", 3.0))
+        )
+        text = json.dumps(aggregates.dashboard_aggregate(
+            earthquakes,
+            params.get("kind", "magnitude_bins"),
+            zoom=int(params.get("zoom", 5))
+        ))
+        with self.aggregate_cache_lock:
+            self.aggregate_cache[key] = text
+            while len(self.aggregate_cache) > MAX_CACHED_AGGREGATES:
+                self.aggregate_cache.popitem(last=False)
+        return text
+    
+    def _earthquake_cluster_index(self, days: float, min_magnitude: float) -> "aggregates.ClusterIndex":
+        """Cluster index of recent earthquakes, precomputed once per data version and time bucket."""
+        key = (days, min_magnitude, self.data_version(), window_bucket())
+        with self.cluster_indexes_lock:
+            if key in self.cluster_indexes:
+                self.cluster_indexes.move_to_end(key)
+                return self.cluster_indexes[key]
+        
+        index = aggregates.ClusterIndex.from_events(self._recent_earthquakes(days=days, min_magnitude=min_magnitude))
+        with self.cluster_indexes_lock:
+            self.cluster_indexes[key] = index
+            while len(self.cluster_indexes) > MAX_CACHED_CLUSTER_INDEXES:
+                self.cluster_indexes.popitem(last=False)
+        return index
+    
+    def call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        """Call a tool; targeting tools run here over the server's raw results."""
+        try:
+            if name == "find_targets":
+                handle = self._target_handle(
+                    min_magnitude=arguments.get("min_magnitude", 3.5),
+                    max_distance_km=arguments.get("max_distance_km", 100),
+                    min_house_value=arguments.get("min_house_value", 500000),
+                    require_uninsured=arguments.get("require_uninsured", True),
+                    per_sequence=arguments.get("per_sequence", False),
+                    risk_model=arguments.get("risk_model"),
+                    quake_region=parse_region(arguments.get("quake_region")),
+                    people_region=parse_region(arguments.get("people_region"))
+                )
+                view = self.results.get(handle)
+                result_format = arguments.get("result_format", "nested")
+                if result_format == "handle":
+                    # The result stays on the server; callers page through it by handle
+                    return json.dumps({
+                        "handle": handle,
+                        "summary": view.summary,
+                        "expires_in": self.results.expires_in(handle)
+                    })
+                if result_format != "nested":
+                    # Columnar results skip per-target JSON objects entirely
+                    return json.dumps(view.export(result_format))
+                return json.dumps({"targets": view.targets, "summary": view.summary}, indent=2)
+            elif name == "refresh_targets":
+                return json.dumps(self._refresh_targets(arguments))
+            elif name == "find_hazard_targets":
+                return json.dumps(self._hazard_targets(arguments))
+            else:
+                return self._server_call_tool(name, arguments)
+        except Exception as e:
+            return json.dumps({"error": str(e)})
+
+class LocalMCPClient(ClientTargetingLayer):
     """Local MCP client that communicates with the earthquake marketing server."""
     
     def __init__(self, server_script_path: str = "earthquake_marketing_mcp.py"):
+        super().__init__()
         self.server_script_path = server_script_path
         self.process = None
         self.request_id = 0
         self.response_queue = queue.Queue()
         self.is_connected = False
+        # One stdio pipe is shared by every session using this client
+        self.request_lock = threading.Lock()
         
     def start_server(self) -> bool:
         """Start the MCP server process."""
@@ -78,22 +738,23 @@ class LocalMCPClient:
         if not self.is_connected or not self.process:
             raise Exception("MCP server not connected")
         
-        self.request_id += 1
-        request = {
-            "jsonrpc": "2.0",
-            "id": self.request_id,
-            "method": method,
-            "params": params or {}
-        }
-        
         try:
-            # Send request
-            request_json = json.dumps(request) + "\n"
-            self.process.stdin.write(request_json)
-            self.process.stdin.flush()
-            
-            # Read response
-            response_line = self.process.stdout.readline()
+            with self.request_lock:
+                self.request_id += 1
+                request = {
+                    "jsonrpc": "2.0",
+                    "id": self.request_id,
+                    "method": method,
+                    "params": params or {}
+                }
+                
+                # Send request
+                request_json = json.dumps(request) + "\n"
+                self.process.stdin.write(request_json)
+                self.process.stdin.flush()
+                
+                # Read response
+                response_line = self.process.stdout.readline()
             if not response_line:
                 raise Exception("No response from server")
             
@@ -108,8 +769,8 @@ class LocalMCPClient:
             print(f"MCP request failed: {e}")
             raise
     
-    def list_resources(self) -> List[MCPResource]:
-        """List all available resources."""
+    def _server_resources(self) -> List[MCPResource]:
+        """List the server's resources."""
         try:
             result = self._send_request("resources/list")
             resources = []
@@ -126,20 +787,16 @@ class LocalMCPClient:
             print(f"Failed to list resources: {e}")
             return []
     
-    def read_resource(self, uri: str) -> Optional[str]:
-        """Read a specific resource."""
-        try:
-            result = self._send_request("resources/read", {"uri": uri})
-            contents = result.get("contents", [])
-            if contents and len(contents) > 0:
-                return contents[0].get("text", "")
-            return None
-        except Exception as e:
-            print(f"Failed to read resource {uri}: {e}")
-            return None
+    def _server_read_resource(self, uri: str) -> Optional[str]:
+        """Read a resource from the server."""
+        result = self._send_request("resources/read", {"uri": uri})
+        contents = result.get("contents", [])
+        if contents and len(contents) > 0:
+            return contents[0].get("text", "")
+        return None
     
-    def list_tools(self) -> List[MCPTool]:
-        """List all available tools."""
+    def _server_tools(self) -> List[MCPTool]:
+        """List the server's tools."""
         try:
             result = self._send_request("tools/list")
             tools = []
@@ -156,8 +813,8 @@ class LocalMCPClient:
             print(f"Failed to list tools: {e}")
             return []
     
-    def call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
-        """Call a specific tool."""
+    def _server_call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        """Call a tool on the server."""
         try:
             result = self._send_request("tools/call", {
                 "name": name,
@@ -175,17 +832,30 @@ class LocalMCPClient:
             raise
 
 # Simplified MCP client for when the full MCP protocol isn't available
-class SimplifiedMCPClient:
+class SimplifiedMCPClient(ClientTargetingLayer):
     """Simplified client that directly uses the earthquake RAG server."""
     
     def __init__(self):
-        # Import the existing server
-        try:
-            from earthquake_rag_server import EarthquakeRAGServer
-            self.rag_server = EarthquakeRAGServer()
-            self.is_connected = True
-        except ImportError:
-            self.is_connected = False
+        super().__init__()
+        # The server (models, database) is imported and built on first use
+        self.is_connected = importlib.util.find_spec("earthquake_rag_server") is not None
+        self._rag_server = None
+        self._rag_server_lock = threading.Lock()
+    
+    @property
+    def rag_server(self):
+        """The earthquake RAG server, created on first access."""
+        if self._rag_server is None:
+            with self._rag_server_lock:
+                if self._rag_server is None:
+                    from earthquake_rag_server import EarthquakeRAGServer
+                    self._rag_server = EarthquakeRAGServer()
+        return self._rag_server
+    
+    @property
+    def db_path(self) -> str:
+        """SQLite database the RAG server reads."""
+        return getattr(self.rag_server, "db_path", DEFAULT_DB_PATH)
     
     def start_server(self) -> bool:
         return self.is_connected
@@ -193,88 +863,53 @@ class SimplifiedMCPClient:
     def stop_server(self):
         pass
     
-    def list_resources(self) -> List[MCPResource]:
-        """List available resources."""
-        return [
-            MCPResource("stats/overview", "Statistics Overview", "Earthquake and demographic statistics"),
-            MCPResource("earthquakes/recent", "Recent Earthquakes", "Recent earthquake events"),
-            MCPResource("targets/preview", "Target Preview", "Preview of potential campaign targets")
-        ]
+    def _server_resources(self) -> List[MCPResource]:
+        return []
     
-    def read_resource(self, uri: str) -> Optional[str]:
-        """Read a resource using the RAG server."""
-        try:
-            if uri == "stats/overview":
-                stats = self.rag_server.get_earthquake_statistics()
-                return json.dumps(stats, indent=2)
-            elif uri.startswith("earthquakes/recent"):
-                earthquakes = self.rag_server.get_recent_earthquakes()
-                return json.dumps(earthquakes, indent=2)
-            elif uri.startswith("targets/preview"):
-                # Parse parameters from URI
-                params = {}
-                if "?" in uri:
-                    query_string = uri.split("?")[1]
-                    for param in query_string.split("&"):
-                        if "=" in param:
-                            key, value = param.split("=", 1)
-                            params[key] = value
-                
-                targets = self.rag_server.find_earthquake_ad_targets(
-                    min_magnitude=float(params.get("min_mag", 3.5)),
-                    max_distance_km=float(params.get("max_km", 100)),
-                    min_house_value=float(params.get("min_value", 500000)),
-                    require_uninsured=params.get("uninsured", "true").lower() == "true"
-                )
-                
-                # Return just the targets for preview
-                preview_targets = targets["targets"][:20]  # Limit to first 20
-                preview_data = {
-                    "preview_count": len(preview_targets),
-                    "total_available": len(targets["targets"]),
-                    "criteria": targets["summary"]["criteria"],
-                    "targets": preview_targets
-                }
-                return json.dumps(preview_data, indent=2)
-            
-            return None
-        except Exception as e:
-            print(f"Error reading resource: {e}")
-            return None
+    def _server_tools(self) -> List[MCPTool]:
+        return []
     
-    def list_tools(self) -> List[MCPTool]:
-        """List available tools."""
-        return [
-            MCPTool(
-                name="find_targets",
-                description="Find people who should be targeted for earthquake insurance ads",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "min_magnitude": {"type": "number", "default": 3.5},
-                        "max_distance_km": {"type": "number", "default": 100},
-                        "min_house_value": {"type": "number", "default": 500000},
-                        "require_uninsured": {"type": "boolean", "default": True}
-                    }
-                }
+    def _server_statistics(self) -> Dict[str, Any]:
+        return self.rag_server.get_earthquake_statistics()
+    
+    def _server_recent_earthquakes(self, days: float, min_magnitude: float) -> List[Dict[str, Any]]:
+        return self.rag_server.get_recent_earthquakes(days=days, min_magnitude=min_magnitude)
+    
+    def _server_find_targets(self, min_magnitude: float, max_distance_km: float, min_house_value: float,
+                             require_uninsured: bool) -> Dict[str, Any]:
+        return self.rag_server.find_earthquake_ad_targets(
+            min_magnitude=min_magnitude,
+            max_distance_km=max_distance_km,
+            min_house_value=min_house_value,
+            require_uninsured=require_uninsured
+        )
+    
+    def _server_read_resource(self, uri: str) -> Optional[str]:
+        """Read the resources the RAG server answers directly."""
+        if uri.startswith("targets/preview"):
+            # Parse parameters from URI
+            params = parse_query_params(uri)
+            
+            targets = self.rag_server.find_earthquake_ad_targets(
+                min_magnitude=float(params.get("min_mag", 3.5)),
+                max_distance_km=float(params.get("max_km", 100)),
+                min_house_value=float(params.get("min_value", 500000)),
+                require_uninsured=params.get("uninsured", "true").lower() == "true"
             )
-        ]
+            
+            # Return just the targets for preview
+            preview_targets = targets["targets"][:20]  # Limit to first 20
+            preview_data = {
+                "preview_count": len(preview_targets),
+                "total_available": len(targets["targets"]),
+                "criteria": targets["summary"]["criteria"],
+                "targets": preview_targets
+            }
+            return json.dumps(preview_data, indent=2)
+        return None
     
-    def call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
-        """Call a tool using the RAG server."""
-        try:
-            if name == "find_targets":
-                result = self.rag_server.find_earthquake_ad_targets(
-                    min_magnitude=arguments.get("min_magnitude", 3.5),
-                    max_distance_km=arguments.get("max_distance_km", 100),
-                    min_house_value=arguments.get("min_house_value", 500000),
-                    require_uninsured=arguments.get("require_uninsured", True)
-                )
-                return json.dumps(result, indent=2)
-            else:
-                return json.dumps({"error": f"Unknown tool: {name}"})
-        except Exception as e:
-            return json.dumps({"error": str(e)})
+    def _server_call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        return json.dumps({"error": f"Unknown tool: {name}"})
 
 def create_mcp_client() -> LocalMCPClient:
     """Create and return an appropriate MCP client."""
@@ -0,0 +1,457 @@
+"""
+Outbound send pipeline for rendered campaign emails.
+Rendered emails are queued in a SQLite outbox, grouped into provider batch
+calls (one SendGrid request carries many personalizations) and sent with
+bounded concurrency. Transports report an outcome per message and each
+message is settled by its own outcome, so a partially failed send is safe to
+resume without resending what already went out. A local HTTP stand-in for the
+SendGrid API and an SMTP transport allow end-to-end runs without touching the
+real provider.
+"""
+
+import hashlib
+import json
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# SendGrid accepts up to 1000 personalizations per request and 10,000 bytes of
+# substitutions per personalization.
+MAX_PERSONALIZATIONS = 1000
+MAX_SUBSTITUTION_BYTES = 10000
+
+# message_id -> None when sent, else the error that message hit
+SendOutcomes = Dict[str, Optional[Exception]]
+
+@dataclass
+class EnqueueReport:
+    added: int = 0
+    # Regenerated messages not yet sent, whose content was replaced
+    updated: int = 0
+    # Regenerated messages already sending or sent, which keep their old content
+    ignored: int = 0
+
+@dataclass
+class SendReport:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    batches: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rate_per_second(self) -> float:
+        return self.sent / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "rate_per_second": round(self.rate_per_second, 1),
+        }
+
+class SendGridTransport:
+    """Sends batches through the SendGrid v3 mail/send API using personalizations."""
+
+    TEXT_TOKEN = "-text_body-"
+    HTML_TOKEN = "-html_body-"
+
+    def __init__(self, api_key: str, from_email: str, from_name: str = "Insurance Protection Team", host: str = "https://api.sendgrid.com"):
+        from sendgrid import SendGridAPIClient
+
+        self.client = SendGridAPIClient(api_key=api_key, host=host)
+        self.sender = {"email": from_email, "name": from_name}
+
+    def _personalization(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "to": [{"email": message["to_email"], "name": message["to_name"]}],
+            "subject": message["subject"],
+            "substitutions": {self.TEXT_TOKEN: message["text_body"], self.HTML_TOKEN: message["html_body"]},
+            "custom_args": {"message_id": message["message_id"]},
+        }
+
+    def _fits_substitution(self, message: Dict[str, Any]) -> bool:
+        size = len(message["text_body"].encode("utf-8")) + len(message["html_body"].encode("utf-8"))
+        return size <= MAX_SUBSTITUTION_BYTES
+
+    def _post(self, payload: Dict[str, Any]):
+        response = self.client.client.mail.send.post(request_body=payload)
+        if response.status_code >= 300:
+            raise RuntimeError(f"SendGrid returned {response.status_code}: {response.body}")
+
+    def _post_all(self, messages: List[Dict[str, Any]], payload: Dict[str, Any], outcomes: SendOutcomes):
+        """One provider request; its messages share its outcome, and later requests still go out."""
+        try:
+            self._post(payload)
+            error = None
+        except Exception as e:
+            error = e
+        for message in messages:
+            outcomes[message["message_id"]] = error
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> SendOutcomes:
+        """Send messages; bodies ride in per-personalization substitutions so one request covers the batch."""
+        outcomes: SendOutcomes = {}
+        batched = [m for m in messages if self._fits_substitution(m)]
+        for start in range(0, len(batched), MAX_PERSONALIZATIONS):
+            chunk = batched[start:start + MAX_PERSONALIZATIONS]
+            self._post_all(chunk, {
+                "from": self.sender,
+                "personalizations": [self._personalization(m) for m in chunk],
+                "content": [
+                    {"type": "text/plain", "value": self.TEXT_TOKEN},
+                    {"type": "text/html", "value": self.HTML_TOKEN},
+                ],
+            }, outcomes)
+
+        # Bodies too large for substitutions are sent on their own
+        for message in messages:
+            if not self._fits_substitution(message):
+                self._post_all([message], {
+                    "from": self.sender,
+                    "personalizations": [{
+                        "to": [{"email": message["to_email"], "name": message["to_name"]}],
+                        "subject": message["subject"],
+                        "custom_args": {"message_id": message["message_id"]},
+                    }],
+                    "content": [
+                        {"type": "text/plain", "value": message["text_body"]},
+                        {"type": "text/html", "value": message["html_body"]},
+                    ],
+                }, outcomes)
+        return outcomes
+
+class SMTPTransport:
+    """Sends each batch over a single SMTP connection (e.g. a local debugging server)."""
+
+    def __init__(self, from_email: str, host: str = "localhost", port: int = 1025):
+        self.from_email = from_email
+        self.host = host
+        self.port = port
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> SendOutcomes:
+        outcomes: SendOutcomes = {}
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        except Exception as e:
+            return {message["message_id"]: e for message in messages}
+        with smtp:
+            for message in messages:
+                email = EmailMessage()
+                email["From"] = self.from_email
+                email["To"] = f"{message['to_name']} <{message['to_email']}>"
+                email["Subject"] = message["subject"]
+                email["X-Message-Id"] = message["message_id"]
+                email.set_content(message["text_body"])
+                email.add_alternative(message["html_body"], subtype="html")
+                try:
+                    smtp.send_message(email)
+                    outcomes[message["message_id"]] = None
+                except Exception as e:
+                    outcomes[message["message_id"]] = e
+        return outcomes
+
+class Outbox:
+    """SQLite-backed queue of outbound messages with per-message status."""
+
+    def __init__(self, db_path: str = "db/outbox.db"):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS outbox_messages (
+                message_id TEXT PRIMARY KEY,
+                campaign TEXT NOT NULL,
+                to_email TEXT NOT NULL,
+                to_name TEXT,
+                subject TEXT NOT NULL,
+                text_body TEXT NOT NULL,
+                html_body TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                batch_id TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_campaign_status ON outbox_messages (campaign, status)")
+            self.conn.commit()
+
+    @staticmethod
+    def message_id(campaign: str, to_email: str, subject: str) -> str:
+        """One id per campaign, recipient and subject, so a recipient is never queued twice."""
+        return hashlib.sha1(f"{campaign}\x1f{to_email}\x1f{subject}".encode("utf-8")).hexdigest()
+
+    def enqueue(self, campaign: str, emails: Iterable[Dict[str, Any]]) -> EnqueueReport:
+        """Queue rendered emails ({"to", "name", "subject", "text", "html"}).
+
+        Re-enqueuing an identical email is a no-op. A regenerated email replaces the queued
+        content while the message is pending or failed; once it is sending or sent it keeps
+        the content that went out and is counted as ignored.
+        """
+        now = time.time()
+        messages = {}
+        for email in emails:
+            if email.get("to"):
+                message_id = self.message_id(campaign, email["to"], email["subject"])
+                messages[message_id] = (
+                    email["to"], email.get("name", ""), email["subject"], email["text"], email.get("html", "")
+                )
+
+        report = EnqueueReport()
+        with self.lock:
+            existing = {}
+            ids = list(messages)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                existing.update(
+                    (row["message_id"], row) for row in self.conn.execute(
+                        f"SELECT message_id, status, to_name, text_body, html_body FROM outbox_messages "
+                        f"WHERE message_id IN ({', '.join('?' for _ in chunk)})",
+                        chunk
+                    )
+                )
+            inserts, updates = [], []
+            for message_id, (to_email, to_name, subject, text, html) in messages.items():
+                row = existing.get(message_id)
+                if row is None:
+                    inserts.append((message_id, campaign, to_email, to_name, subject, text, html, now, now))
+                elif (row["to_name"], row["text_body"], row["html_body"]) == (to_name, text, html):
+                    continue
+                elif row["status"] in (PENDING, FAILED):
+                    updates.append((to_name, text, html, now, message_id))
+                else:
+                    report.ignored += 1
+            self.conn.executemany('''
+            INSERT INTO outbox_messages
+            (message_id, campaign, to_email, to_name, subject, text_body, html_body, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', inserts)
+            # Another process may have claimed a message since it was read
+            updated = self.conn.executemany(
+                "UPDATE outbox_messages SET to_name = ?, text_body = ?, html_body = ?, updated_at = ? "
+                f"WHERE message_id = ? AND status IN ('{PENDING}', '{FAILED}')",
+                updates
+            ).rowcount
+            self.conn.commit()
+        report.added, report.updated = len(inserts), updated
+        report.ignored += len(updates) - updated
+        return report
+
+    def status_counts(self, campaign: str) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) AS n FROM outbox_messages WHERE campaign = ? GROUP BY status",
+                (campaign,)
+            ).fetchall()
+        counts = {PENDING: 0, SENDING: 0, SENT: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def recover(self, campaign: str) -> int:
+        """Return messages left 'sending' by an interrupted run to the queue."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE outbox_messages SET status = ?, updated_at = ? WHERE campaign = ? AND status = ?",
+                (PENDING, time.time(), campaign, SENDING)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+
+    def retry_failed(self, campaign: str) -> int:
+        """Requeue permanently failed messages, e.g. after fixing a provider problem."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE outbox_messages SET status = ?, attempts = 0, updated_at = ? WHERE campaign = ? AND status = ?",
+                (PENDING, time.time(), campaign, FAILED)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+
+    def _claim(self, campaign: str, batch_size: int) -> List[Dict[str, Any]]:
+        batch_id = uuid.uuid4().hex
+        with self.lock:
+            rows = self.conn.execute('''
+            SELECT message_id, to_email, to_name, subject, text_body, html_body, attempts
+            FROM outbox_messages WHERE campaign = ? AND status = ?
+            ORDER BY created_at, message_id LIMIT ?
+            ''', (campaign, PENDING, batch_size)).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE outbox_messages SET status = ?, batch_id = ?, updated_at = ? WHERE message_id = ?",
+                    [(SENDING, batch_id, time.time(), row["message_id"]) for row in rows]
+                )
+                self.conn.commit()
+        return [dict(row) for row in rows]
+
+    def _settle(
+        self, batch: List[Dict[str, Any]], outcomes: Union[SendOutcomes, Exception, None], max_attempts: int
+    ) -> Dict[str, int]:
+        """Settle each message by its own outcome; returns how many became sent, pending again or failed."""
+        if outcomes is None or isinstance(outcomes, Exception):
+            # A transport that returns nothing sent everything; one that raised sent nothing
+            outcomes = {m["message_id"]: outcomes for m in batch}
+        now = time.time()
+        counts = {SENT: 0, PENDING: 0, FAILED: 0}
+        updates = []
+        for message in batch:
+            error = outcomes.get(message["message_id"], RuntimeError("No outcome reported for message"))
+            if error is None:
+                status = SENT
+            else:
+                status = FAILED if message["attempts"] + 1 >= max_attempts else PENDING
+            counts[status] += 1
+            updates.append((status, None if error is None else str(error)[:500], now, message["message_id"]))
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE outbox_messages SET status = ?, attempts = attempts + 1, last_error = ?, updated_at = ? WHERE message_id = ?",
+                updates
+            )
+            self.conn.commit()
+        return counts
+
+    def send(
+        self,
+        campaign: str,
+        transport: Any,
+        batch_size: int = 500,
+        max_workers: int = 4,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+    ) -> SendReport:
+        """
+        Send every pending message of a campaign.
+
+        At most max_workers provider calls are in flight. A failed batch goes
+        back to pending until it has been tried max_attempts times, so the
+        whole send can be rerun after a crash without resending what went out.
+        Messages are settled individually, so the delivered part of a partly
+        failed batch stays sent.
+        """
+        report = SendReport()
+        self.recover(campaign)
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="outbox-send") as pool:
+            in_flight = {}
+
+            def submit_next() -> bool:
+                batch = self._claim(campaign, batch_size)
+                if not batch:
+                    return False
+                if batch[0]["attempts"]:
+                    time.sleep(retry_delay)
+                in_flight[pool.submit(transport.send_batch, batch)] = batch
+                return True
+
+            while len(in_flight) < max_workers and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    error = future.exception()
+                    counts = self._settle(batch, error if error is not None else future.result(), max_attempts)
+                    report.batches += 1
+                    report.sent += counts[SENT]
+                    report.failed += counts[FAILED]
+                    report.retried += counts[PENDING]
+                while len(in_flight) < max_workers and submit_next():
+                    pass
+
+        report.elapsed_seconds = time.perf_counter() - start
+        return report
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            failing = server.fail_every and server.requests % server.fail_every == 0
+            if not failing:
+                payload = json.loads(body or b"{}")
+                server.delivered += len(payload.get("personalizations", []))
+        self.send_response(503 if failing else 202)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stand_in(port: int = 0, latency: float = 0.0, fail_every: int = 0) -> ThreadingHTTPServer:
+    """
+    Start a local stand-in for the SendGrid mail/send API in a background thread.
+
+    Point SendGridTransport at f"http://127.0.0.1:{server.server_port}". Every
+    fail_every-th request answers 503 so resume paths can be exercised.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StandInHandler)
+    server.latency = latency
+    server.fail_every = fail_every
+    server.requests = 0
+    server.delivered = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Queue and send rendered campaign emails")
+    parser.add_argument("command", choices=["enqueue", "send", "status", "retry-failed"])
+    parser.add_argument("--campaign", required=True)
+    parser.add_argument("--db", default="db/outbox.db")
+    parser.add_argument("--input", help="Rendered emails JSONL (for enqueue)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--from-email", default=os.getenv("SENDGRID_FROM_EMAIL", "noreply@example.com"))
+    parser.add_argument("--smtp", help="host:port of an SMTP server to send through instead of SendGrid")
+    parser.add_argument("--stand-in", action="store_true", help="Send to a local SendGrid stand-in")
+    args = parser.parse_args()
+
+    outbox = Outbox(args.db)
+    if args.command == "enqueue":
+        with open(args.input, encoding="utf-8") as source:
+            queued = outbox.enqueue(args.campaign, (json.loads(line) for line in source if line.strip()))
+        print(f"Queued {queued.added} new messages, updated {queued.updated}, "
+              f"ignored {queued.ignored} already sending or sent")
+    elif args.command == "retry-failed":
+        print(f"Requeued {outbox.retry_failed(args.campaign)} failed messages")
+    elif args.command == "send":
+        if args.smtp:
+            host, _, port = args.smtp.partition(":")
+            transport = SMTPTransport(args.from_email, host, int(port or 25))
+        elif args.stand_in:
+            stand_in = start_stand_in()
+            transport = SendGridTransport("stand-in", args.from_email, host=f"http://127.0.0.1:{stand_in.server_port}")
+        else:
+            transport = SendGridTransport(os.environ["SENDGRID_API_KEY"], args.from_email)
+        report = outbox.send(args.campaign, transport, batch_size=args.batch_size, max_workers=args.workers)
+        print(json.dumps(report.to_dict(), indent=2))
+    print(json.dumps(outbox.status_counts(args.campaign), indent=2))
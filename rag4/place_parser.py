@@ -0,0 +1,96 @@
+"""
+Structured fields for USGS `place` strings.
+"85 km SSW of Corinto, Nicaragua" becomes offset_km=85, bearing="SSW",
+locality="Corinto", region="Nicaragua". US state abbreviations are expanded
+("Rancho Tehama Reserve, CA" -> region "California") so each region has one
+spelling. Ingest parses each place once into indexed columns, so region
+stats and filters don't regex-scan rows at query time.
+"""
+
+import re
+import sqlite3
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+# (place column, parsed field)
+PLACE_COLUMNS = (
+    ("place_offset_km", "offset_km"),
+    ("place_bearing", "bearing"),
+    ("place_locality", "locality"),
+    ("place_region", "region"),
+)
+
+US_STATES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas", "CA": "California",
+    "CO": "Colorado", "CT": "Connecticut", "DE": "Delaware", "FL": "Florida", "GA": "Georgia",
+    "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois", "IN": "Indiana", "IA": "Iowa",
+    "KS": "Kansas", "KY": "Kentucky", "LA": "Louisiana", "ME": "Maine", "MD": "Maryland",
+    "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota", "MS": "Mississippi", "MO": "Missouri",
+    "MT": "Montana", "NE": "Nebraska", "NV": "Nevada", "NH": "New Hampshire", "NJ": "New Jersey",
+    "NM": "New Mexico", "NY": "New York", "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio",
+    "OK": "Oklahoma", "OR": "Oregon", "PA": "Pennsylvania", "RI": "Rhode Island", "SC": "South Carolina",
+    "SD": "South Dakota", "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont",
+    "VA": "Virginia", "WA": "Washington", "WV": "West Virginia", "WI": "Wisconsin", "WY": "Wyoming",
+    "PR": "Puerto Rico", "GU": "Guam", "VI": "U.S. Virgin Islands", "DC": "District of Columbia",
+}
+
+PLACE_PATTERN = re.compile(r"^(?P<offset>\d+(?:\.\d+)?)\s*km\s+(?P<bearing>[NSEW]{1,3})\s+of\s+(?P<rest>.+)$")
+PREFIX_PATTERN = re.compile(r"^(?:off the (?:east |west |north |south )?coast of|near the coast of)\s+", re.IGNORECASE)
+
+@dataclass(frozen=True)
+class ParsedPlace:
+    offset_km: Optional[float]
+    bearing: Optional[str]
+    locality: Optional[str]
+    region: Optional[str]
+
+def normalize_region(region: str) -> str:
+    region = region.strip()
+    if region.endswith(" region"):
+        region = region[:-len(" region")]
+    return US_STATES.get(region.upper(), region) if len(region) == 2 else region
+
+@lru_cache(maxsize=8192)
+def parse_place(place: Optional[str]) -> ParsedPlace:
+    """Parse a place string; unrecognised text is kept whole as the region."""
+    if not place or place != place:
+        return ParsedPlace(None, None, None, None)
+    place = place.strip()
+    offset_km, bearing, rest = None, None, place
+    match = PLACE_PATTERN.match(place)
+    if match:
+        offset_km, bearing, rest = float(match["offset"]), match["bearing"], match["rest"]
+    if ", " in rest:
+        locality, region = rest.rsplit(", ", 1)
+        return ParsedPlace(offset_km, bearing, locality.strip(), normalize_region(region))
+    if match:
+        # "12 km N of Anchorage" names a locality without a region
+        return ParsedPlace(offset_km, bearing, rest.strip(), None)
+    return ParsedPlace(None, None, None, normalize_region(PREFIX_PATTERN.sub("", rest)))
+
+def migrate_place_columns(conn: sqlite3.Connection) -> int:
+    """Add, fill and index the parsed place columns; idempotent. Returns rows parsed."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(earthquake_events)")}
+    for column, field in PLACE_COLUMNS:
+        if column not in existing:
+            column_type = "REAL" if field == "offset_km" else "TEXT"
+            conn.execute(f"ALTER TABLE earthquake_events ADD COLUMN {column} {column_type}")
+
+    # Only rows not parsed yet: every non-empty place yields a locality or a region
+    rows = conn.execute(
+        "SELECT id, place FROM earthquake_events "
+        "WHERE place IS NOT NULL AND place_region IS NULL AND place_locality IS NULL"
+    ).fetchall()
+    conn.executemany(
+        f"UPDATE earthquake_events SET {', '.join(f'{column} = ?' for column, _ in PLACE_COLUMNS)} WHERE id = ?",
+        [
+            tuple(getattr(parse_place(place), field) for _, field in PLACE_COLUMNS) + (row_id,)
+            for row_id, place in rows
+        ]
+    )
+
+    # Region filters over a time window are one index range scan
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_earthquake_region_time ON earthquake_events (place_region, time_ms)")
+    conn.commit()
+    return len(rows)
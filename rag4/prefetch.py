@@ -0,0 +1,198 @@
+"""
+Speculative email pre-generation for top-ranked targets.
+When targeting results arrive, an EmailPrefetcher starts generating drafts for
+the highest-ranked targets in the background, stopping before a per-batch cost
+budget would be exceeded. The Generate Emails tab takes a ready draft instead
+of waiting on Gemini; drafts that are never taken are counted as waste.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from llm_resilience import CircuitOpenError
+from telemetry import CallRecord, estimate_cost
+
+# Drafts kept at most, and how long an untaken draft stays usable
+MAX_DRAFTS = 500
+DRAFT_TTL_SECONDS = 60 * 60
+
+# Assumed response size before any call in a batch has completed
+DEFAULT_RESPONSE_TOKENS = 350
+
+# Batches whose counters feed stats(); older ones are forgotten
+MAX_TRACKED_BATCHES = 100
+
+@dataclass
+class Draft:
+    key: str
+    batch_id: str
+    content: Dict[str, Any]
+    record: CallRecord
+    created_at: float = field(default_factory=time.monotonic)
+
+@dataclass
+class PrefetchBatch:
+    batch_id: str
+    campaign: str
+    budget_usd: float
+    scheduled: int = 0
+    completed: int = 0
+    failed: int = 0
+    skipped_over_budget: int = 0
+    spent_usd: float = 0.0
+    reserved_usd: float = 0.0
+    cancelled: bool = False
+
+    def average_cost(self) -> Optional[float]:
+        return self.spent_usd / self.completed if self.completed else None
+
+class EmailPrefetcher:
+    """Background draft generation within a cost budget, with used/unused accounting."""
+
+    def __init__(
+        self,
+        generate: Callable[[Dict[str, Any], str, str, Dict[str, Any]], Dict[str, Any]],
+        key: Callable[[Dict[str, Any], str], str],
+        model: str,
+        max_workers: int = 2,
+    ):
+        """generate(target, context, campaign, telemetry) -> content; key(target, context) -> draft key."""
+        self.generate = generate
+        self.key = key
+        self.model = model
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.slots = threading.Semaphore(max_workers)
+        self.lock = threading.Lock()
+        self.drafts: "OrderedDict[str, Draft]" = OrderedDict()
+        self.batches: Dict[str, PrefetchBatch] = {}
+        self.used = 0
+        self.used_cost_usd = 0.0
+        self.wasted = 0
+        self.wasted_cost_usd = 0.0
+
+    def _estimate(self, batch: PrefetchBatch, prompt_chars: int) -> float:
+        average = batch.average_cost()
+        if average is not None:
+            return average
+        # Roughly four characters per token, as in telemetry.token_counts
+        return estimate_cost(self.model, prompt_chars // 4, DEFAULT_RESPONSE_TOKENS)
+
+    def start(
+        self,
+        targets: List[Dict[str, Any]],
+        campaign_context: str,
+        campaign: str,
+        budget_usd: float,
+        prompt_chars: Callable[[Dict[str, Any]], int] = lambda target: 0,
+    ) -> str:
+        """Prefetch drafts for targets in rank order in the background; returns the batch id."""
+        batch = PrefetchBatch(batch_id=uuid.uuid4().hex[:12], campaign=campaign, budget_usd=budget_usd)
+        with self.lock:
+            self.batches[batch.batch_id] = batch
+            while len(self.batches) > MAX_TRACKED_BATCHES:
+                self.batches.pop(next(iter(self.batches)))
+        threading.Thread(
+            target=self._dispatch,
+            args=(batch, targets, campaign_context, prompt_chars),
+            name=f"prefetch-{batch.batch_id}",
+            daemon=True
+        ).start()
+        return batch.batch_id
+
+    def _dispatch(self, batch: PrefetchBatch, targets: List[Dict[str, Any]], campaign_context: str,
+                  prompt_chars: Callable[[Dict[str, Any]], int]):
+        """Submit calls one slot at a time so later estimates use the batch's real average cost."""
+        for target in targets:
+            self.slots.acquire()
+            key = self.key(target, campaign_context)
+            with self.lock:
+                if batch.cancelled:
+                    self.slots.release()
+                    break
+                estimate = self._estimate(batch, prompt_chars(target))
+                if key in self.drafts or batch.spent_usd + batch.reserved_usd + estimate > batch.budget_usd:
+                    if key not in self.drafts:
+                        batch.skipped_over_budget += 1
+                    self.slots.release()
+                    continue
+                batch.reserved_usd += estimate
+                batch.scheduled += 1
+            self.executor.submit(self._prefetch, batch, key, target, campaign_context, estimate)
+
+    def _prefetch(self, batch: PrefetchBatch, key: str, target: Dict[str, Any], campaign_context: str, estimate: float):
+        content, record = None, None
+        if not batch.cancelled:
+            call_telemetry: Dict[str, Any] = {}
+            try:
+                content = self.generate(target, campaign_context, batch.campaign, call_telemetry)
+                record = call_telemetry[batch.campaign].records[-1]
+            except CircuitOpenError:
+                # Speculative work never waits out a degraded upstream
+                batch.cancelled = True
+            except Exception:
+                pass
+        with self.lock:
+            batch.reserved_usd -= estimate
+            if record is None:
+                batch.failed += 1
+            else:
+                batch.completed += 1
+                batch.spent_usd += record.cost_usd
+                self.drafts[key] = Draft(key=key, batch_id=batch.batch_id, content=content, record=record)
+                self._evict()
+        self.slots.release()
+
+    def _evict(self):
+        """Drop expired drafts and trim to MAX_DRAFTS; anything dropped untaken is waste."""
+        now = time.monotonic()
+        while self.drafts:
+            oldest = next(iter(self.drafts.values()))
+            if len(self.drafts) <= MAX_DRAFTS and now - oldest.created_at < DRAFT_TTL_SECONDS:
+                break
+            self.drafts.popitem(last=False)
+            self.wasted += 1
+            self.wasted_cost_usd += oldest.record.cost_usd
+
+    def peek(self, target: Dict[str, Any], campaign_context: str) -> bool:
+        """Whether a draft is ready for this target and context."""
+        with self.lock:
+            self._evict()
+            return self.key(target, campaign_context) in self.drafts
+
+    def take(self, target: Dict[str, Any], campaign_context: str) -> Optional[Draft]:
+        """Remove and return the ready draft for this target, if any."""
+        with self.lock:
+            self._evict()
+            draft = self.drafts.pop(self.key(target, campaign_context), None)
+            if draft is not None:
+                self.used += 1
+                self.used_cost_usd += draft.record.cost_usd
+            return draft
+
+    def cancel(self, batch_id: str):
+        """Stop scheduling calls for a batch; calls already running still finish."""
+        with self.lock:
+            if batch_id in self.batches:
+                self.batches[batch_id].cancelled = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            self._evict()
+            batches = list(self.batches.values())
+            return {
+                "ready": len(self.drafts),
+                "in_flight": sum(b.scheduled - b.completed - b.failed for b in batches),
+                "used": self.used,
+                "unused": len(self.drafts) + self.wasted,
+                "wasted": self.wasted,
+                "skipped_over_budget": sum(b.skipped_over_budget for b in batches),
+                "failed": sum(b.failed for b in batches),
+                "spent_usd": round(sum(b.spent_usd for b in batches), 6),
+                "used_cost_usd": round(self.used_cost_usd, 6),
+                "unused_cost_usd": round(sum(d.record.cost_usd for d in self.drafts.values()) + self.wasted_cost_usd, 6),
+            }
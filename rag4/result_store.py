@@ -0,0 +1,114 @@
+"""
+Server-side store for targeting results.
+Results are kept once on the server under an opaque handle with a sliding
+TTL; sessions hold only the handle and fetch pages, markers or single
+targets through it. Identical queries share one handle, so memory grows with
+distinct queries rather than with the number of sessions.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Idle lifetime of a result; every access extends it
+RESULT_TTL_SECONDS = 30 * 60
+
+# Results kept at most, across all sessions; the least recently used is dropped first.
+# Override with the RESULT_STORE_MAX_RESULTS environment variable.
+MAX_STORED_RESULTS = int(os.getenv("RESULT_STORE_MAX_RESULTS", "256"))
+
+# Total rows (targets) kept across results, which bounds memory whatever the result count.
+# Override with the RESULT_STORE_MAX_ROWS environment variable.
+MAX_STORED_ROWS = int(os.getenv("RESULT_STORE_MAX_ROWS", "2000000"))
+
+def result_size(value: Any) -> int:
+    """Rows held by a stored result (1 for values without a length)."""
+    try:
+        return max(1, len(value))
+    except TypeError:
+        return 1
+
+class ResultExpired(KeyError):
+    """Raised for a handle that never existed or whose result has expired."""
+
+class ResultStore:
+    """Handle -> result map with a sliding TTL, LRU bounds on count and rows, and per-query dedup."""
+
+    def __init__(self, ttl_seconds: float = RESULT_TTL_SECONDS, max_entries: int = MAX_STORED_RESULTS,
+                 max_rows: int = MAX_STORED_ROWS):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.rows = 0
+        self.entries: "OrderedDict[str, Tuple[Any, float, Optional[Hashable]]]" = OrderedDict()
+        self.handles_by_key: Dict[Hashable, str] = {}
+        self.lock = threading.Lock()
+
+    def _drop(self, handle: str):
+        value, _, key = self.entries.pop(handle)
+        self.rows -= result_size(value)
+        if key is not None and self.handles_by_key.get(key) == handle:
+            del self.handles_by_key[key]
+
+    def _sweep(self, now: float):
+        expired = [handle for handle, (_, expires_at, _) in self.entries.items() if expires_at <= now]
+        for handle in expired:
+            self._drop(handle)
+
+    def put(self, value: Any, key: Optional[Hashable] = None) -> str:
+        """Store a result and return its handle; a live result under the same key is reused."""
+        now = time.monotonic()
+        with self.lock:
+            self._sweep(now)
+            if key is not None and key in self.handles_by_key:
+                handle = self.handles_by_key[key]
+                self._touch(handle, now)
+                return handle
+            handle = uuid.uuid4().hex
+            self.entries[handle] = (value, now + self.ttl_seconds, key)
+            self.rows += result_size(value)
+            if key is not None:
+                self.handles_by_key[key] = handle
+            # The newest result is always kept, even if it alone is over the row bound
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.rows > self.max_rows):
+                self._drop(next(iter(self.entries)))
+        return handle
+
+    def find(self, key: Hashable) -> Optional[str]:
+        """Handle of the live result stored under key, if any."""
+        now = time.monotonic()
+        with self.lock:
+            self._sweep(now)
+            handle = self.handles_by_key.get(key)
+            if handle is not None:
+                self._touch(handle, now)
+            return handle
+
+    def _touch(self, handle: str, now: float):
+        value, _, key = self.entries[handle]
+        self.entries[handle] = (value, now + self.ttl_seconds, key)
+        self.entries.move_to_end(handle)
+
+    def get(self, handle: str) -> Any:
+        """The result for a handle, extending its lifetime; raises ResultExpired."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(handle)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    self._drop(handle)
+                raise ResultExpired(handle)
+            self._touch(handle, now)
+            return entry[0]
+
+    def expires_in(self, handle: str) -> float:
+        with self.lock:
+            entry = self.entries.get(handle)
+        return max(0.0, entry[1] - time.monotonic()) if entry else 0.0
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
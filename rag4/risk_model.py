@@ -0,0 +1,111 @@
+"""
+Ground-motion risk scoring for person-earthquake pairs.
+Shaking intensity (Modified Mercalli) is estimated from magnitude and
+hypocentral distance with the Atkinson & Wald (2007) California intensity
+prediction equation, then mapped to a risk level and a 0-1 score for ranking.
+Everything is numpy-vectorized over pairs, so scoring runs at millions of
+pairs per second instead of a per-pair Python step function.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Atkinson & Wald (2007) California coefficients
+AW07_C1, AW07_C2, AW07_C3, AW07_C4 = 12.27, 2.270, 0.1304, -1.30
+AW07_C5, AW07_C6, AW07_C7 = -0.0007070, 1.95, -0.577
+AW07_H_KM, AW07_RT_KM = 14.0, 30.0
+
+# Depth assumed for events without one
+DEFAULT_DEPTH_KM = 10.0
+
+# MMI thresholds: VI is where light damage starts, IV is felt indoors by many
+HIGH_RISK_MMI = 6.0
+MEDIUM_RISK_MMI = 4.0
+
+RISK_LEVELS = np.array(["high", "medium", "low"])
+
+RISK_MODELS = ("step", "attenuation")
+
+# Model used when a caller doesn't pick one; the app, the MCP tools and the engines all share it
+DEFAULT_RISK_MODEL = "attenuation"
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance; arguments broadcast against each other."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def intensity(magnitude, hypocentral_km) -> np.ndarray:
+    """Predicted MMI, clipped to I-X."""
+    magnitude = np.asarray(magnitude, dtype=float)
+    r = np.sqrt(np.asarray(hypocentral_km, dtype=float) ** 2 + AW07_H_KM ** 2)
+    log_r = np.log10(r)
+    dm = magnitude - 6.0
+    mmi = (
+        AW07_C1 + AW07_C2 * dm + AW07_C3 * dm ** 2 + AW07_C4 * log_r + AW07_C5 * r
+        + AW07_C6 * np.maximum(0.0, np.log10(r / AW07_RT_KM)) + AW07_C7 * magnitude * log_r
+    )
+    return np.clip(mmi, 1.0, 10.0)
+
+def score_pairs(distance_km, magnitude, depth_km=None) -> Dict[str, np.ndarray]:
+    """MMI, 0-1 score and risk level index (0 high, 1 medium, 2 low) for epicentral distances."""
+    distance_km = np.asarray(distance_km, dtype=float)
+    depth = DEFAULT_DEPTH_KM if depth_km is None else np.nan_to_num(np.asarray(depth_km, dtype=float), nan=DEFAULT_DEPTH_KM)
+    hypocentral_km = np.sqrt(distance_km ** 2 + np.asarray(depth) ** 2)
+    mmi = intensity(np.nan_to_num(np.asarray(magnitude, dtype=float)), hypocentral_km)
+    risk = np.where(mmi >= HIGH_RISK_MMI, 0, np.where(mmi >= MEDIUM_RISK_MMI, 1, 2)).astype(np.int8)
+    return {
+        "hypocentral_km": hypocentral_km,
+        "mmi": mmi,
+        "score": (mmi - 1.0) / 9.0,
+        "risk": risk,
+    }
+
+def score_grid(person_lat, person_lon, quake_lat, quake_lon, magnitude, depth_km=None) -> Dict[str, np.ndarray]:
+    """Score every person against every quake; results have shape (people, quakes)."""
+    distance = haversine_km(
+        np.asarray(person_lat, dtype=float)[:, None], np.asarray(person_lon, dtype=float)[:, None],
+        np.asarray(quake_lat, dtype=float)[None, :], np.asarray(quake_lon, dtype=float)[None, :]
+    )
+    depth = None if depth_km is None else np.asarray(depth_km, dtype=float)[None, :]
+    scores = score_pairs(distance, np.asarray(magnitude, dtype=float)[None, :], depth)
+    scores["distance_km"] = distance
+    return scores
+
+def step_risk(distance_km, magnitude, house_value) -> np.ndarray:
+    """Risk level index of the distance/magnitude/value step function (calculateRiskLevel in the web app)."""
+    distance_km, magnitude, house_value = (np.asarray(value, dtype=float) for value in (distance_km, magnitude, house_value))
+    high = (distance_km <= 50) & ((magnitude >= 3.0) | (house_value >= 500000))
+    medium = (distance_km <= 100) & ((magnitude >= 2.0) | (house_value >= 200000))
+    return np.where(high, 0, np.where(medium, 1, 2)).astype(np.int8)
+
+def rescore_targets(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace step-function risk levels in a find_earthquake_ad_targets result with attenuation scoring."""
+    targets: List[Dict[str, Any]] = result.get("targets", [])
+    if targets:
+        distance = np.array([target.get("distance_km") or 0.0 for target in targets], dtype=float)
+        magnitude = np.array([target["earthquake"].get("magnitude") or 0.0 for target in targets], dtype=float)
+        depth = np.array([_float_or_nan(target["earthquake"].get("depth")) for target in targets], dtype=float)
+        scores = score_pairs(distance, magnitude, depth)
+        levels = RISK_LEVELS[scores["risk"]].tolist()
+        mmi = np.round(scores["mmi"], 2).tolist()
+        score = np.round(scores["score"], 4).tolist()
+        targets = [
+            {**target, "risk_level": levels[i], "mmi": mmi[i], "risk_score": score[i]}
+            for i, target in enumerate(targets)
+        ]
+    summary = {
+        **result.get("summary", {}),
+        "total_targets": len(targets),
+        "high_risk_targets": sum(target["risk_level"] == "high" for target in targets),
+        "medium_risk_targets": sum(target["risk_level"] == "medium" for target in targets),
+        "low_risk_targets": sum(target["risk_level"] == "low" for target in targets),
+        "risk_model": "attenuation",
+    }
+    return {**result, "targets": targets, "summary": summary}
+
+def _float_or_nan(value: Optional[Any]) -> float:
+    return np.nan if value is None else float(value)
@@ -4,6 +4,15 @@ import pandas as pd
 import random
 from datetime import datetime, timedelta
 
+from aftershock_sequences import assign_sequences
+from earthquake_partitions import EarthquakePartitions
+from earthquake_queries import iso_to_epoch_ms, migrate_time_columns
+from event_dedup import ingest_events
+from exposure_raster import ExposureRaster
+from hazard_store import HazardStore
+from place_parser import migrate_place_columns
+from targeting_engine import migrate_demographics_updated_ms
+
 # Create db directory if it doesn't exist
 os.makedirs('db', exist_ok=True)
 
@@ -25,10 +34,19 @@ CREATE TABLE IF NOT EXISTS earthquake_events (
     network TEXT,
     event_id TEXT UNIQUE,
     updated TEXT,
-    status TEXT
+    status TEXT,
+    time_ms INTEGER,
+    updated_ms INTEGER,
+    place_offset_km REAL,
+    place_bearing TEXT,
+    place_locality TEXT,
+    place_region TEXT
 )
 ''')
 
+# Epoch-ms columns, indexes and sync triggers (also migrates databases created before them)
+migrate_time_columns(conn)
+
 # Create demographic data table (simulated data for ad targeting)
 cursor.execute('''
 CREATE TABLE IF NOT EXISTS demographics (
@@ -52,35 +70,37 @@ CREATE TABLE IF NOT EXISTS demographics (
 )
 ''')
 
+# Region campaigns pre-filter homes by the polygon's bounding box
+cursor.execute('CREATE INDEX IF NOT EXISTS idx_demographics_location ON demographics (latitude, longitude)')
+
 # Read the earthquake CSV data
 try:
     df = pd.read_csv('2.5_day (2).csv')
     print(f"Loaded {len(df)} earthquake records")
     
-    # Insert earthquake data
+    # Insert earthquake data, keeping one preferred origin per physical quake
     earthquake_data = []
     for _, row in df.iterrows():
-        earthquake_data.append((
-            row['time'],
-            row['latitude'],
-            row['longitude'],
-            row['depth'],
-            row['mag'],
-            row['magType'],
-            row['place'],
-            row['net'],
-            row['id'],
-            row['updated'],
-            row['status']
-        ))
+        earthquake_data.append({
+            'time': row['time'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'depth': row['depth'],
+            'magnitude': row['mag'],
+            'mag_type': row['magType'],
+            'place': row['place'],
+            'network': row['net'],
+            'event_id': row['id'],
+            'updated': row['updated'],
+            'status': row['status'],
+            'time_ms': iso_to_epoch_ms(row['time']),
+            'updated_ms': iso_to_epoch_ms(row['updated'])
+        })
     
-    cursor.executemany('''
-    INSERT OR REPLACE INTO earthquake_events 
-    (time, latitude, longitude, depth, magnitude, mag_type, place, network, event_id, updated, status)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', earthquake_data)
+    ingest = ingest_events(conn, earthquake_data)
     
-    print(f"Inserted {len(earthquake_data)} earthquake records")
+    print(f"Inserted {ingest['inserted']} earthquake records "
+          f"({ingest['duplicates']} cross-network duplicates skipped)")
     
 except Exception as e:
     print(f"Error reading CSV: {e}")
@@ -163,10 +183,36 @@ VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 
 print(f"Inserted {len(sample_demographics)} demographic records")
 
+# Targeting engines notice edited people through this trigger-stamped column
+migrate_demographics_updated_ms(conn)
+
+# Ingest parses places; this fills rows stored before the place columns existed
+parsed_places = migrate_place_columns(conn)
+print(f"Parsed {parsed_places} earthquake place names")
+
+# Ingest assigns sequences incrementally; this picks up rows stored without one
+sequencing = assign_sequences(conn)
+print(f"Assigned {sequencing['assigned']} earthquakes to {sequencing['sequences']} sequences")
+
 # Commit the changes and close the connection
 conn.commit()
 conn.close()
 
+# Month partitions serve time-window queries; compact old months (and prune
+# them from earthquake_events) with
+# `python earthquake_partitions.py compact --retain-months 12`
+partitioned = EarthquakePartitions().import_from('db/earthquake_rag.db')
+print(f"Partitioned {partitioned} earthquake records by month")
+
+# Gridded max-shaking layer for per-home exposure lookups; later ingests are burned in incrementally
+exposure_events = ExposureRaster().sync('db/earthquake_rag.db')
+print(f"Burned {exposure_events} felt earthquakes into the exposure raster")
+
+# Earthquakes in the shared hazard store; weather events are added with
+# `python hazard_store.py ingest-weather <weather.json>`
+hazard_sync = HazardStore('db/earthquake_rag.db').sync_earthquakes()
+print(f"Mirrored {hazard_sync['synced']} earthquakes into the hazard store")
+
 print("Database created successfully!")
 print("\nDatabase Summary:")
 print("- Earthquake events table: Contains earthquake data from CSV")
@@ -0,0 +1,81 @@
+"""
+Single-flight coalescing for identical in-flight requests.
+Concurrent callers asking for the same key wait on one upstream call and share
+its result (or its exception). Duplicate counts are kept for reporting.
+"""
+
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Cap on distinct keys kept for duplicate reporting
+MAX_TRACKED_KEYS = 10000
+
+def prompt_key(model: str, prompt: str) -> str:
+    """Stable key for an LLM request."""
+    return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, _Call] = {}
+        self.requests = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.duplicates_by_key: Counter = Counter()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per key among concurrent callers; returns (result, shared)."""
+        with self.lock:
+            self.requests += 1
+            call = self.in_flight.get(key)
+            if call is not None:
+                self.coalesced += 1
+                self.duplicates_by_key[key] += 1
+                if len(self.duplicates_by_key) > MAX_TRACKED_KEYS:
+                    self.duplicates_by_key = Counter(dict(self.duplicates_by_key.most_common(MAX_TRACKED_KEYS // 10)))
+                leader = False
+            else:
+                call = _Call()
+                self.in_flight[key] = call
+                self.upstream_calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self.in_flight),
+                "top_duplicate_keys": [
+                    {"key": key[:12], "duplicates": count}
+                    for key, count in self.duplicates_by_key.most_common(top)
+                ],
+            }
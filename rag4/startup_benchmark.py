@@ -0,0 +1,111 @@
+"""
+Cold-start import benchmark for the Streamlit app.
+Runs the app's top-level imports in a fresh interpreter under
+`python -X importtime`, reports the slowest modules and fails when startup
+exceeds a time budget or eagerly imports a dependency that should be deferred.
+
+    python startup_benchmark.py                  # default budget, exits 1 when exceeded
+    python startup_benchmark.py --budget-ms 1200
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_gemini_mcp.py")
+
+# Startup import budget; the app's imports measure well under half of this on a laptop
+DEFAULT_BUDGET_MS = 1500.0
+
+# Modules the app must not import until a session needs them (streamlit itself
+# imports the small top-level plotly package, so the check is on plotly.express;
+# numpy stands in for the targeting engines, which all import it)
+DEFERRED_MODULES = ("google.generativeai", "plotly.express", "pandas", "numpy")
+
+def startup_snippet(app_path: str) -> str:
+    """Top-level imports (and lazy_module bindings) of the app, without running the page."""
+    with open(app_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=app_path)
+    statements = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            statements.append(node)
+        elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Call) \
+                and getattr(node.value.func, "id", None) == "lazy_module":
+            statements.append(node)
+    return ast.unparse(ast.Module(body=statements, type_ignores=[]))
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for each line of -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Drop the separator space; remaining indentation is nesting depth
+        entries.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return entries
+
+def measure(app_path: str) -> List[Tuple[str, int, int]]:
+    """Import timings from one cold interpreter run."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", startup_snippet(app_path)],
+        cwd=os.path.dirname(os.path.abspath(app_path)),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return parse_importtime(completed.stderr)
+
+def summarize(runs: List[List[Tuple[str, int, int]]]) -> Dict[str, Dict[str, float]]:
+    """Best-of-runs self and cumulative milliseconds per module; top-level entries are flagged."""
+    modules: Dict[str, Dict[str, float]] = {}
+    for entries in runs:
+        for raw_name, self_us, cumulative_us in entries:
+            name = raw_name.strip()
+            stats = modules.setdefault(name, {
+                "self_ms": float("inf"),
+                "cumulative_ms": float("inf"),
+                "top_level": raw_name == raw_name.lstrip(),
+            })
+            stats["self_ms"] = min(stats["self_ms"], self_us / 1000)
+            stats["cumulative_ms"] = min(stats["cumulative_ms"], cumulative_us / 1000)
+    return modules
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the Streamlit app")
+    parser.add_argument("--app", default=DEFAULT_APP)
+    parser.add_argument("--runs", type=int, default=3, help="Cold runs; the fastest per module is reported")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Fail when total import time exceeds this (0 disables the check)")
+    parser.add_argument("--allow-eager", action="append", default=[], help="Deferred module allowed at startup")
+    args = parser.parse_args()
+
+    runs = [measure(args.app) for _ in range(max(1, args.runs))]
+    modules = summarize(runs)
+    total_ms = sum(stats["cumulative_ms"] for stats in modules.values() if stats["top_level"])
+
+    print(f"{'module':<45} {'self ms':>9} {'cumul ms':>9}")
+    slowest = sorted(modules.items(), key=lambda item: item[1]["cumulative_ms"], reverse=True)
+    for name, stats in slowest[:args.top]:
+        print(f"{name:<45} {stats['self_ms']:>9.1f} {stats['cumulative_ms']:>9.1f}")
+    print(f"\nTotal startup import time: {total_ms:.1f} ms ({len(modules)} modules, best of {len(runs)} runs)")
+
+    failures = []
+    for deferred in DEFERRED_MODULES:
+        if deferred in modules and deferred not in args.allow_eager:
+            failures.append(f"{deferred} is imported at startup; it should load on first use")
+    if args.budget_ms > 0 and total_ms > args.budget_ms:
+        failures.append(f"startup import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,16 +5,66 @@ This app uses the local MCP server to get targeting data and Gemini to generate
 
 import streamlit as st
 import json
-import pandas as pd
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import importlib.util
 from datetime import datetime
+import math
 import os
+import time
+import urllib.parse
 from typing import Dict, List, Any, Optional
-import plotly.express as px
-import plotly.graph_objects as go
+
+# Heavy dependencies load on first use, not at app startup
+from lazy_import import lazy_module
+pd = lazy_module("pandas")
+px = lazy_module("plotly.express")
+genai = lazy_module("google.generativeai")
+# Paging helpers over numpy; the first results page loads them
+target_query = lazy_module("target_query")
 
 # Import our local MCP client
-from local_mcp_client import create_mcp_client, SimplifiedMCPClient
+from local_mcp_client import create_mcp_client, window_bucket, SimplifiedMCPClient
+from llm_resilience import CircuitOpenError, ResilientCaller
+from telemetry import record_call, record_failure, record_reuse
+from email_templates import EmailRenderer
+from outbox import Outbox
+from singleflight import SingleFlight, prompt_key
+from prefetch import EmailPrefetcher
+from campaign_store import CampaignStore
+from jobs import CANCELLED, FAILED, FINISHED_STATES, SUCCEEDED, JobCancelled, JobProgress, JobRunner
+
+GEMINI_MODEL = 'gemini-1.5-flash'
+
+# Cache lifetimes for dashboard data; the data version key invalidates earlier on ingest
+STATS_TTL_SECONDS = 60
+EARTHQUAKES_TTL_SECONDS = 300
+
+# Zoom level the dashboard map opens at; map points are clustered server-side for it
+DASHBOARD_MAP_ZOOM = 5
+
+# Target table paging; sorting and filtering happen on the server
+TARGET_PAGE_SIZE = 50
+# Targets offered per page of the email target picker
+TARGET_PICKER_PAGE_SIZE = 20
+# Campaign history listing page size; bodies are loaded only when opened
+HISTORY_PAGE_SIZE = 25
+
+TARGET_SORT_OPTIONS = {
+    "Risk Level": "risk_level",
+    "Distance (km)": "distance_km",
+    "Home Value": "house_value",
+    "Magnitude": "magnitude",
+    "Shaking (MMI)": "mmi",
+    "Last Name": "last_name",
+}
+
+# Concurrent Gemini calls within one batch generation job
+GENERATION_JOB_CONCURRENCY = 4
+# Concurrent speculative draft calls; kept low so they don't crowd out user requests
+PREFETCH_CONCURRENCY = 2
+
+# Checked without importing pyarrow; it is loaded only when a page is decoded
+TARGET_RESULT_FORMAT = "arrow" if importlib.util.find_spec("pyarrow") else "columns"
 
 # Page configuration
 st.set_page_config(
@@ -79,19 +129,25 @@ def initialize_session_state():
         st.session_state.mcp_client = None
     if 'gemini_configured' not in st.session_state:
         st.session_state.gemini_configured = False
-    if 'current_targets' not in st.session_state:
-        st.session_state.current_targets = None
+    # Only the server-side result handle and its summary; targets stay on the server
+    if 'target_result' not in st.session_state:
+        st.session_state.target_result = None
+    # Job ids live in the URL so a page reload picks the same jobs back up
+    if 'targeting_job_id' not in st.session_state:
+        st.session_state.targeting_job_id = st.query_params.get("targeting_job")
+    if 'generation_job_id' not in st.session_state:
+        st.session_state.generation_job_id = st.query_params.get("generation_job")
+    if 'loaded_targeting_job_id' not in st.session_state:
+        st.session_state.loaded_targeting_job_id = None
     if 'generated_email' not in st.session_state:
         st.session_state.generated_email = None
-    if 'campaign_history' not in st.session_state:
-        st.session_state.campaign_history = []
 
 def setup_gemini_api(api_key: str) -> bool:
     """Configure Gemini API."""
     try:
         genai.configure(api_key=api_key)
         # Test the API with a simple request using the current model name
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        model = genai.GenerativeModel(GEMINI_MODEL)
         response = model.generate_content("Test")
         st.session_state.gemini_configured = True
         return True
@@ -99,84 +155,211 @@ def setup_gemini_api(api_key: str) -> bool:
         st.error(f"Failed to configure Gemini API: {e}")
         return False
 
+@st.cache_resource
+def get_llm_caller() -> ResilientCaller:
+    """Process-wide resilient caller so the circuit breaker sees every session's calls."""
+    return ResilientCaller()
+
+@st.cache_resource
+def get_email_flight() -> SingleFlight:
+    """Process-wide single-flight group so identical concurrent prompts share one Gemini call."""
+    return SingleFlight()
+
+@st.cache_resource
+def get_email_renderer() -> EmailRenderer:
+    """Email templates compiled once per process."""
+    return EmailRenderer()
+
+@st.cache_resource
+def get_campaign_store() -> CampaignStore:
+    """Shared persistent campaign history."""
+    return CampaignStore()
+
+def campaign_history_entry(target: Dict, content: Dict, campaign: str) -> Dict:
+    """Campaign history record for a generated email."""
+    person = target["person"]
+    return {
+        "campaign": campaign,
+        "target": person["first_name"] + " " + person["last_name"],
+        "target_email": person.get("email"),
+        "subject": content["subject"],
+        "body": content["body"],
+        "risk_level": target["risk_level"]
+    }
+
+@st.cache_resource
+def get_outbox() -> Outbox:
+    """Shared SQLite outbox for queued campaign sends."""
+    return Outbox()
+
+@st.cache_resource
+def get_shared_mcp_client():
+    """One MCP client (and server process) shared by every session in this process."""
+    return create_mcp_client()
+
 def connect_mcp_server():
     """Connect to the MCP server."""
     try:
         with st.spinner("Connecting to MCP server..."):
-            client = create_mcp_client()
+            client = get_shared_mcp_client()
             if client.start_server():
                 st.session_state.mcp_client = client
                 st.success("✅ Connected to MCP server successfully!")
                 return True
             else:
+                # Don't keep a dead client cached for other sessions
+                get_shared_mcp_client.clear()
                 st.error("❌ Failed to connect to MCP server")
                 return False
     except Exception as e:
         st.error(f"❌ MCP connection error: {e}")
         return False
 
+def get_data_version() -> str:
+    """Version key of the server's data plus the time bucket, used to key cached dashboard data.
+    The bucket moves rolling "last N days" windows on even when no new data arrives."""
+    client = st.session_state.mcp_client
+    if hasattr(client, "data_version"):
+        return f"{client.data_version()}@{window_bucket()}"
+    return str(window_bucket())
+
+@st.cache_data(ttl=STATS_TTL_SECONDS, show_spinner=False)
+def _load_earthquake_stats(data_version: str, _client) -> Optional[Dict]:
+    stats_json = _client.read_resource("stats/overview")
+    return json.loads(stats_json) if stats_json else None
+
 def get_earthquake_stats() -> Optional[Dict]:
     """Get earthquake statistics from MCP server."""
     if not st.session_state.mcp_client:
         return None
     
     try:
-        stats_json = st.session_state.mcp_client.read_resource("stats/overview")
-        if stats_json:
-            return json.loads(stats_json)
+        return _load_earthquake_stats(get_data_version(), st.session_state.mcp_client)
     except Exception as e:
         st.error(f"Failed to get earthquake stats: {e}")
     
     return None
 
-def get_recent_earthquakes() -> Optional[List[Dict]]:
-    """Get recent earthquakes from MCP server."""
+@st.cache_data(ttl=EARTHQUAKES_TTL_SECONDS, show_spinner=False)
+def _load_dashboard_aggregates(data_version: str, zoom: int, _client) -> Dict[str, "pd.DataFrame"]:
+    aggregates = {}
+    for kind in ("magnitude_bins", "daily_counts"):
+        aggregate_json = _client.read_resource(f"earthquakes/aggregate?kind={kind}")
+        aggregates[kind] = pd.DataFrame(json.loads(aggregate_json) if aggregate_json else [])
+    # Map markers come from the server's precomputed cluster index, bounded in size
+    markers_json = _client.read_resource(f"earthquakes/clusters?zoom={zoom}")
+    aggregates["map_clusters"] = pd.DataFrame(json.loads(markers_json)["markers"] if markers_json else [])
+    return aggregates
+
+def get_dashboard_aggregates(zoom: int = DASHBOARD_MAP_ZOOM) -> Optional[Dict[str, "pd.DataFrame"]]:
+    """Get the server-computed aggregates the dashboard charts plot."""
     if not st.session_state.mcp_client:
         return None
     
     try:
-        earthquakes_json = st.session_state.mcp_client.read_resource("earthquakes/recent?days=7&min_mag=3.0")
-        if earthquakes_json:
-            return json.loads(earthquakes_json)
+        return _load_dashboard_aggregates(get_data_version(), zoom, st.session_state.mcp_client)
     except Exception as e:
-        st.error(f"Failed to get recent earthquakes: {e}")
+        st.error(f"Failed to get earthquake aggregates: {e}")
     
     return None
 
-def find_targets(min_magnitude: float, max_distance_km: float, min_house_value: float, require_uninsured: bool) -> Optional[Dict]:
-    """Find targets using MCP server."""
-    if not st.session_state.mcp_client:
+def build_marker_map(markers: "pd.DataFrame", zoom: int, title: str, count_label: str):
+    """Map of server-clustered markers sized by count and colored by strongest magnitude."""
+    fig_map = px.scatter_mapbox(
+        markers,
+        lat="latitude",
+        lon="longitude",
+        size="count",
+        color="max_magnitude",
+        hover_name="place",
+        hover_data=["count", "max_magnitude"],
+        color_continuous_scale="Reds",
+        size_max=20,
+        zoom=zoom,
+        mapbox_style="open-street-map",
+        title=title,
+        labels={"max_magnitude": "Max Magnitude", "count": count_label}
+    )
+    fig_map.update_layout(height=400)
+    return fig_map
+
+@st.cache_resource(ttl=EARTHQUAKES_TTL_SECONDS, max_entries=8)
+def build_dashboard_figures(data_version: str, zoom: int, _aggregates: Dict[str, "pd.DataFrame"]) -> Dict[str, Any]:
+    """Build the dashboard figures once per data version; treat the result as read-only."""
+    # Map of clustered earthquakes
+    fig_map = build_marker_map(_aggregates["map_clusters"], zoom, "Recent Earthquakes (Last 7 Days)", "Earthquakes")
+    
+    # Magnitude distribution
+    bins = _aggregates["magnitude_bins"]
+    fig_hist = px.bar(
+        bins,
+        x="bin_start",
+        y="count",
+        title="Magnitude Distribution",
+        labels={"bin_start": "Magnitude", "count": "Count"}
+    )
+    fig_hist.update_traces(width=bins["bin_end"] - bins["bin_start"], offset=0)
+    
+    # Timeline
+    fig_timeline = px.line(
+        _aggregates["daily_counts"],
+        x="date",
+        y="count",
+        title="Daily Earthquake Count",
+        labels={"date": "Date", "count": "Earthquakes"}
+    )
+    
+    return {"map": fig_map, "histogram": fig_hist, "timeline": fig_timeline}
+
+def read_target_resource(resource: str, params: Dict) -> Optional[Any]:
+    """Read a targets/* resource for the session's result handle; an expired handle clears it."""
+    if not st.session_state.mcp_client or not st.session_state.target_result:
         return None
     
+    params = {"handle": st.session_state.target_result["handle"], **params}
     try:
-        result_json = st.session_state.mcp_client.call_tool("find_targets", {
-            "min_magnitude": min_magnitude,
-            "max_distance_km": max_distance_km,
-            "min_house_value": min_house_value,
-            "require_uninsured": require_uninsured
-        })
-        
-        if result_json:
-            return json.loads(result_json)
+        response_json = st.session_state.mcp_client.read_resource(f"targets/{resource}?{urllib.parse.urlencode(params)}")
+        if response_json:
+            response = json.loads(response_json)
+            if isinstance(response, dict) and response.get("expired"):
+                st.session_state.target_result = None
+                st.warning("⚠️ These target results have expired on the server. Run Find Targets again.")
+                return None
+            return response
     except Exception as e:
-        st.error(f"Failed to find targets: {e}")
+        st.error(f"Failed to load targets: {e}")
     
     return None
 
-def generate_email_with_gemini(target_data: Dict, earthquake_data: Dict, campaign_context: str) -> Optional[Dict]:
-    """Generate email content using Gemini API."""
-    if not st.session_state.gemini_configured:
-        st.error("Gemini API not configured")
-        return None
+def get_target_page(offset: int, limit: int, sort_by: Optional[str] = None,
+                    descending: bool = False, risk_levels: Optional[List[str]] = None,
+                    search: Optional[str] = None) -> Optional[Dict]:
+    """Fetch one sorted, filtered page of the session's targets from the MCP server."""
+    return read_target_resource("page", {
+        "offset": offset,
+        "limit": limit,
+        "sort": sort_by or "",
+        "desc": str(descending).lower(),
+        "risk": ",".join(risk_levels or []),
+        "q": search or "",
+        "format": TARGET_RESULT_FORMAT
+    })
+
+def get_target_markers(zoom: int) -> Optional[Dict]:
+    """Fetch clustered map markers for the targets' homes at a zoom level."""
+    return read_target_resource("clusters", {"zoom": zoom})
+
+def get_target(index: int) -> Optional[Dict]:
+    """Fetch one full target by its index in the session's result."""
+    return read_target_resource("get", {"index": index})
+
+def build_email_prompt(target_data: Dict, campaign_context: str) -> str:
+    """Build the Gemini prompt for one target."""
+    # Prepare the prompt with target and earthquake data
+    person = target_data["person"]
+    earthquake = target_data["earthquake"]
     
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Prepare the prompt with target and earthquake data
-        person = target_data["person"]
-        earthquake = target_data["earthquake"]
-        
-        prompt = f"""
+    prompt = f"""
 You are a professional insurance marketing specialist. Create a helpful, compliant email for earthquake insurance outreach.
 
 CONTEXT:
@@ -208,71 +391,224 @@ Format your response as JSON:
     "body": "Your email body here"
 }}
 """
+    return prompt
+
+def parse_email_response(response_text: str, target_data: Dict) -> Dict:
+    """Parse Gemini's reply into subject/body and add the compliance elements."""
+    # Try to parse the JSON response
+    try:
+        # Extract JSON from response
+        response_text = response_text.strip()
         
-        response = model.generate_content(prompt)
+        # Handle cases where the response might have markdown formatting
+        if "```json" in response_text:
+            json_start = response_text.find("```json") + 7
+            json_end = response_text.find("```", json_start)
+            json_text = response_text[json_start:json_end].strip()
+        elif "```" in response_text:
+            json_start = response_text.find("```") + 3
+            json_end = response_text.find("```", json_start)
+            json_text = response_text[json_start:json_end].strip()
+        else:
+            json_text = response_text
         
-        # Try to parse the JSON response
-        try:
-            # Extract JSON from response
-            response_text = response.text.strip()
-            
-            # Handle cases where the response might have markdown formatting
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-            elif "```" in response_text:
-                json_start = response_text.find("```") + 3
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-            
-            email_content = json.loads(response_text)
-            
-            # Add compliance elements
-            compliance_footer = f"""
+        email_content = json.loads(json_text)
+        
+        # Add compliance elements
+        return get_email_renderer().render_text(email_content, target_data)
+        
+    except json.JSONDecodeError:
+        # If JSON parsing fails, create a structured response
+        lines = response_text.split('\n')
+        
+        subject = "Earthquake Coverage Information"
+        body = response_text
+        
+        # Try to extract subject if it's clearly marked
+        for line in lines:
+            if line.lower().startswith('subject:'):
+                subject = line.split(':', 1)[1].strip()
+                break
+        
+        return get_email_renderer().render_text({"subject": subject, "body": body}, target_data)
+
+def generate_email_content(target_data: Dict, campaign_context: str, campaign: str, telemetry: Dict) -> Dict:
+    """Generate one email without touching Streamlit state; safe to call from worker threads."""
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    prompt = build_email_prompt(target_data, campaign_context)
+    
+    # One entry per provider request (retries and hedges included); appends are thread-safe
+    requests = []
+    
+    def provider_call():
+        requests.append(1)
+        return model.generate_content(prompt)
+    
+    call_start = time.perf_counter()
+    try:
+        response, shared = get_email_flight().do(
+            prompt_key(GEMINI_MODEL, prompt),
+            lambda: get_llm_caller().call(provider_call, campaign=campaign)
+        )
+    except Exception as e:
+        record_failure(
+            telemetry,
+            campaign,
+            GEMINI_MODEL,
+            e,
+            latency_ms=(time.perf_counter() - call_start) * 1000,
+            attempts=len(requests)
+        )
+        raise
+    record_call(
+        telemetry,
+        campaign,
+        GEMINI_MODEL,
+        response,
+        prompt,
+        latency_ms=(time.perf_counter() - call_start) * 1000,
+        cache_hit=shared,
+        attempts=len(requests)
+    )
+    
+    return parse_email_response(response.text, target_data)
 
-Best regards,
-Insurance Protection Team
-123 Insurance Street, Your City, State 12345
+def generate_email_with_gemini(target_data: Dict, earthquake_data: Dict, campaign_context: str, campaign: str = "default") -> Optional[Dict]:
+    """Generate email content using Gemini API."""
+    if not st.session_state.gemini_configured:
+        st.error("Gemini API not configured")
+        return None
+    
+    telemetry = {}
+    try:
+        return generate_email_content(target_data, campaign_context, campaign, telemetry)
+    except CircuitOpenError as e:
+        st.warning(f"⏸️ Gemini looks degraded, pausing generation: {e}")
+        return None
+    except Exception as e:
+        st.error(f"Failed to generate email with Gemini: {e}")
+        return None
+    finally:
+        get_campaign_store().add_telemetry(telemetry)
 
-To schedule a consultation: Reply to this email
-To unsubscribe: Reply with "UNSUBSCRIBE"
+def email_draft_key(target_data: Dict, campaign_context: str) -> str:
+    """Prefetched drafts are keyed by the prompt they were generated from."""
+    return prompt_key(GEMINI_MODEL, build_email_prompt(target_data, campaign_context))
 
-This email was sent because you own property in an area affected by recent seismic activity."""
+@st.cache_resource
+def get_prefetcher() -> EmailPrefetcher:
+    """Process-wide draft prefetcher; ready drafts are shared by every session."""
+    return EmailPrefetcher(generate_email_content, email_draft_key, GEMINI_MODEL, max_workers=PREFETCH_CONCURRENCY)
 
-            email_content["body"] += compliance_footer
-            
-            return email_content
-            
-        except json.JSONDecodeError:
-            # If JSON parsing fails, create a structured response
-            response_text = response.text.strip()
-            lines = response_text.split('\n')
-            
-            subject = "Earthquake Coverage Information"
-            body = response_text
-            
-            # Try to extract subject if it's clearly marked
-            for line in lines:
-                if line.lower().startswith('subject:'):
-                    subject = line.split(':', 1)[1].strip()
-                    break
-            
-            return {
-                "subject": subject,
-                "body": body + f"""
+def start_draft_prefetch(top_n: int, budget_usd: float, campaign_context: str, campaign: str):
+    """Speculatively generate drafts for the top-ranked targets of the session's result."""
+    ranked = read_target_resource("ranked", {"limit": top_n})
+    if not ranked:
+        return
+    get_prefetcher().start(
+        ranked,
+        campaign_context,
+        campaign,
+        budget_usd,
+        prompt_chars=lambda target: len(build_email_prompt(target, campaign_context))
+    )
 
-Best regards,
-Insurance Protection Team
-123 Insurance Street, Your City, State 12345
+def run_targeting_job(params: Dict, progress: JobProgress) -> Dict:
+    """Job handler: find targets on the shared MCP client."""
+    progress.update(0, 1, "Finding targets...", force=True)
+    client = get_shared_mcp_client()
+    if not client.is_connected and not client.start_server():
+        raise RuntimeError("MCP server not available")
+    
+    # The result stays on the server; the job keeps only its handle and summary
+    result = json.loads(client.call_tool("find_targets", {**params, "result_format": "handle"}))
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    
+    progress.update(1, 1, f"Found {result['summary']['total_targets']} targets", force=True)
+    return result
 
-To schedule a consultation: Reply to this email
-To unsubscribe: Reply with "UNSUBSCRIBE" """
-            }
-        
-    except Exception as e:
-        st.error(f"Failed to generate email with Gemini: {e}")
-        return None
+def run_generation_job(params: Dict, progress: JobProgress) -> Dict:
+    """Job handler: generate emails for the top-ranked targets, pausing while Gemini is degraded."""
+    client = get_shared_mcp_client()
+    query = urllib.parse.urlencode({"handle": params["handle"], "limit": params["limit"]})
+    targets = json.loads(client.read_resource(f"targets/ranked?{query}") or "null")
+    if not isinstance(targets, list):
+        raise RuntimeError((targets or {}).get("error", "Target results not available"))
+    campaign = params["campaign"]
+    telemetry = {}
+    emails = [None] * len(targets)
+    # Emails finished so far, so a pause keeps the progress bar where it is
+    completed = [0]
+    
+    def generate(target: Dict) -> Dict:
+        while True:
+            progress.check_cancelled()
+            try:
+                return generate_email_content(target, params["campaign_context"], campaign, telemetry)
+            except CircuitOpenError:
+                progress.update(completed[0], len(targets), "⏸️ Paused: Gemini is degraded", force=True)
+                get_llm_caller().breaker.wait_until_closed()
+    
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=GENERATION_JOB_CONCURRENCY) as pool:
+            futures = {pool.submit(generate, target): i for i, target in enumerate(targets)}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    emails[i] = {"target": targets[i], "content": future.result()}
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    failures += 1
+                    emails[i] = {"target": targets[i], "error": str(e)}
+                completed[0] = done
+                progress.update(done, len(targets), f"Generated {done} of {len(targets)} emails")
+    finally:
+        # Calls made before a cancellation were still paid for
+        get_campaign_store().add_telemetry(telemetry)
+    
+    return {
+        "emails": emails,
+        "failures": failures,
+        "telemetry": telemetry[campaign].summary() if campaign in telemetry else {}
+    }
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    """Process-wide job runner backed by the SQLite job table."""
+    runner = JobRunner()
+    runner.register("targeting", run_targeting_job)
+    runner.register("generation", run_generation_job)
+    runner.resume_queued()
+    return runner
+
+def show_job_status(job: Optional[Dict]) -> bool:
+    """Render a job's progress; returns True once it has succeeded."""
+    if job is None:
+        st.warning("⚠️ Job not found. It may have been run against a different job database.")
+        return False
+    
+    if job["status"] == SUCCEEDED:
+        return True
+    if job["status"] == FAILED:
+        st.error(f"❌ {job['kind'].title()} job failed: {job['error']}")
+        return False
+    if job["status"] == CANCELLED:
+        st.warning(f"⚠️ {job['kind'].title()} job was cancelled")
+        return False
+    
+    st.progress(min(job["progress"], 1.0), text=job["message"] or f"{job['kind'].title()} job {job['status']}...")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🔄 Refresh progress", key=f"refresh_{job['job_id']}"):
+            st.rerun()
+    with col2:
+        if st.button("✖️ Cancel job", key=f"cancel_{job['job_id']}"):
+            get_job_runner().cancel(job["job_id"])
+            st.rerun()
+    return False
 
 def main():
     """Main Streamlit application."""
@@ -300,6 +636,17 @@ def main():
         
         if st.session_state.gemini_configured:
             st.success("✅ Gemini API configured")
+            llm_caller = get_llm_caller()
+            with st.expander("LLM call health"):
+                st.caption(f"Circuit breaker: {llm_caller.breaker.state} ({llm_caller.breaker.trips} trips)")
+                flight_stats = get_email_flight().stats()
+                st.caption(
+                    f"Coalesced duplicates: {flight_stats['coalesced']} of {flight_stats['requests']} requests "
+                    f"({flight_stats['upstream_calls']} upstream calls)"
+                )
+                call_stats = llm_caller.campaign_stats()
+                if call_stats:
+                    st.dataframe(pd.DataFrame.from_dict(call_stats, orient="index"), use_container_width=True)
         
         # MCP Server Connection
         st.subheader("🔌 MCP Server")
@@ -309,8 +656,7 @@ def main():
         else:
             st.success("✅ MCP server connected")
             if st.button("Disconnect"):
-                if hasattr(st.session_state.mcp_client, 'stop_server'):
-                    st.session_state.mcp_client.stop_server()
+                # The client is shared across sessions, so only detach this one
                 st.session_state.mcp_client = None
                 st.rerun()
         
@@ -325,12 +671,67 @@ def main():
             format_func=lambda x: f"${x:,}"
         )
         require_uninsured = st.checkbox("Only target uninsured homes", value=True)
+        per_sequence = st.checkbox(
+            "One target per aftershock sequence",
+            value=True,
+            help="Target each person once per mainshock and its aftershocks instead of once per event"
+        )
+        risk_model = st.selectbox(
+            "Risk Model",
+            ["attenuation", "step"],
+            format_func=lambda x: {"attenuation": "Shaking intensity (MMI)", "step": "Distance steps"}[x],
+            help="Shaking intensity estimates MMI from magnitude, depth and distance"
+        )
+        
+        with st.expander("🗺️ Target Regions"):
+            people_region = st.text_area(
+                "Home region (GeoJSON)",
+                value="",
+                help="Polygon, MultiPolygon, Feature or FeatureCollection; only homes inside it are targeted"
+            )
+            quake_region = st.text_area(
+                "Earthquake region (GeoJSON)",
+                value="",
+                help="Only earthquakes inside this region are considered"
+            )
+        
+        campaign_name = st.text_input(
+            "Campaign Name",
+            value="Earthquake Outreach",
+            help="Call statistics are recorded per campaign"
+        )
         
         campaign_context = st.text_area(
             "Campaign Context",
             value="We're reaching out to homeowners in areas affected by recent earthquake activity to help them understand their earthquake insurance options.",
             help="Provide context for the email generation"
         )
+        
+        # Speculative drafts for the top targets as soon as results arrive
+        with st.expander("⚡ Draft Prefetch"):
+            prefetch_enabled = st.checkbox("Pre-generate drafts for top targets", value=False, key="prefetch_enabled")
+            prefetch_top_n = st.number_input("Top targets", min_value=1, max_value=50, value=5, step=1, key="prefetch_top_n")
+            prefetch_budget = st.number_input(
+                "Budget per result (USD)", min_value=0.0, value=0.01, step=0.01, format="%.4f", key="prefetch_budget"
+            )
+            prefetch_stats = get_prefetcher().stats()
+            st.caption(
+                f"{prefetch_stats['ready']} ready, {prefetch_stats['in_flight']} in flight, "
+                f"{prefetch_stats['used']} used, {prefetch_stats['unused']} unused "
+                f"(${prefetch_stats['unused_cost_usd']:.4f} of ${prefetch_stats['spent_usd']:.4f} unused)"
+            )
+        
+        # Background jobs
+        with st.expander("🧵 Background Jobs"):
+            recent_jobs = get_job_runner().recent(limit=10)
+            if recent_jobs:
+                st.dataframe(
+                    pd.DataFrame(recent_jobs)[["job_id", "kind", "status", "done", "total"]],
+                    use_container_width=True,
+                    hide_index=True
+                )
+            else:
+                st.caption("No jobs yet.")
     
     # Main content area
     if not st.session_state.mcp_client:
@@ -383,59 +784,28 @@ def main():
                     help="Homes without earthquake insurance"
                 )
             
+            exposure = stats.get("exposure_stats", {}).get("people")
+            if exposure:
+                st.caption(
+                    f"🌐 Shaking exposure: {exposure['high']:,} homes in strong-shaking cells (MMI ≥ VI), "
+                    f"{exposure['medium']:,} moderate (IV–V), {exposure['felt']:,} where recent quakes were felt"
+                )
+            
             # Recent earthquakes map/chart
-            recent_earthquakes = get_recent_earthquakes()
-            if recent_earthquakes:
+            aggregates = get_dashboard_aggregates()
+            if aggregates is not None and not aggregates["map_clusters"].empty:
                 st.subheader("🗺️ Recent Earthquake Activity")
                 
-                # Create DataFrame for plotting
-                eq_df = pd.DataFrame(recent_earthquakes)
+                figures = build_dashboard_figures(get_data_version(), DASHBOARD_MAP_ZOOM, aggregates)
+                st.plotly_chart(figures["map"], use_container_width=True)
                 
-                if not eq_df.empty:
-                    # Map of earthquakes
-                    fig_map = px.scatter_mapbox(
-                        eq_df,
-                        lat="latitude",
-                        lon="longitude",
-                        size="magnitude",
-                        color="magnitude",
-                        hover_name="place",
-                        hover_data=["magnitude", "time"],
-                        color_continuous_scale="Reds",
-                        size_max=20,
-                        zoom=5,
-                        mapbox_style="open-street-map",
-                        title="Recent Earthquakes (Last 7 Days)"
-                    )
-                    fig_map.update_layout(height=400)
-                    st.plotly_chart(fig_map, use_container_width=True)
-                    
-                    # Magnitude distribution
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        fig_hist = px.histogram(
-                            eq_df,
-                            x="magnitude",
-                            nbins=20,
-                            title="Magnitude Distribution",
-                            labels={"magnitude": "Magnitude", "count": "Count"}
-                        )
-                        st.plotly_chart(fig_hist, use_container_width=True)
-                    
-                    with col2:
-                        # Timeline
-                        eq_df['date'] = pd.to_datetime(eq_df['time']).dt.date
-                        daily_counts = eq_df.groupby('date').size().reset_index(name='count')
-                        
-                        fig_timeline = px.line(
-                            daily_counts,
-                            x="date",
-                            y="count",
-                            title="Daily Earthquake Count",
-                            labels={"date": "Date", "count": "Earthquakes"}
-                        )
-                        st.plotly_chart(fig_timeline, use_container_width=True)
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.plotly_chart(figures["histogram"], use_container_width=True)
+                
+                with col2:
+                    st.plotly_chart(figures["timeline"], use_container_width=True)
     
     with tab2:
         st.header("🎯 Find Campaign Targets")
@@ -443,59 +813,142 @@ def main():
         col1, col2 = st.columns([2, 1])
         
         with col1:
+            criteria = {
+                "min_magnitude": min_magnitude,
+                "max_distance_km": max_distance,
+                "min_house_value": min_home_value,
+                "require_uninsured": require_uninsured,
+                "per_sequence": per_sequence,
+                "risk_model": risk_model
+            }
+            # Regions stay GeoJSON text; the client prepares (and caches) each polygon once
+            if people_region.strip():
+                criteria["people_region"] = people_region.strip()
+            if quake_region.strip():
+                criteria["quake_region"] = quake_region.strip()
             if st.button("🔍 Find Targets", type="primary"):
-                with st.spinner("Finding targets..."):
-                    targets_result = find_targets(
-                        min_magnitude=min_magnitude,
-                        max_distance_km=max_distance,
-                        min_house_value=min_home_value,
-                        require_uninsured=require_uninsured
-                    )
-                    
-                    if targets_result:
-                        st.session_state.current_targets = targets_result
-                        st.success(f"✅ Found {targets_result['summary']['total_targets']} potential targets!")
+                job_id = get_job_runner().submit("targeting", criteria)
+                st.session_state.targeting_job_id = job_id
+                st.query_params["targeting_job"] = job_id
+            
+            job_id = st.session_state.targeting_job_id
+            if job_id and job_id != st.session_state.loaded_targeting_job_id:
+                job = get_job_runner().get(job_id)
+                if show_job_status(job):
+                    targets_result = get_job_runner().result(job_id)
+                    st.session_state.target_result = targets_result
+                    if prefetch_enabled and st.session_state.gemini_configured:
+                        start_draft_prefetch(int(prefetch_top_n), prefetch_budget, campaign_context, campaign_name)
+                    st.session_state.loaded_targeting_job_id = job_id
+                    st.success(f"✅ Found {targets_result['summary']['total_targets']} potential targets!")
+            
+            # Only earthquakes ingested since the last refresh are scored
+            if st.button("🔄 Refresh with New Earthquakes", help="Update the target set incrementally instead of re-running the search"):
+                refresh_criteria = dict(criteria)
+                if st.session_state.target_result:
+                    # Report what changed against the results shown in this session
+                    refresh_criteria["since_handle"] = st.session_state.target_result["handle"]
+                with st.spinner("Applying new earthquakes..."):
+                    refreshed = json.loads(get_shared_mcp_client().call_tool("refresh_targets", refresh_criteria))
+                if "error" in refreshed:
+                    st.error(f"Refresh failed: {refreshed['error']}")
+                else:
+                    delta = refreshed.pop("delta")
+                    delta_since = refreshed.pop("delta_since", "last_refresh")
+                    refreshed.pop("changes")
+                    st.session_state.target_result = refreshed
+                    if delta_since == "since_handle":
+                        st.success(
+                            f"✅ Since your previous results, {delta['events']} earthquakes changed targets: "
+                            f"{delta['added']} added, {delta['changed']} changed, {delta['removed']} removed"
+                        )
                     else:
-                        st.error("❌ Failed to find targets")
+                        st.success(
+                            f"✅ {delta['events']} new or revised earthquakes since the last refresh of these criteria: "
+                            f"{delta['added']} targets added, {delta['changed']} changed, {delta['removed']} removed"
+                        )
         
         with col2:
-            if st.session_state.current_targets:
-                summary = st.session_state.current_targets["summary"]
+            if st.session_state.target_result:
+                summary = st.session_state.target_result["summary"]
                 st.metric("Total Targets", summary["total_targets"])
                 st.metric("High Risk", summary["high_risk_targets"])
                 st.metric("Medium Risk", summary["medium_risk_targets"])
                 st.metric("Low Risk", summary["low_risk_targets"])
+                if summary.get("per_sequence"):
+                    st.metric("Sequences", summary["sequences"], help=f"{summary['event_targets']:,} person-event matches")
         
         # Display targets
-        if st.session_state.current_targets:
-            targets = st.session_state.current_targets["targets"]
+        if st.session_state.target_result:
+            summary = st.session_state.target_result["summary"]
             
-            if targets:
-                st.subheader(f"📋 Target List ({len(targets)} people)")
+            if summary["total_targets"]:
+                st.subheader(f"📋 Target List ({summary['total_targets']:,} people)")
                 
-                # Create DataFrame for display
-                target_data = []
-                for target in targets:
-                    person = target["person"]
-                    earthquake = target["earthquake"]
-                    target_data.append({
-                        "Name": f"{person['first_name']} {person['last_name']}",
-                        "City": f"{person['city']}, {person['state']}",
-                        "Home Value": f"${person['house_value']:,.0f}",
-                        "Distance (km)": target["distance_km"],
-                        "Risk Level": target["risk_level"].title(),
-                        "Earthquake": f"M{earthquake['magnitude']} - {earthquake['place']}",
-                        "Insurance": "No" if not person['has_insurance'] else "Yes"
-                    })
+                fcol1, fcol2, fcol3, fcol4 = st.columns([2, 2, 1, 1])
+                with fcol1:
+                    search = st.text_input("Search", placeholder="Name, email, city or earthquake", key="target_search")
+                with fcol2:
+                    risk_filter = st.multiselect("Risk Level", ["high", "medium", "low"], key="target_risk_filter")
+                with fcol3:
+                    sort_label = st.selectbox("Sort by", list(TARGET_SORT_OPTIONS), key="target_sort")
+                with fcol4:
+                    descending = st.checkbox("Descending", key="target_sort_desc")
+                
+                page_number = st.number_input("Page", min_value=1, value=1, step=1, key="target_page")
+                page = get_target_page(
+                    offset=(page_number - 1) * TARGET_PAGE_SIZE,
+                    limit=TARGET_PAGE_SIZE,
+                    sort_by=TARGET_SORT_OPTIONS[sort_label],
+                    descending=descending,
+                    risk_levels=risk_filter,
+                    search=search
+                )
                 
-                df = pd.DataFrame(target_data)
-                st.dataframe(df, use_container_width=True)
+                if page:
+                    total_pages = max(1, math.ceil(page["total_filtered"] / TARGET_PAGE_SIZE))
+                    st.caption(f"Page {page_number} of {total_pages} · {page['total_filtered']:,} matching targets")
+                    
+                    # Columnar page straight into a frame; display columns are built per column
+                    page_df = target_query.page_to_frame(page)
+                    if not page_df.empty:
+                        df = pd.DataFrame({
+                            "Name": page_df["first_name"] + " " + page_df["last_name"],
+                            "City": page_df["city"] + ", " + page_df["state"],
+                            "Home Value": page_df["house_value"],
+                            "Distance (km)": page_df["distance_km"],
+                            "Risk Level": page_df["risk_level"].str.title(),
+                            "Earthquake": "M" + page_df["magnitude"].astype(str) + " - " + page_df["place"],
+                            "Insurance": page_df["has_insurance"].map({True: "Yes", False: "No"})
+                        })
+                        st.dataframe(
+                            df,
+                            use_container_width=True,
+                            hide_index=True,
+                            column_config={"Home Value": st.column_config.NumberColumn(format="$%d")}
+                        )
+                
+                # Target homes map; the server clusters markers to the chosen level of detail
+                map_zoom = st.select_slider("Map detail", options=list(range(3, 13)), value=6, key="target_map_zoom")
+                markers = get_target_markers(map_zoom)
+                if markers and markers["markers"]:
+                    marker_df = pd.DataFrame(markers["markers"])
+                    detail = "clustered" if markers["clustered"] else "individual homes"
+                    st.plotly_chart(
+                        build_marker_map(marker_df, map_zoom, f"Target Homes ({detail})", "Targets"),
+                        use_container_width=True
+                    )
                 
-                # Risk level distribution
-                risk_counts = pd.Series([t["risk_level"] for t in targets]).value_counts()
+                # Risk level distribution from the server's summary
+                risk_counts = {
+                    "high": summary["high_risk_targets"],
+                    "medium": summary["medium_risk_targets"],
+                    "low": summary["low_risk_targets"]
+                }
                 fig_risk = px.pie(
-                    values=risk_counts.values,
-                    names=risk_counts.index,
+                    values=list(risk_counts.values()),
+                    names=list(risk_counts.keys()),
+                    color=list(risk_counts.keys()),
                     title="Risk Level Distribution",
                     color_discrete_map={"high": "#ff4444", "medium": "#ffaa00", "low": "#44ff44"}
                 )
@@ -506,157 +959,320 @@ def main():
     with tab3:
         st.header("📧 Generate Email Campaign")
         
-        if not st.session_state.current_targets or not st.session_state.current_targets["targets"]:
+        if not st.session_state.target_result or not st.session_state.target_result["summary"]["total_targets"]:
             st.warning("⚠️ Please find targets first in the 'Find Targets' tab.")
-            return
-        
-        targets = st.session_state.current_targets["targets"]
-        
-        # Select target for email generation
-        col1, col2 = st.columns([2, 1])
-        
-        with col1:
-            target_options = [
-                f"{t['person']['first_name']} {t['person']['last_name']} - {t['person']['city']} ({t['risk_level']} risk)"
-                for t in targets
-            ]
+        else:
+            total_targets = st.session_state.target_result["summary"]["total_targets"]
             
-            selected_idx = st.selectbox(
-                "Select target for email generation:",
-                range(len(target_options)),
-                format_func=lambda x: target_options[x]
-            )
+            # Select target for email generation from a searchable, server-paged list
+            col1, col2 = st.columns([2, 1])
             
-            selected_target = targets[selected_idx]
-        
-        with col2:
-            if st.button("🤖 Generate Email", type="primary"):
-                with st.spinner("Generating personalized email with Gemini..."):
-                    email_content = generate_email_with_gemini(
-                        selected_target,
-                        selected_target["earthquake"],
-                        campaign_context
+            with col1:
+                pcol1, pcol2 = st.columns([3, 1])
+                with pcol1:
+                    picker_search = st.text_input("Find target", placeholder="Name, email, city or earthquake", key="picker_search")
+                with pcol2:
+                    picker_page = st.number_input("Page", min_value=1, value=1, step=1, key="picker_page")
+                
+                picker = get_target_page(
+                    offset=(picker_page - 1) * TARGET_PICKER_PAGE_SIZE,
+                    limit=TARGET_PICKER_PAGE_SIZE,
+                    sort_by=target_query.RANK_SORT,
+                    search=picker_search
+                )
+                picker_df = target_query.page_to_frame(picker) if picker else pd.DataFrame()
+                selected_target = None
+                if picker_df.empty:
+                    st.info("No targets match this search.")
+                else:
+                    target_labels = dict(zip(
+                        picker_df["index"],
+                        picker_df["first_name"] + " " + picker_df["last_name"] + " - " + picker_df["city"]
+                        + " (" + picker_df["risk_level"] + " risk)"
+                    ))
+                    selected_idx = st.selectbox(
+                        f"Select target for email generation ({picker['total_filtered']:,} matching):",
+                        list(target_labels),
+                        format_func=lambda x: target_labels[x]
                     )
                     
+                    selected_target = get_target(int(selected_idx))
+                    if not selected_target:
+                        st.info("This target is no longer available; find targets again.")
+            
+            with col2:
+                if selected_target and get_prefetcher().peek(selected_target, campaign_context):
+                    st.caption("⚡ Prefetched draft ready")
+                if st.button("🤖 Generate Email", type="primary", disabled=not selected_target):
+                    draft = get_prefetcher().take(selected_target, campaign_context)
+                    if draft:
+                        reuse_telemetry = {}
+                        record_reuse(reuse_telemetry, campaign_name, draft.record)
+                        get_campaign_store().add_telemetry(reuse_telemetry)
+                        email_content = draft.content
+                    else:
+                        with st.spinner("Generating personalized email with Gemini..."):
+                            email_content = generate_email_with_gemini(
+                                selected_target,
+                                selected_target["earthquake"],
+                                campaign_context,
+                                campaign=campaign_name
+                            )
+                    
                     if email_content:
                         st.session_state.generated_email = {
                             "target": selected_target,
                             "content": email_content,
                             "generated_at": datetime.now()
                         }
-                        st.success("✅ Email generated successfully!")
-        
-        # Display target details
-        if selected_target:
-            st.subheader("👤 Target Details")
-            person = selected_target["person"]
-            earthquake = selected_target["earthquake"]
-            
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.markdown(f"""
-                **Personal Info:**
-                - Name: {person['first_name']} {person['last_name']}
-                - Location: {person['city']}, {person['state']}
-                - Email: {person['email']}
-                """)
+                        st.success("✅ Used prefetched draft!" if draft else "✅ Email generated successfully!")
             
-            with col2:
-                st.markdown(f"""
-                **Property Info:**
-                - Home Value: ${person['house_value']:,.0f}
-                - Insurance: {'No' if not person['has_insurance'] else 'Yes'}
-                - Risk Level: {selected_target['risk_level'].title()}
-                """)
+            # Display target details
+            if selected_target:
+                st.subheader("👤 Target Details")
+                person = selected_target["person"]
+                earthquake = selected_target["earthquake"]
+                
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    st.markdown(f"""
+                    **Personal Info:**
+                    - Name: {person['first_name']} {person['last_name']}
+                    - Location: {person['city']}, {person['state']}
+                    - Email: {person['email']}
+                    """)
+                
+                with col2:
+                    st.markdown(f"""
+                    **Property Info:**
+                    - Home Value: ${person['house_value']:,.0f}
+                    - Insurance: {'No' if not person['has_insurance'] else 'Yes'}
+                    - Risk Level: {selected_target['risk_level'].title()}
+                    """)
+                
+                with col3:
+                    st.markdown(f"""
+                    **Earthquake Info:**
+                    - Magnitude: {earthquake['magnitude']}
+                    - Location: {earthquake['place']}
+                    - Distance: {selected_target['distance_km']} km
+                    """)
             
-            with col3:
-                st.markdown(f"""
-                **Earthquake Info:**
-                - Magnitude: {earthquake['magnitude']}
-                - Location: {earthquake['place']}
-                - Distance: {selected_target['distance_km']} km
-                """)
+            # Display generated email
+            if st.session_state.generated_email:
+                st.subheader("📧 Generated Email")
+                
+                email_data = st.session_state.generated_email
+                content = email_data["content"]
+                
+                # Subject
+                st.markdown("**Subject:**")
+                st.code(content["subject"], language="text")
+                
+                # Body
+                st.markdown("**Body:**")
+                # Use st.text_area for better visibility and formatting
+                st.text_area(
+                    "Email Body Content",
+                    value=content["body"],
+                    height=300,
+                    disabled=True,
+                    label_visibility="collapsed"
+                )
+                
+                # Actions
+                col1, col2, col3, col4 = st.columns(4)
+                
+                with col1:
+                    if st.button("🔄 Regenerate"):
+                        with st.spinner("Regenerating email..."):
+                            new_email = generate_email_with_gemini(
+                                email_data["target"],
+                                email_data["target"]["earthquake"],
+                                campaign_context,
+                                campaign=campaign_name
+                            )
+                            if new_email:
+                                st.session_state.generated_email["content"] = new_email
+                                st.rerun()
+                
+                with col2:
+                    if st.button("💾 Save to History"):
+                        get_campaign_store().add(campaign_history_entry(email_data["target"], content, campaign_name))
+                        st.success("✅ Saved to campaign history!")
+                
+                with col3:
+                    # Download as text file
+                    email_text = f"Subject: {content['subject']}\n\n{content['body']}"
+                    st.download_button(
+                        "📥 Download Email",
+                        email_text,
+                        file_name=f"email_{email_data['target']['person']['first_name']}_{email_data['target']['person']['last_name']}.txt",
+                        mime="text/plain"
+                    )
+                
+                with col4:
+                    if st.button("📤 Queue for Sending"):
+                        outbox = get_outbox()
+                        recipient = email_data["target"]["person"]
+                        report = outbox.enqueue(campaign_name, [{
+                            "to": recipient["email"],
+                            "name": f"{recipient['first_name']} {recipient['last_name']}",
+                            "subject": content["subject"],
+                            "text": content["body"],
+                            "html": content.get("html", "")
+                        }])
+                        queued = outbox.status_counts(campaign_name)
+                        if report.ignored:
+                            st.warning("⚠️ This email was already sent; the regenerated version was not queued")
+                        else:
+                            st.success(f"✅ Queued! {queued['pending']} pending, {queued['sent']} sent for '{campaign_name}'")
         
-        # Display generated email
-        if st.session_state.generated_email:
-            st.subheader("📧 Generated Email")
-            
-            email_data = st.session_state.generated_email
-            content = email_data["content"]
-            
-            # Subject
-            st.markdown("**Subject:**")
-            st.code(content["subject"], language="text")
-            
-            # Body
-            st.markdown("**Body:**")
-            # Use st.text_area for better visibility and formatting
-            st.text_area(
-                "Email Body Content",
-                value=content["body"],
-                height=300,
-                disabled=True,
-                label_visibility="collapsed"
-            )
-            
-            # Actions
-            col1, col2, col3 = st.columns(3)
+            # Batch generation in the background
+            st.subheader("🚀 Batch Generation")
+            col1, col2 = st.columns([2, 1])
             
             with col1:
-                if st.button("🔄 Regenerate"):
-                    with st.spinner("Regenerating email..."):
-                        new_email = generate_email_with_gemini(
-                            selected_target,
-                            selected_target["earthquake"],
-                            campaign_context
-                        )
-                        if new_email:
-                            st.session_state.generated_email["content"] = new_email
-                            st.rerun()
+                batch_size = st.number_input(
+                    "Generate emails for the top-ranked targets",
+                    min_value=1,
+                    max_value=total_targets,
+                    value=min(10, total_targets),
+                    step=1
+                )
             
             with col2:
-                if st.button("💾 Save to History"):
-                    campaign_entry = {
-                        "timestamp": datetime.now(),
-                        "target": email_data["target"]["person"]["first_name"] + " " + email_data["target"]["person"]["last_name"],
-                        "subject": content["subject"],
-                        "body": content["body"],
-                        "risk_level": email_data["target"]["risk_level"]
-                    }
-                    st.session_state.campaign_history.append(campaign_entry)
-                    st.success("✅ Saved to campaign history!")
+                if st.button("🚀 Start Batch"):
+                    # Targets are ranked and fetched on the server when the job runs
+                    job_id = get_job_runner().submit("generation", {
+                        "handle": st.session_state.target_result["handle"],
+                        "limit": int(batch_size),
+                        "campaign_context": campaign_context,
+                        "campaign": campaign_name
+                    })
+                    st.session_state.generation_job_id = job_id
+                    st.query_params["generation_job"] = job_id
             
-            with col3:
-                # Download as text file
-                email_text = f"Subject: {content['subject']}\n\n{content['body']}"
-                st.download_button(
-                    "📥 Download Email",
-                    email_text,
-                    file_name=f"email_{person['first_name']}_{person['last_name']}.txt",
-                    mime="text/plain"
-                )
+            job_id = st.session_state.generation_job_id
+            if job_id:
+                if show_job_status(get_job_runner().get(job_id)):
+                    batch = get_job_runner().result(job_id)
+                    batch_campaign = get_job_runner().get(job_id)["params"]["campaign"]
+                    st.success(f"✅ Generated {len(batch['emails']) - batch['failures']} emails ({batch['failures']} failed)")
+                    st.dataframe(
+                        pd.DataFrame([
+                            {
+                                "Name": f"{e['target']['person']['first_name']} {e['target']['person']['last_name']}",
+                                "Risk Level": e["target"]["risk_level"].title(),
+                                "Subject": e["content"]["subject"] if "content" in e else "",
+                                "Error": e.get("error", "")
+                            }
+                            for e in batch["emails"]
+                        ]),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                    
+                    if st.button("💾 Save Batch to History"):
+                        get_campaign_store().add_many(
+                            campaign_history_entry(e["target"], e["content"], batch_campaign)
+                            for e in batch["emails"]
+                            if "content" in e
+                        )
+                        st.success("✅ Saved batch to campaign history!")
     
     with tab4:
         st.header("📈 Campaign History")
         
-        if st.session_state.campaign_history:
-            st.subheader(f"📋 Generated Campaigns ({len(st.session_state.campaign_history)})")
+        store = get_campaign_store()
+        total_campaigns = store.count()
+        if total_campaigns:
+            st.subheader(f"📋 Generated Campaigns ({total_campaigns:,})")
+            
+            hcol1, hcol2, hcol3 = st.columns([3, 1, 1])
+            with hcol1:
+                history_search = st.text_input("Search subject, body or target", key="history_search")
+            with hcol2:
+                history_risk = st.selectbox("Risk Level", ["All", "high", "medium", "low"], key="history_risk")
+            with hcol3:
+                history_page_number = st.number_input("Page", min_value=1, value=1, step=1, key="history_page")
             
-            for i, campaign in enumerate(reversed(st.session_state.campaign_history)):
-                with st.expander(f"Campaign {len(st.session_state.campaign_history) - i}: {campaign['target']} - {campaign['timestamp'].strftime('%Y-%m-%d %H:%M')}"):
+            history_page = store.list_page(
+                offset=(history_page_number - 1) * HISTORY_PAGE_SIZE,
+                limit=HISTORY_PAGE_SIZE,
+                search=history_search,
+                risk_level=None if history_risk == "All" else history_risk
+            )
+            total_pages = max(1, math.ceil(history_page["total"] / HISTORY_PAGE_SIZE))
+            st.caption(f"Page {history_page_number} of {total_pages} · {history_page['total']:,} matching campaigns")
+            
+            if history_page["rows"]:
+                rows = history_page["rows"]
+                st.dataframe(
+                    pd.DataFrame({
+                        "Saved": [datetime.fromtimestamp(r["created_at"]).strftime('%Y-%m-%d %H:%M') for r in rows],
+                        "Campaign": [r["campaign"] for r in rows],
+                        "Target": [r["target"] for r in rows],
+                        "Risk Level": [(r["risk_level"] or "").title() for r in rows],
+                        "Subject": [r["subject"] for r in rows]
+                    }),
+                    use_container_width=True,
+                    hide_index=True
+                )
+                
+                # Only the opened campaign's body is loaded
+                rows_by_id = {r["id"]: r for r in rows}
+                opened_id = st.selectbox(
+                    "Open campaign",
+                    list(rows_by_id),
+                    format_func=lambda i: f"{rows_by_id[i]['target']} - {rows_by_id[i]['subject']}",
+                    key="history_open"
+                )
+                if opened_id is not None:
+                    campaign = rows_by_id[opened_id]
                     st.markdown(f"**Target:** {campaign['target']}")
-                    st.markdown(f"**Risk Level:** {campaign['risk_level'].title()}")
+                    st.markdown(f"**Risk Level:** {(campaign['risk_level'] or '').title()}")
                     st.markdown(f"**Subject:** {campaign['subject']}")
                     st.markdown("**Body:**")
-                    st.text(campaign['body'])
+                    st.text(store.get_body(opened_id))
             
             # Clear history button
             if st.button("🗑️ Clear History"):
-                st.session_state.campaign_history = []
+                store.clear()
                 st.rerun()
         else:
             st.info("No campaigns generated yet. Generate some emails in the 'Generate Emails' tab!")
+        
+        # Generation telemetry (persisted per campaign, batch jobs included)
+        stored_telemetry = get_campaign_store().load_telemetry()
+        if stored_telemetry:
+            st.subheader("⏱️ Generation Telemetry")
+            
+            telemetry_summaries = {
+                name: telemetry.summary()
+                for name, telemetry in stored_telemetry.items()
+            }
+            current = telemetry_summaries.get(campaign_name)
+            if current:
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("p50 Latency", f"{current['p50_latency_ms'] or 0:,.0f} ms")
+                with col2:
+                    st.metric("p95 Latency", f"{current['p95_latency_ms'] or 0:,.0f} ms")
+                with col3:
+                    st.metric(
+                        "Tokens / Email",
+                        f"{current['tokens_per_email']:,.0f}",
+                        help=f"Prompt {current['prompt_tokens_per_email']:,.0f} + response {current['response_tokens_per_email']:,.0f}"
+                    )
+                with col4:
+                    st.metric("Campaign Cost", f"${current['total_cost_usd']:.4f}")
+            
+            st.dataframe(
+                pd.DataFrame.from_dict(telemetry_summaries, orient="index"),
+                use_container_width=True
+            )
     
     # Footer
     st.markdown("---")
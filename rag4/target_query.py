@@ -0,0 +1,294 @@
+"""
+Server-side paging, sorting and filtering over targeting results.
+A TargetResultView answers page requests over a result's columns so the UI
+only ever receives the rows it displays. Local engines hand it a columnar
+result ({"columns", "sources", "summary"}) filled straight from their arrays;
+a nested find_earthquake_ad_targets result from the server is converted into
+columns once. Nested targets of a columnar result are only built for the rows
+asked for. Pages and full results can be returned as rows, as a dict of
+column arrays, or as an Arrow IPC stream.
+"""
+
+import base64
+import math
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from aggregates import ClusterIndex
+
+# Sortable/filterable fields of a flattened target, as (field, source, key)
+TARGET_COLUMNS = (
+    ("first_name", "person", "first_name"),
+    ("last_name", "person", "last_name"),
+    ("email", "person", "email"),
+    ("city", "person", "city"),
+    ("state", "person", "state"),
+    ("house_value", "person", "house_value"),
+    ("has_insurance", "person", "has_insurance"),
+    ("distance_km", None, "distance_km"),
+    ("risk_level", None, "risk_level"),
+    ("magnitude", "earthquake", "magnitude"),
+    ("place", "earthquake", "place"),
+    ("sequence_id", None, "sequence_id"),
+    ("mmi", None, "mmi"),
+    ("risk_score", None, "risk_score"),
+    ("hazard_type", None, "hazard_type"),
+    ("severity", None, "severity"),
+)
+TARGET_FIELDS = tuple(field for field, _, _ in TARGET_COLUMNS)
+# Fields set on the nested target itself rather than read from one of its objects
+ROW_FIELDS = tuple(field for field, source, _ in TARGET_COLUMNS if source is None)
+NUMERIC_FIELDS = {"house_value", "distance_km", "magnitude", "mmi", "risk_score"}
+
+RISK_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+# Pseudo sort field: risk level, then risk score (highest first) when scored, else distance
+# (the order targets are worked in)
+RANK_SORT = "rank"
+
+RESULT_FORMATS = ("rows", "columns", "arrow")
+
+def rank_key(target: Dict[str, Any], scored: bool) -> Tuple[int, float]:
+    """RANK_SORT key of one nested target; `scored` says whether any target in its result has a risk_score."""
+    risk = RISK_ORDER.get(target.get("risk_level"), len(RISK_ORDER))
+    value = target.get("risk_score") if scored else target.get("distance_km")
+    if value is None or value != value:
+        return risk, math.inf
+    return risk, -value if scored else value
+
+def targets_to_columns(targets: Sequence[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Convert nested targets (a server result) into a dict of column lists in one pass per column."""
+    columns = {}
+    for field, source, key in TARGET_COLUMNS:
+        if source is None:
+            columns[field] = [target.get(key) for target in targets]
+        else:
+            # Weather hazard targets have no earthquake
+            columns[field] = [(target.get(source) or {}).get(key) for target in targets]
+    columns["has_insurance"] = [bool(value) for value in columns["has_insurance"]]
+    return columns
+
+def build_target(columns: Dict[str, List[Any]], sources: Dict[str, List[Any]], index: int) -> Dict[str, Any]:
+    """Nested target for one row of a columnar result; unset objects and fields are left out."""
+    target = {name: objects[index] for name, objects in sources.items() if objects[index] is not None}
+    for field in ROW_FIELDS:
+        value = columns[field][index]
+        if value is not None:
+            target[field] = value
+    return target
+
+def nested_targets(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Nested targets of a result in either form."""
+    if "columns" not in result:
+        return result.get("targets", [])
+    columns, sources = result["columns"], result["sources"]
+    return [build_target(columns, sources, i) for i in range(len(columns["risk_level"]))]
+
+def columns_to_arrow(columns: Dict[str, List[Any]]) -> str:
+    """Encode columns as a base64 Arrow IPC stream (requires pyarrow)."""
+    import pyarrow as pa
+
+    table = pa.table(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
+
+def arrow_to_frame(encoded: str):
+    """Decode a base64 Arrow IPC stream into a pandas DataFrame."""
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(base64.b64decode(encoded)).read_pandas()
+
+def encode_columns(columns: Dict[str, List[Any]], result_format: str) -> Dict[str, Any]:
+    """Wrap columns for transport in the requested format."""
+    if result_format == "arrow":
+        return {"format": "arrow", "arrow": columns_to_arrow(columns)}
+    if result_format == "columns":
+        return {"format": "columns", "columns": columns}
+    names = list(columns)
+    return {"format": "rows", "rows": [dict(zip(names, values)) for values in zip(*columns.values())]}
+
+class TargetResultView:
+    """Paged, sorted and filtered access to one targeting result."""
+
+    def __init__(self, result: Dict[str, Any]):
+        self.summary = result.get("summary", {})
+        # A columnar result keeps its columns and per-row objects; a nested one its targets
+        self._columns: Optional[Dict[str, List[Any]]] = result.get("columns")
+        self._sources: Optional[Dict[str, List[Any]]] = result.get("sources")
+        self._targets: Optional[List[Dict[str, Any]]] = None if "columns" in result else result.get("targets", [])
+        self._search_text: Optional[List[str]] = None
+        self._orders: Dict[Tuple[str, bool], np.ndarray] = {}
+        self._cluster_index: Optional[ClusterIndex] = None
+        # Views are shared by sessions through the result store; the lazy caches are built under this lock
+        self.lock = threading.RLock()
+
+    @property
+    def columns(self) -> Dict[str, List[Any]]:
+        if self._columns is None:
+            with self.lock:
+                if self._columns is None:
+                    self._columns = targets_to_columns(self._targets)
+        return self._columns
+
+    @property
+    def targets(self) -> List[Dict[str, Any]]:
+        """Every nested target; built once, on first use, for a columnar result."""
+        if self._targets is None:
+            with self.lock:
+                if self._targets is None:
+                    self._targets = nested_targets({"columns": self._columns, "sources": self._sources})
+        return self._targets
+
+    def __len__(self) -> int:
+        if self._columns is not None:
+            return len(self._columns["risk_level"])
+        return len(self._targets)
+
+    def rows(self, indices: Sequence[int]) -> List[Dict[str, Any]]:
+        """Nested targets for the given row indices, built on demand for a columnar result."""
+        if self._targets is not None:
+            return [self._targets[i] for i in indices]
+        return [build_target(self._columns, self._sources, i) for i in indices]
+
+    def _order(self, sort_by: Optional[str], descending: bool = False) -> np.ndarray:
+        """Row indices in sort_by order, computed once per field and direction; missing values sort last."""
+        if not sort_by:
+            return np.arange(len(self))[::-1] if descending else np.arange(len(self))
+        if sort_by not in TARGET_FIELDS and sort_by != RANK_SORT:
+            raise ValueError(f"Unknown sort field: {sort_by}")
+        key = (sort_by, descending)
+        if key not in self._orders:
+            with self.lock:
+                if key not in self._orders:
+                    self._orders[key] = self._descending(sort_by) if descending else self._compute_order(sort_by)
+        return self._orders[key]
+
+    def _descending(self, sort_by: str) -> np.ndarray:
+        """The ascending order reversed, except that None and NaN values stay last."""
+        order = self._order(sort_by)
+        if sort_by == RANK_SORT or sort_by == "risk_level":
+            return order[::-1]
+        column = self.columns[sort_by]
+        missing = np.fromiter((value is None or value != value for value in column), dtype=bool, count=len(column))[order]
+        return np.concatenate([order[~missing][::-1], order[missing]])
+
+    def _compute_order(self, sort_by: str) -> np.ndarray:
+        if sort_by == RANK_SORT:
+            risk = np.array([RISK_ORDER.get(value, len(RISK_ORDER)) for value in self.columns["risk_level"]])
+            if any(value is not None for value in self.columns["risk_score"]):
+                secondary = np.array([np.inf if value is None else -value for value in self.columns["risk_score"]], dtype=float)
+            else:
+                secondary = np.array([np.inf if value is None else value for value in self.columns["distance_km"]], dtype=float)
+            return np.lexsort((secondary, risk))
+        column = self.columns[sort_by]
+        if sort_by == "risk_level":
+            keys = np.array([RISK_ORDER.get(value, len(RISK_ORDER)) for value in column])
+            return np.argsort(keys, kind="stable")
+        if sort_by in NUMERIC_FIELDS:
+            # None becomes NaN, which argsort places last
+            keys = np.array([np.nan if value is None else value for value in column], dtype=float)
+            return np.argsort(keys, kind="stable")
+        return np.array(sorted(range(len(column)), key=lambda i: (column[i] is None, column[i] or "")), dtype=np.int64)
+
+    def _search_index(self) -> List[str]:
+        if self._search_text is None:
+            with self.lock:
+                if self._search_text is None:
+                    c = self.columns
+                    self._search_text = [
+                        f"{first} {last} {email} {city} {state} {place}".lower()
+                        for first, last, email, city, state, place in zip(
+                            c["first_name"], c["last_name"], c["email"], c["city"], c["state"], c["place"]
+                        )
+                    ]
+        return self._search_text
+
+    def _filter_mask(self, risk_levels: Optional[Sequence[str]], search: Optional[str]) -> Optional[np.ndarray]:
+        needle = search.strip().lower() if search else ""
+        if not risk_levels and not needle:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        if risk_levels:
+            mask &= np.isin(np.array(self.columns["risk_level"], dtype=object), list(risk_levels))
+        if needle:
+            mask &= np.fromiter((needle in text for text in self._search_index()), dtype=bool, count=len(self))
+        return mask
+
+    def query(
+        self,
+        offset: int = 0,
+        limit: int = 50,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        risk_levels: Optional[Sequence[str]] = None,
+        search: Optional[str] = None,
+        result_format: str = "rows",
+    ) -> Dict[str, Any]:
+        """Return one page plus the filtered total; page values are gathered per column."""
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"Unknown result format: {result_format}")
+
+        order = self._order(sort_by, descending)
+
+        mask = self._filter_mask(risk_levels, search)
+        if mask is not None:
+            order = order[mask[order]]
+
+        page_indices = order[offset:offset + limit].tolist()
+        columns = {field: [values[i] for i in page_indices] for field, values in self.columns.items()}
+        columns["index"] = page_indices
+
+        page = {
+            "summary": self.summary,
+            "total_filtered": int(len(order)),
+            "offset": offset,
+            "limit": limit,
+        }
+        page.update(encode_columns(columns, result_format))
+        return page
+
+    def target(self, index: int) -> Dict[str, Any]:
+        """One nested target by its row index."""
+        return self.rows([index])[0]
+
+    def ranked(self, limit: int) -> List[Dict[str, Any]]:
+        """The top `limit` nested targets in RANK_SORT order: risk level, then risk score (highest
+        first) when the result is scored, else distance."""
+        return self.rows(self._order(RANK_SORT)[:limit].tolist())
+
+    def cluster_index(self) -> ClusterIndex:
+        """Map clusters of the targets' homes, built once per result."""
+        if self._cluster_index is None:
+            with self.lock:
+                if self._cluster_index is None:
+                    if self._sources is not None:
+                        people = self._sources["person"]
+                    else:
+                        people = [target["person"] for target in self._targets]
+                    self._cluster_index = ClusterIndex(
+                        [person.get("latitude") for person in people],
+                        [person.get("longitude") for person in people],
+                        self.columns["magnitude"],
+                        [f"{person.get('first_name', '')} {person.get('last_name', '')}".strip() for person in people],
+                    )
+        return self._cluster_index
+
+    def export(self, result_format: str = "columns") -> Dict[str, Any]:
+        """The whole result in a columnar format."""
+        result = {"summary": self.summary}
+        result.update(encode_columns(self.columns, result_format))
+        return result
+
+def page_to_frame(page: Dict[str, Any]):
+    """Build a DataFrame from a page or export in any result format."""
+    import pandas as pd
+
+    if page.get("format") == "arrow":
+        return arrow_to_frame(page["arrow"])
+    if page.get("format") == "columns":
+        return pd.DataFrame(page["columns"])
+    return pd.DataFrame(page.get("rows", []))
@@ -0,0 +1,406 @@
+"""
+Incremental earthquake ad targeting.
+A TargetingEngine keeps the target set for one set of criteria materialized.
+People are bucketed in a grid of cells about max_distance_km wide, so a new
+or revised earthquake is only scored against the people in neighbouring
+cells. sync() picks up events inserted, replaced, revised or removed since the
+last call and returns the added, changed and removed targets, instead of
+re-running find_earthquake_ad_targets over every event and every person.
+"""
+
+import math
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from earthquake_queries import DAY_MS, DEFAULT_DB_PATH, now_ms
+from event_dedup import KM_PER_DEGREE
+from geo_regions import PreparedRegion
+from risk_model import DEFAULT_RISK_MODEL, RISK_LEVELS, RISK_MODELS, haversine_km, score_pairs, step_risk
+from target_query import TARGET_COLUMNS
+
+TargetKey = Tuple[str, str]
+
+# Current epoch ms, always past the newest stamp, so every demographics write moves MAX(updated_ms)
+DEMOGRAPHICS_STAMP_SQL = (
+    f"MAX(CAST((julianday('now') - 2440587.5) * {DAY_MS} AS INTEGER), "
+    "coalesce((SELECT MAX(updated_ms) FROM demographics), 0) + 1)"
+)
+
+# Fields whose change makes a target "changed" (row ids and sync bookkeeping don't)
+TARGET_SIGNATURE_FIELDS = ("distance_km", "risk_level", "mmi", "risk_score")
+EVENT_SIGNATURE_FIELDS = ("time", "latitude", "longitude", "depth", "magnitude", "place", "status")
+
+def target_signature(target: Dict[str, Any]) -> Tuple:
+    earthquake = target["earthquake"]
+    return (
+        tuple(target.get(name) for name in TARGET_SIGNATURE_FIELDS)
+        + tuple(earthquake.get(name) for name in EVENT_SIGNATURE_FIELDS)
+    )
+
+def person_key(person: Dict[str, Any]) -> str:
+    return str(person.get("person_id") or person.get("email") or person.get("id"))
+
+def target_key(target: Dict[str, Any]) -> TargetKey:
+    """Person and event (or aftershock sequence, for per-sequence results) of a target."""
+    return person_key(target["person"]), target.get("sequence_id") or target["earthquake"].get("event_id")
+
+@dataclass
+class TargetDelta:
+    added: List[Dict[str, Any]] = field(default_factory=list)
+    changed: List[Dict[str, Any]] = field(default_factory=list)
+    removed: List[Dict[str, Any]] = field(default_factory=list)
+    events: int = 0
+
+    def summary(self) -> Dict[str, int]:
+        return {"added": len(self.added), "changed": len(self.changed), "removed": len(self.removed), "events": self.events}
+
+def diff_targets(old: Iterable[Dict[str, Any]], new: Iterable[Dict[str, Any]]) -> TargetDelta:
+    """Targets added, changed and removed going from one result to another."""
+    before = {target_key(target): target for target in old}
+    delta = TargetDelta()
+    for target in new:
+        previous = before.pop(target_key(target), None)
+        if previous is None:
+            delta.added.append(target)
+        elif target_signature(previous) != target_signature(target):
+            delta.changed.append(target)
+    delta.removed.extend(before.values())
+    return delta
+
+def migrate_demographics_updated_ms(conn: sqlite3.Connection):
+    """Add demographics.updated_ms, stamped by triggers on every insert and update; idempotent.
+
+    Engines fingerprint the table with MAX(id), MAX(updated_ms) and COUNT(*) to notice changed people.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(demographics)")}
+    if "updated_ms" not in columns:
+        conn.execute("ALTER TABLE demographics ADD COLUMN updated_ms INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_demographics_updated_ms ON demographics (updated_ms)")
+    conn.execute(f"UPDATE demographics SET updated_ms = {DEMOGRAPHICS_STAMP_SQL} WHERE updated_ms IS NULL")
+    conn.executescript(f'''
+    CREATE TRIGGER IF NOT EXISTS demographics_updated_ms_insert AFTER INSERT ON demographics
+    WHEN new.updated_ms IS NULL BEGIN
+        UPDATE demographics SET updated_ms = {DEMOGRAPHICS_STAMP_SQL} WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS demographics_updated_ms_update AFTER UPDATE ON demographics
+    WHEN new.updated_ms IS old.updated_ms BEGIN
+        UPDATE demographics SET updated_ms = {DEMOGRAPHICS_STAMP_SQL} WHERE id = new.id;
+    END;
+    ''')
+    conn.commit()
+
+def object_array(values: List[Any]) -> np.ndarray:
+    """1-d object array of the values (np.array would try to nest sequences)."""
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+class PeopleGrid:
+    """People bucketed by lat/lon cell for radius lookups."""
+
+    def __init__(self, people: List[Dict[str, Any]], cell_km: float):
+        self.people = people
+        self.objects = object_array(people)
+        self._columns: Dict[str, np.ndarray] = {}
+        self.latitude = np.array([person["latitude"] for person in people], dtype=float)
+        self.longitude = np.array([person["longitude"] for person in people], dtype=float)
+        self.house_value = np.array([person.get("house_value") or 0.0 for person in people], dtype=float)
+        self.cell_deg = max(cell_km / KM_PER_DEGREE, 1e-3)
+        self.lon_cells = int(math.ceil(360 / self.cell_deg))
+        lat_cells = np.floor(self.latitude / self.cell_deg).astype(np.int64)
+        lon_cells = np.floor(self.longitude / self.cell_deg).astype(np.int64) % self.lon_cells
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i, key in enumerate(zip(lat_cells.tolist(), lon_cells.tolist())):
+            buckets.setdefault(key, []).append(i)
+        self.cells = {key: np.array(indices, dtype=np.int64) for key, indices in buckets.items()}
+
+    def near(self, latitude: float, longitude: float) -> np.ndarray:
+        """Indices of people in the cells within one cell width of the point (a superset of the radius)."""
+        lat_cell = int(math.floor(latitude / self.cell_deg))
+        lon_cell = int(math.floor(longitude / self.cell_deg))
+        cos_lat = max(math.cos(math.radians(min(89.0, abs(latitude) + self.cell_deg))), 1e-3)
+        lon_reach = min(self.lon_cells // 2, int(math.ceil(1 / cos_lat)))
+        found = [
+            self.cells[key]
+            for dlat in (-1, 0, 1)
+            for dlon in range(-lon_reach, lon_reach + 1)
+            if (key := (lat_cell + dlat, (lon_cell + dlon) % self.lon_cells)) in self.cells
+        ]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def column(self, key: str) -> np.ndarray:
+        """One demographics field of every person, as an object array for fancy indexing."""
+        if key not in self._columns:
+            self._columns[key] = object_array([person.get(key) for person in self.people])
+        return self._columns[key]
+
+@dataclass
+class EventTargets:
+    """One event's targets as arrays parallel to the indices of the people it reaches."""
+    event: Dict[str, Any]
+    people: PeopleGrid
+    index: np.ndarray
+    distance_km: List[float]
+    risk_level: List[str]
+    mmi: Optional[List[float]] = None
+    risk_score: Optional[List[float]] = None
+
+    def keys(self) -> List[TargetKey]:
+        return [(person_key(self.people.people[i]), self.event["event_id"]) for i in self.index.tolist()]
+
+    def signature(self, row: int) -> Tuple:
+        """Same fields as target_signature(self.target(row)), without building the target."""
+        return (
+            (self.distance_km[row], self.risk_level[row],
+             self.mmi[row] if self.mmi is not None else None,
+             self.risk_score[row] if self.risk_score is not None else None)
+            + tuple(self.event.get(name) for name in EVENT_SIGNATURE_FIELDS)
+        )
+
+    def target(self, row: int) -> Dict[str, Any]:
+        """Nested target for one row, in find_earthquake_ad_targets form."""
+        target = {
+            "person": self.people.people[int(self.index[row])],
+            "earthquake": self.event,
+            "distance_km": self.distance_km[row],
+            "risk_level": self.risk_level[row],
+        }
+        if self.mmi is not None:
+            target["mmi"], target["risk_score"] = self.mmi[row], self.risk_score[row]
+        return target
+
+class TargetingEngine:
+    """Materialized targets for one set of criteria, kept current from the earthquake table.
+
+    With `days`, only events from the last `days` days are targeted and older ones drop out as
+    the window moves on, matching a server whose find_earthquake_ad_targets limits by time. The
+    default (None) targets every stored event: the client cannot see the server's window, so it
+    only sets one when the caller asks for it.
+    """
+
+    def __init__(
+        self,
+        min_magnitude: float = 3.5,
+        max_distance_km: float = 100,
+        min_house_value: float = 500000,
+        require_uninsured: bool = True,
+        risk_model: str = DEFAULT_RISK_MODEL,
+        db_path: str = DEFAULT_DB_PATH,
+        quake_region: Optional[PreparedRegion] = None,
+        people_region: Optional[PreparedRegion] = None,
+        days: Optional[float] = None,
+    ):
+        if risk_model not in RISK_MODELS:
+            raise ValueError(f"Unknown risk model: {risk_model}")
+        self.criteria = {
+            "min_magnitude": float(min_magnitude),
+            "max_distance_km": float(max_distance_km),
+            "min_house_value": float(min_house_value),
+            "require_uninsured": bool(require_uninsured),
+        }
+        self.risk_model = risk_model
+        self.db_path = db_path
+        self.quake_region = quake_region
+        self.people_region = people_region
+        self.days = None if days is None else float(days)
+        # Targets are kept per event as arrays, so a result is filled column by column
+        self.event_targets: Dict[str, EventTargets] = {}
+        self.last_row_id = 0
+        self.last_updated_ms = 0
+        # Bumped on every sync that changes the target set
+        self.version = 0
+        self.lock = threading.Lock()
+        # Fingerprint of demographics the people were loaded at, taken first so a concurrent change is seen later
+        self.people_version = self._people_fingerprint()
+        self.people = PeopleGrid(self._load_people(), self.criteria["max_distance_km"])
+        # Last data version sync() saw; people are only re-checked when it moves on
+        self.data_version: Optional[str] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _people_fingerprint(self) -> Tuple:
+        """MAX(id), MAX(updated_ms), COUNT(*) of demographics: inserts, edits and deletes each move one."""
+        conn = self._connect()
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(demographics)")}
+            # Without the column (migrate_demographics_updated_ms) only inserts and deletes are seen
+            updated = "MAX(updated_ms)" if "updated_ms" in columns else "NULL"
+            return tuple(conn.execute(f"SELECT MAX(id), {updated}, COUNT(*) FROM demographics").fetchone())
+        finally:
+            conn.close()
+
+    def _load_people(self) -> List[Dict[str, Any]]:
+        sql = "SELECT * FROM demographics WHERE house_value >= ? AND latitude IS NOT NULL AND longitude IS NOT NULL"
+        params: List[Any] = [self.criteria["min_house_value"]]
+        if self.criteria["require_uninsured"]:
+            sql += " AND has_insurance = 0"
+        if self.people_region is not None:
+            # Bounding box in SQL, exact polygon test on what comes back
+            min_lon, min_lat, max_lon, max_lat = self.people_region.bbox
+            sql += " AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?"
+            params += [min_lat, max_lat, min_lon, max_lon]
+        conn = self._connect()
+        try:
+            people = [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+        if self.people_region is not None and people:
+            inside = self.people_region.contains(
+                [person["latitude"] for person in people], [person["longitude"] for person in people]
+            )
+            people = [person for person, keep in zip(people, inside.tolist()) if keep]
+        return people
+
+    def _score_event(self, event: Dict[str, Any]) -> Optional[EventTargets]:
+        """Targets for one event, scored against nearby people only."""
+        if event.get("magnitude") is None or event["magnitude"] < self.criteria["min_magnitude"]:
+            return None
+        if self.quake_region is not None and not self.quake_region.contains([event["latitude"]], [event["longitude"]])[0]:
+            return None
+        candidates = self.people.near(event["latitude"], event["longitude"])
+        if not len(candidates):
+            return None
+        distance = haversine_km(
+            self.people.latitude[candidates], self.people.longitude[candidates], event["latitude"], event["longitude"]
+        )
+        within = distance <= self.criteria["max_distance_km"]
+        candidates, distance = candidates[within], distance[within]
+        if not len(candidates):
+            return None
+        targets = EventTargets(event, self.people, candidates, [round(d, 1) for d in distance.tolist()], [])
+        if self.risk_model == "attenuation":
+            depth = np.nan if event.get("depth") is None else event["depth"]
+            scores = score_pairs(distance, event["magnitude"], np.full(len(distance), depth))
+            risk = scores["risk"]
+            targets.mmi = np.round(scores["mmi"], 2).tolist()
+            targets.risk_score = np.round(scores["score"], 4).tolist()
+        else:
+            risk = step_risk(distance, event["magnitude"], self.people.house_value[candidates])
+        targets.risk_level = RISK_LEVELS[risk].tolist()
+        return targets
+
+    def _apply_event(self, event_id: str, event: Optional[Dict[str, Any]], delta: TargetDelta):
+        """Replace the targets of one event (event None removes them) and record the differences."""
+        scored = self._score_event(event) if event is not None else None
+        previous = self.event_targets.pop(event_id, None)
+        old_rows = {key: row for row, key in enumerate(previous.keys())} if previous is not None else {}
+        if scored is not None:
+            for row, key in enumerate(scored.keys()):
+                old_row = old_rows.pop(key, None)
+                if old_row is None:
+                    delta.added.append(scored.target(row))
+                elif previous.signature(old_row) != scored.signature(row):
+                    delta.changed.append(scored.target(row))
+            self.event_targets[event_id] = scored
+        delta.removed.extend(previous.target(row) for row in old_rows.values())
+        delta.events += 1
+
+    def apply(self, events: Iterable[Dict[str, Any]], removed_event_ids: Iterable[str] = ()) -> TargetDelta:
+        """Apply new or revised events and removals; returns the resulting target changes."""
+        with self.lock:
+            return self._apply(events, removed_event_ids)
+
+    def _apply(self, events: Iterable[Dict[str, Any]], removed_event_ids: Iterable[str] = ()) -> TargetDelta:
+        delta = TargetDelta()
+        for event in events:
+            self._apply_event(event["event_id"], event, delta)
+        for event_id in removed_event_ids:
+            if event_id in self.event_targets:
+                self._apply_event(event_id, None, delta)
+        if delta.added or delta.changed or delta.removed:
+            self.version += 1
+        return delta
+
+    def sync(self, data_version: Optional[str] = None) -> TargetDelta:
+        """Apply events inserted, replaced or revised since the last sync, and drop targeted events no longer stored.
+
+        With a data_version, the demographics fingerprint is checked when it moves on; if people
+        changed they are reloaded and every event is rescored. The lock is held throughout, so
+        concurrent syncs never apply the same rows twice or skip any.
+        """
+        with self.lock:
+            rescore = False
+            if data_version is not None and data_version != self.data_version:
+                self.data_version = data_version
+                fingerprint = self._people_fingerprint()
+                if fingerprint != self.people_version:
+                    self.people_version = fingerprint
+                    self.people = PeopleGrid(self._load_people(), self.criteria["max_distance_km"])
+                    rescore = True
+
+            # Events that left the recency window are no longer "present", so their targets are removed
+            window, window_params = "", []
+            if self.days is not None:
+                window, window_params = " AND time_ms >= ?", [now_ms() - int(self.days * DAY_MS)]
+            conn = self._connect()
+            try:
+                # INSERT OR REPLACE gives rows a new id; feed revisions move updated_ms forward
+                rows = [dict(row) for row in conn.execute(
+                    f"SELECT * FROM earthquake_events WHERE (id > ? OR updated_ms > ?){window} ORDER BY id",
+                    [-1, -1] + window_params if rescore else [self.last_row_id, self.last_updated_ms] + window_params
+                )]
+                # Only events with targets can produce removals
+                known = list(self.event_targets)
+                present = set()
+                for start in range(0, len(known), 500):
+                    chunk = known[start:start + 500]
+                    present.update(row[0] for row in conn.execute(
+                        f"SELECT event_id FROM earthquake_events WHERE event_id IN ({', '.join('?' for _ in chunk)}){window}",
+                        chunk + window_params
+                    ))
+            finally:
+                conn.close()
+
+            if rows:
+                self.last_row_id = max(self.last_row_id, max(row["id"] for row in rows))
+                self.last_updated_ms = max(self.last_updated_ms, max(row.get("updated_ms") or 0 for row in rows))
+            return self._apply(rows, removed_event_ids=[event_id for event_id in known if event_id not in present])
+
+    def result(self) -> Dict[str, Any]:
+        """The current targets as a columnar result (see target_query), filled from the per-event arrays."""
+        with self.lock:
+            blocks = list(self.event_targets.values())
+            # A people reload rescores every event, so all blocks index the current grid
+            people = self.people
+        counts = [len(block.index) for block in blocks]
+        index = np.concatenate([block.index for block in blocks]) if blocks else np.empty(0, dtype=np.int64)
+        events = np.repeat(object_array([block.event for block in blocks]), counts)
+        scored = self.risk_model == "attenuation"
+        columns: Dict[str, List[Any]] = {}
+        for field, source, key in TARGET_COLUMNS:
+            if source == "person":
+                columns[field] = people.column(key)[index].tolist()
+            elif source == "earthquake":
+                columns[field] = np.repeat(object_array([block.event.get(key) for block in blocks]), counts).tolist()
+            elif field in ("distance_km", "risk_level") or (scored and field in ("mmi", "risk_score")):
+                columns[field] = [value for block in blocks for value in getattr(block, field)]
+            else:
+                columns[field] = [None] * len(index)
+        columns["has_insurance"] = [bool(value) for value in columns["has_insurance"]]
+        levels = columns["risk_level"]
+        summary = {
+            "total_targets": len(levels),
+            "high_risk_targets": levels.count("high"),
+            "medium_risk_targets": levels.count("medium"),
+            "low_risk_targets": levels.count("low"),
+            "criteria": {
+                **self.criteria,
+                **({"quake_region": self.quake_region.key} if self.quake_region is not None else {}),
+                **({"people_region": self.people_region.key} if self.people_region is not None else {}),
+                **({"days": self.days} if self.days is not None else {}),
+            },
+            "risk_model": self.risk_model,
+            "incremental": True,
+        }
+        return {
+            "columns": columns,
+            "sources": {"person": people.objects[index].tolist(), "earthquake": events.tolist()},
+            "summary": summary,
+        }
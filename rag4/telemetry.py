@@ -0,0 +1,232 @@
+"""
+Token, cost and latency telemetry for LLM email generation.
+Each Gemini call, failed or not, produces a CallRecord; records are
+aggregated per campaign (running totals plus a capped window of recent
+records) so batch jobs can be sized and prompt bloat spotted. CampaignStore
+persists the per-campaign state next to campaign history.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, Optional, Set
+
+from llm_resilience import percentile
+
+# Recent call records kept per campaign; totals cover every call
+MAX_TELEMETRY_RECORDS = 1000
+
+# Running totals kept per campaign
+TOTAL_FIELDS = ("calls", "upstream", "cache_hits", "failures", "retries", "prompt_tokens", "response_tokens", "cost_usd")
+
+# USD per 1M tokens as (prompt, response). Unknown models are costed at 0.
+MODEL_PRICING = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+
+def estimate_cost(model: str, prompt_tokens: int, response_tokens: int) -> float:
+    """Estimated USD cost of a call."""
+    prompt_rate, response_rate = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_rate + response_tokens * response_rate) / 1_000_000
+
+def token_counts(response: Any, prompt: str = "") -> Dict[str, Any]:
+    """Read token counts from a Gemini response, estimating when usage metadata is absent."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None and getattr(usage, "prompt_token_count", None) is not None:
+        return {
+            "prompt_tokens": int(usage.prompt_token_count or 0),
+            "response_tokens": int(getattr(usage, "candidates_token_count", 0) or 0),
+            "estimated": False,
+        }
+
+    # Roughly four characters per token for English text
+    try:
+        response_text = response.text or ""
+    except Exception:
+        response_text = ""
+    return {
+        "prompt_tokens": len(prompt) // 4,
+        "response_tokens": len(response_text) // 4,
+        "estimated": True,
+    }
+
+@dataclass
+class CallRecord:
+    campaign: str
+    model: str
+    prompt_tokens: int
+    response_tokens: int
+    latency_ms: float
+    cost_usd: float
+    cache_hit: bool = False
+    estimated_tokens: bool = False
+    timestamp: float = field(default_factory=time.time)
+    # Provider requests made for this email (retries and hedges included); 0 for shared results
+    attempts: int = 1
+    # "ok", or "failed" with the error's type and message
+    status: str = "ok"
+    error: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.response_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class CampaignTelemetry:
+    """Per-campaign running totals plus the most recent call records (for latency percentiles)."""
+
+    def __init__(self, campaign: str, max_records: int = MAX_TELEMETRY_RECORDS):
+        self.campaign = campaign
+        self.records: Deque[CallRecord] = deque(maxlen=max_records)
+        self.totals = dict.fromkeys(TOTAL_FIELDS, 0)
+        self.totals["cost_usd"] = 0.0
+        self.models: Set[str] = set()
+        # Batch jobs add records from several worker threads
+        self.lock = threading.Lock()
+
+    def add(self, record: CallRecord):
+        with self.lock:
+            self._add(record)
+
+    def _add(self, record: CallRecord):
+        self.records.append(record)
+        totals = self.totals
+        totals["calls"] += 1
+        totals["retries"] += max(0, record.attempts - 1)
+        totals["cost_usd"] += record.cost_usd
+        self.models.add(record.model)
+        if record.status != "ok":
+            totals["failures"] += 1
+        elif record.cache_hit:
+            totals["cache_hits"] += 1
+        else:
+            totals["upstream"] += 1
+            totals["prompt_tokens"] += record.prompt_tokens
+            totals["response_tokens"] += record.response_tokens
+
+    def merge(self, other: "CampaignTelemetry"):
+        """Fold another collection for the same campaign into this one."""
+        with other.lock:
+            totals, models, records = dict(other.totals), set(other.models), list(other.records)
+        with self.lock:
+            for name, value in totals.items():
+                self.totals[name] += value
+            self.models |= models
+            merged = sorted([*self.records, *records], key=lambda record: record.timestamp)
+            self.records.clear()
+            self.records.extend(merged)
+
+    def to_state(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "totals": dict(self.totals),
+                "models": sorted(self.models),
+                "records": [record.to_dict() for record in self.records],
+            }
+
+    @classmethod
+    def from_state(cls, campaign: str, state: Dict[str, Any]) -> "CampaignTelemetry":
+        telemetry = cls(campaign)
+        telemetry.totals.update(state.get("totals", {}))
+        telemetry.models = set(state.get("models", []))
+        telemetry.records.extend(CallRecord(**record) for record in state.get("records", []))
+        return telemetry
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            totals = dict(self.totals)
+            models = sorted(self.models)
+            latencies = [r.latency_ms for r in self.records if r.status == "ok" and not r.cache_hit]
+        upstream = totals["upstream"]
+
+        def per_email(total: int) -> float:
+            return round(total / upstream, 1) if upstream else 0.0
+
+        p50 = percentile(latencies, 0.50)
+        p95 = percentile(latencies, 0.95)
+        return {
+            "emails": upstream + totals["cache_hits"],
+            "cache_hits": totals["cache_hits"],
+            "failures": totals["failures"],
+            "retries": totals["retries"],
+            "p50_latency_ms": round(p50, 1) if p50 is not None else None,
+            "p95_latency_ms": round(p95, 1) if p95 is not None else None,
+            "prompt_tokens_per_email": per_email(totals["prompt_tokens"]),
+            "response_tokens_per_email": per_email(totals["response_tokens"]),
+            "tokens_per_email": per_email(totals["prompt_tokens"] + totals["response_tokens"]),
+            "total_tokens": totals["prompt_tokens"] + totals["response_tokens"],
+            "total_cost_usd": round(totals["cost_usd"], 6),
+            "models": models,
+        }
+
+def record_call(
+    telemetry: Dict[str, CampaignTelemetry],
+    campaign: str,
+    model: str,
+    response: Any,
+    prompt: str,
+    latency_ms: float,
+    cache_hit: bool = False,
+    attempts: int = 1,
+) -> CallRecord:
+    """Build a CallRecord from a provider response and add it to the campaign's telemetry."""
+    counts = token_counts(response, prompt)
+    record = CallRecord(
+        campaign=campaign,
+        model=model,
+        prompt_tokens=counts["prompt_tokens"],
+        response_tokens=counts["response_tokens"],
+        latency_ms=latency_ms,
+        # Cache hits reuse an earlier response, so no new spend
+        cost_usd=0.0 if cache_hit else estimate_cost(model, counts["prompt_tokens"], counts["response_tokens"]),
+        cache_hit=cache_hit,
+        estimated_tokens=counts["estimated"],
+        attempts=attempts,
+    )
+    telemetry.setdefault(campaign, CampaignTelemetry(campaign)).add(record)
+    return record
+
+def record_failure(
+    telemetry: Dict[str, CampaignTelemetry],
+    campaign: str,
+    model: str,
+    error: BaseException,
+    latency_ms: float,
+    attempts: int = 1,
+) -> CallRecord:
+    """Record a call that raised (after any retries); failed calls are not costed."""
+    record = CallRecord(
+        campaign=campaign,
+        model=model,
+        prompt_tokens=0,
+        response_tokens=0,
+        latency_ms=latency_ms,
+        cost_usd=0.0,
+        attempts=attempts,
+        status="failed",
+        error=f"{type(error).__name__}: {error}"[:200],
+    )
+    telemetry.setdefault(campaign, CampaignTelemetry(campaign)).add(record)
+    return record
+
+def record_reuse(telemetry: Dict[str, CampaignTelemetry], campaign: str, record: CallRecord) -> CallRecord:
+    """Record an email served from an earlier call (e.g. a prefetched draft) as a cache hit."""
+    reused = CallRecord(
+        campaign=campaign,
+        model=record.model,
+        prompt_tokens=record.prompt_tokens,
+        response_tokens=record.response_tokens,
+        latency_ms=0.0,
+        cost_usd=0.0,
+        cache_hit=True,
+        estimated_tokens=record.estimated_tokens,
+        attempts=0,
+    )
+    telemetry.setdefault(campaign, CampaignTelemetry(campaign)).add(reused)
+    return reused
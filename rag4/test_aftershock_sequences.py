@@ -0,0 +1,46 @@
+"""
+Aftershock sequences: incremental assignment at ingest and one target per person and sequence.
+"""
+
+from aftershock_sequences import assign_sequences, one_target_per_sequence
+from earthquake_partitions import EarthquakePartitions
+from event_dedup import ingest_events
+from test_event_dedup import T0, connect, quake, seed_partitions
+
+def test_ingest_assigns_sequences_incrementally(tmp_path):
+    conn = connect()
+    partitions = EarthquakePartitions(str(tmp_path))
+    ingest_events(conn, [quake("main", "ci", magnitude=6.4), quake("far", "ci", seconds=60, latitude=45.0)],
+                  partitions=partitions)
+    seed_partitions(conn, partitions)
+    # A later batch: an aftershock a day on and ~20 km away joins the open sequence
+    stats = ingest_events(conn, [quake("after", "ci", seconds=86_400, latitude=35.9, magnitude=4.1)],
+                          partitions=partitions)
+    assert stats["inserted"] == 1
+
+    sequence_of = dict(conn.execute("SELECT event_id, sequence_id FROM earthquake_events"))
+    assert sequence_of == {"main": "seq-main", "far": "seq-far", "after": "seq-main"}
+    assert conn.execute("SELECT event_count FROM earthquake_sequences WHERE sequence_id = 'seq-main'").fetchone() == (2,)
+    assert assign_sequences(conn) == {"assigned": 0, "sequences": 0}
+    # The write-through happens after assignment, so partitions see the sequence too
+    events = partitions.between(T0, T0 + 2 * 86_400_000)
+    assert {e["event_id"]: e["sequence_id"] for e in events}["after"] == "seq-main"
+
+def target(event_id: str, risk_level: str, distance_km: float, risk_score=None) -> dict:
+    return {
+        "person": {"email": "a@example.com"}, "earthquake": {"event_id": event_id, "sequence_id": "seq-main"},
+        "risk_level": risk_level, "distance_km": distance_km, "risk_score": risk_score,
+    }
+
+def test_one_target_per_sequence_ranks_by_risk_score():
+    result = one_target_per_sequence({"targets": [
+        target("main", "high", 30.0, risk_score=0.9),
+        target("after", "high", 5.0, risk_score=0.4),
+        target("fore", "medium", 1.0, risk_score=0.99),
+    ]}, {})
+    assert [t["earthquake"]["event_id"] for t in result["targets"]] == ["main"]
+    assert result["targets"][0]["sequence_event_count"] == 3
+
+def test_one_target_per_sequence_falls_back_to_distance():
+    result = one_target_per_sequence({"targets": [target("main", "high", 30.0), target("after", "high", 5.0)]}, {})
+    assert result["targets"][0]["earthquake"]["event_id"] == "after"
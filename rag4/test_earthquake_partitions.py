@@ -0,0 +1,72 @@
+"""
+Month partitions: archive round-trips, late writes to archived months, deletes and source pruning.
+"""
+
+import sqlite3
+
+from earthquake_partitions import EarthquakePartitions, month_start_ms
+
+JAN_2020 = month_start_ms((2020, 1))
+DAY = 86_400_000
+NOW = month_start_ms((2024, 1))
+
+def event(event_id: str, time_ms: int, **fields) -> dict:
+    return {
+        "event_id": event_id, "time": "2020-01-01T00:00:00.000Z", "time_ms": time_ms, "latitude": 35.0,
+        "longitude": -118.0, "depth": 8.0, "magnitude": 3.5, "place": "5 km N of Ridgecrest, CA",
+        "place_region": "California", "sequence_id": f"seq-{event_id}", **fields,
+    }
+
+def month_events(partitions: EarthquakePartitions) -> list:
+    return partitions.between(JAN_2020, JAN_2020 + 31 * DAY)
+
+def archived_january(tmp_path) -> EarthquakePartitions:
+    partitions = EarthquakePartitions(str(tmp_path / "partitions"))
+    partitions.insert_many([event(f"e{i}", JAN_2020 + i * DAY) for i in range(5)])
+    assert partitions.compact(retain_months=12, now=NOW) == ["2020-01"]
+    return partitions
+
+def test_archive_round_trip_keeps_place_and_sequence(tmp_path):
+    partitions = archived_january(tmp_path)
+    events = month_events(partitions)
+    assert [e["event_id"] for e in events] == [f"e{i}" for i in reversed(range(5))]
+    assert events[0]["place_region"] == "California"
+    assert events[0]["sequence_id"] == "seq-e4"
+    assert partitions.count_since(days=365 * 10, now=NOW) == 5
+
+def test_late_write_to_archived_month_is_merged_and_recompacted(tmp_path):
+    partitions = archived_january(tmp_path)
+    # A late event and a revision of an archived one land in a new live file for the month
+    partitions.insert_many([event("late", JAN_2020 + 10 * DAY), event("e2", JAN_2020 + 2 * DAY, magnitude=4.1)])
+    events = {e["event_id"]: e for e in month_events(partitions)}
+    assert len(events) == 6
+    assert events["e2"]["magnitude"] == 4.1
+    assert partitions.count_since(days=365 * 10, now=NOW) == 6
+
+    # Recompacting folds the live rows into the existing archive instead of overwriting it
+    partitions.compact(retain_months=12, now=NOW)
+    assert partitions.live_months() == []
+    events = {e["event_id"]: e for e in month_events(partitions)}
+    assert len(events) == 6
+    assert events["e2"]["magnitude"] == 4.1
+
+def test_delete_from_archived_month(tmp_path):
+    partitions = archived_january(tmp_path)
+    assert partitions.delete_many([{"event_id": "e1", "time_ms": JAN_2020 + DAY}]) == 1
+    assert "e1" not in {e["event_id"] for e in month_events(partitions)}
+
+def test_compact_prunes_source_table(tmp_path):
+    source = str(tmp_path / "source.db")
+    conn = sqlite3.connect(source)
+    conn.execute("CREATE TABLE earthquake_events (event_id TEXT, time_ms INTEGER)")
+    conn.executemany("INSERT INTO earthquake_events VALUES (?, ?)", [("old", JAN_2020), ("recent", NOW - DAY)])
+    conn.commit()
+    conn.close()
+
+    partitions = EarthquakePartitions(str(tmp_path / "partitions"))
+    partitions.insert_many([event("old", JAN_2020), event("recent", NOW - DAY)])
+    partitions.compact(retain_months=12, now=NOW, source_db=source)
+    conn = sqlite3.connect(source)
+    assert [row[0] for row in conn.execute("SELECT event_id FROM earthquake_events")] == ["recent"]
+    conn.close()
+    assert {e["event_id"] for e in partitions.between(0, NOW)} == {"old", "recent"}
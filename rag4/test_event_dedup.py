@@ -0,0 +1,94 @@
+"""
+Ingest dedup: cross-network duplicates, later replacements, demoted revisions and aftershock chains.
+"""
+
+import sqlite3
+
+from earthquake_partitions import EarthquakePartitions, month_start_ms
+from event_dedup import ingest_events
+
+T0 = month_start_ms((2024, 3)) + 3_600_000
+
+def connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute('''
+    CREATE TABLE earthquake_events (
+        id INTEGER PRIMARY KEY,
+        time TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        depth REAL,
+        magnitude REAL NOT NULL,
+        mag_type TEXT,
+        place TEXT,
+        network TEXT,
+        event_id TEXT UNIQUE,
+        updated TEXT,
+        status TEXT,
+        time_ms INTEGER,
+        updated_ms INTEGER,
+        place_offset_km REAL,
+        place_bearing TEXT,
+        place_locality TEXT,
+        place_region TEXT
+    )
+    ''')
+    return conn
+
+def quake(event_id: str, network: str, seconds: float = 0, latitude: float = 35.7, **fields) -> dict:
+    return {
+        "event_id": event_id, "network": network, "time": "2024-03-01T01:00:00.000Z",
+        "time_ms": T0 + int(seconds * 1000), "updated_ms": T0, "latitude": latitude, "longitude": -117.5,
+        "depth": 8.0, "magnitude": 4.2, "mag_type": "ml", "status": "reviewed",
+        "place": "12 km SW of Searles Valley, CA", **fields,
+    }
+
+def stored_ids(conn: sqlite3.Connection) -> list:
+    return [row[0] for row in conn.execute("SELECT event_id FROM earthquake_events ORDER BY time_ms, event_id")]
+
+def seed_partitions(conn: sqlite3.Connection, partitions: EarthquakePartitions):
+    conn.row_factory = sqlite3.Row
+    partitions.insert_many(dict(row) for row in conn.execute("SELECT * FROM earthquake_events"))
+    conn.row_factory = None
+
+def test_cross_network_duplicate_keeps_regional_origin(tmp_path):
+    conn = connect()
+    stats = ingest_events(conn, [quake("us1", "us"), quake("ci1", "ci", seconds=2)],
+                          partitions=EarthquakePartitions(str(tmp_path)))
+    assert stored_ids(conn) == ["ci1"]
+    assert stats["duplicates"] == 1
+    assert conn.execute("SELECT preferred_event_id FROM earthquake_duplicates WHERE event_id = 'us1'").fetchone() == ("ci1",)
+
+def test_better_origin_arriving_later_replaces_stored(tmp_path):
+    conn = connect()
+    partitions = EarthquakePartitions(str(tmp_path))
+    ingest_events(conn, [quake("us1", "us")], partitions=partitions)
+    seed_partitions(conn, partitions)
+    stats = ingest_events(conn, [quake("ci1", "ci", seconds=2)], partitions=partitions)
+    assert stats["replaced"] == 1
+    assert stored_ids(conn) == ["ci1"]
+    assert [e["event_id"] for e in partitions.between(T0 - 60_000, T0 + 60_000)] == ["ci1"]
+
+def test_revision_that_now_loses_to_stored_origin_is_deleted(tmp_path):
+    conn = connect()
+    partitions = EarthquakePartitions(str(tmp_path))
+    # Far enough apart at first to be separate quakes
+    ingest_events(conn, [quake("us1", "us", latitude=38.0), quake("ci1", "ci", seconds=2)], partitions=partitions)
+    assert stored_ids(conn) == ["us1", "ci1"]
+    seed_partitions(conn, partitions)
+
+    # The relocated us1 matches ci1, which is preferred, so us1 must go everywhere
+    stats = ingest_events(conn, [quake("us1", "us", seconds=1, updated_ms=T0 + 60_000)], partitions=partitions)
+    assert stats["replaced"] == 1
+    assert stored_ids(conn) == ["ci1"]
+    assert [e["event_id"] for e in partitions.between(T0 - 60_000, T0 + 60_000)] == ["ci1"]
+
+def test_aftershocks_are_not_chained_through_a_middle_event(tmp_path):
+    conn = connect()
+    # a-b and b-c are each within 16 s, a-c is not; a is the preferred origin of the first pair
+    ingest_events(conn, [
+        quake("a", "ci", seconds=0, updated_ms=T0 + 5_000),
+        quake("b", "us", seconds=10),
+        quake("c", "nc", seconds=20),
+    ], partitions=EarthquakePartitions(str(tmp_path)))
+    assert stored_ids(conn) == ["a", "c"]
@@ -0,0 +1,57 @@
+"""
+Outbox resume behaviour against the local SendGrid stand-in.
+"""
+
+from outbox import (
+    FAILED, MAX_PERSONALIZATIONS, PENDING, SENT, EnqueueReport, Outbox, SendGridTransport, start_stand_in,
+)
+
+def queue(outbox: Outbox, campaign: str, count: int, body: str = "Body") -> EnqueueReport:
+    return outbox.enqueue(campaign, (
+        {"to": f"person{i}@example.com", "name": f"Person {i}", "subject": "Hello", "text": body, "html": f"<p>{body}</p>"}
+        for i in range(count)
+    ))
+
+def test_failed_second_post_keeps_first_post_sent(tmp_path):
+    # Every second request fails: the batch's first chunk goes out, the second doesn't
+    stand_in = start_stand_in(fail_every=2)
+    try:
+        transport = SendGridTransport("stand-in", "noreply@example.com", host=f"http://127.0.0.1:{stand_in.server_port}")
+        outbox = Outbox(str(tmp_path / "outbox.db"))
+        total = MAX_PERSONALIZATIONS + 200
+        queue(outbox, "resume", total)
+
+        report = outbox.send("resume", transport, batch_size=total, max_workers=1, max_attempts=1)
+        assert stand_in.requests == 2
+        assert report.sent == MAX_PERSONALIZATIONS
+        assert report.failed == 200
+        assert outbox.status_counts("resume") == {PENDING: 0, "sending": 0, SENT: MAX_PERSONALIZATIONS, FAILED: 200}
+
+        # Resuming sends only the messages the failed post carried
+        assert outbox.retry_failed("resume") == 200
+        report = outbox.send("resume", transport, batch_size=total, max_workers=1, max_attempts=1)
+        assert report.sent == 200
+        assert stand_in.delivered == total
+        assert outbox.status_counts("resume")[SENT] == total
+    finally:
+        stand_in.shutdown()
+
+def test_failed_attempts_counted_per_message(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    queue(outbox, "attempts", 2)
+    batch = outbox._claim("attempts", 10)
+    # One message is on its last attempt, the other has retries left
+    batch[0]["attempts"] = 2
+    counts = outbox._settle(batch, {m["message_id"]: RuntimeError("503") for m in batch}, max_attempts=3)
+    assert counts == {SENT: 0, PENDING: 1, FAILED: 1}
+
+def test_regenerated_email_replaces_pending_and_is_reported_once_sent(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    assert queue(outbox, "regen", 2) == EnqueueReport(added=2)
+    assert queue(outbox, "regen", 2) == EnqueueReport()
+    assert queue(outbox, "regen", 2, body="New body") == EnqueueReport(updated=2)
+    batch = outbox._claim("regen", 10)
+    assert {message["text_body"] for message in batch} == {"New body"}
+
+    outbox._settle(batch[:1], {batch[0]["message_id"]: None}, max_attempts=1)
+    assert queue(outbox, "regen", 2, body="Third body") == EnqueueReport(ignored=2)
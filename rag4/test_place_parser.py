@@ -0,0 +1,37 @@
+"""
+Place parsing: the USGS place formats, and parsed columns filled at ingest and on revision.
+"""
+
+import sqlite3
+
+from earthquake_partitions import EarthquakePartitions
+from event_dedup import ingest_events
+from place_parser import ParsedPlace, parse_place
+from test_event_dedup import connect, quake
+
+def test_offset_bearing_locality_and_region():
+    assert parse_place("85 km SSW of Corinto, Nicaragua") == ParsedPlace(85.0, "SSW", "Corinto", "Nicaragua")
+
+def test_us_state_abbreviation_is_expanded():
+    assert parse_place("Rancho Tehama Reserve, CA") == ParsedPlace(None, None, "Rancho Tehama Reserve", "California")
+
+def test_locality_without_region_and_bare_region():
+    assert parse_place("12 km N of Anchorage") == ParsedPlace(12.0, "N", "Anchorage", None)
+    assert parse_place("Fiji region").region == "Fiji"
+    assert parse_place(None) == ParsedPlace(None, None, None, None)
+    assert parse_place(float("nan")) == ParsedPlace(None, None, None, None)
+
+def place_columns(conn: sqlite3.Connection, event_id: str) -> tuple:
+    return conn.execute(
+        "SELECT place_offset_km, place_bearing, place_locality, place_region FROM earthquake_events WHERE event_id = ?",
+        (event_id,)
+    ).fetchone()
+
+def test_ingest_parses_inserted_and_revised_places(tmp_path):
+    conn = connect()
+    partitions = EarthquakePartitions(str(tmp_path))
+    ingest_events(conn, [quake("ci1", "ci")], partitions=partitions)
+    assert place_columns(conn, "ci1") == (12.0, "SW", "Searles Valley", "California")
+
+    ingest_events(conn, [quake("ci1", "ci", place="3 km E of Ridgecrest, CA")], partitions=partitions)
+    assert place_columns(conn, "ci1") == (3.0, "E", "Ridgecrest", "California")
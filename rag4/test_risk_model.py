@@ -0,0 +1,30 @@
+"""
+Risk models: the AW07 attenuation model agrees with the step function where both are clear-cut.
+"""
+
+import numpy as np
+
+from risk_model import RISK_LEVELS, intensity, rescore_targets, score_pairs, step_risk
+
+def test_models_agree_on_strong_near_and_weak_far_quakes():
+    distance = np.array([5.0, 10.0, 150.0, 120.0])
+    magnitude = np.array([7.0, 7.0, 3.0, 2.5])
+    attenuation = score_pairs(distance, magnitude)["risk"]
+    step = step_risk(distance, magnitude, np.full(4, 100000.0))
+    assert RISK_LEVELS[attenuation].tolist() == ["high", "high", "low", "low"]
+    assert attenuation.tolist() == step.tolist()
+
+def test_intensity_falls_with_distance_and_rises_with_magnitude():
+    distance = np.linspace(0.0, 300.0, 31)
+    assert np.all(np.diff(intensity(5.0, distance)) <= 0)
+    assert np.all(np.diff(intensity(np.linspace(2.5, 8.0, 12), 20.0)) > 0)
+
+def test_rescore_replaces_step_levels_with_attenuation():
+    targets = [
+        {"distance_km": 30.0, "risk_level": "high", "earthquake": {"magnitude": 5.0, "depth": None}},
+        {"distance_km": 10.0, "risk_level": "high", "earthquake": {"magnitude": 7.0, "depth": 10.0}},
+    ]
+    result = rescore_targets({"targets": targets, "summary": {}})
+    assert [t["risk_level"] for t in result["targets"]] == ["low", "high"]
+    assert result["summary"]["high_risk_targets"] == 1
+    assert result["summary"]["risk_model"] == "attenuation"
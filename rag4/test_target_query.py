@@ -0,0 +1,46 @@
+"""
+Result views: columnar results build nested targets on demand and page like nested ones.
+"""
+
+from target_query import RANK_SORT, TARGET_FIELDS, TargetResultView, targets_to_columns
+
+def nested() -> list:
+    people = [
+        {"person_id": i, "first_name": name, "email": f"{name}@example.com", "has_insurance": 0, "house_value": 6e5}
+        for i, name in enumerate(("ana", "ben", "cy"))
+    ]
+    quake = {"event_id": "ci1", "magnitude": 5.1, "place": "3 km E of Ridgecrest, CA"}
+    return [
+        {"person": people[0], "earthquake": quake, "distance_km": 40.0, "risk_level": "medium", "mmi": 5.0, "risk_score": 0.4},
+        {"person": people[1], "earthquake": quake, "distance_km": 8.0, "risk_level": "high", "mmi": 7.1, "risk_score": 0.9},
+        {"person": people[2], "earthquake": quake, "distance_km": 20.0, "risk_level": "high", "mmi": 6.2, "risk_score": 0.7},
+    ]
+
+def columnar(targets: list) -> dict:
+    return {
+        "columns": targets_to_columns(targets),
+        "sources": {"person": [t["person"] for t in targets], "earthquake": [t["earthquake"] for t in targets]},
+        "summary": {"total_targets": len(targets)},
+    }
+
+def test_columnar_view_builds_only_requested_rows():
+    view = TargetResultView(columnar(nested()))
+    assert len(view) == 3
+    assert view.ranked(2) == [nested()[1], nested()[2]]
+    assert view.target(0) == nested()[0]
+    # Nothing asked for every row, so the nested list was never built
+    assert view._targets is None
+    assert view.targets == nested()
+
+def test_columnar_and_nested_views_page_alike():
+    by_rank = dict(sort_by=RANK_SORT, result_format="columns")
+    pages = [TargetResultView(result).query(**by_rank) for result in (columnar(nested()), {"targets": nested()})]
+    assert pages[0]["columns"] == pages[1]["columns"]
+    assert list(pages[0]["columns"])[:len(TARGET_FIELDS)] == list(TARGET_FIELDS)
+
+def test_descending_sort_keeps_missing_scores_last():
+    targets = nested()
+    targets[1] = {**targets[1], "risk_score": float("nan")}
+    for result in (columnar(targets), {"targets": targets}):
+        page = TargetResultView(result).query(sort_by="risk_score", descending=True, result_format="columns")
+        assert page["columns"]["index"] == [2, 0, 1]
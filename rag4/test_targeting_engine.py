@@ -0,0 +1,68 @@
+"""
+Targeting engine: people loaded once, edits noticed by fingerprint, and the recency window.
+"""
+
+import sqlite3
+
+from earthquake_queries import DAY_MS, now_ms
+from targeting_engine import TargetingEngine, migrate_demographics_updated_ms
+
+def database(tmp_path) -> str:
+    path = str(tmp_path / "rag.db")
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE demographics (
+        id INTEGER PRIMARY KEY, person_id TEXT UNIQUE NOT NULL, first_name TEXT, last_name TEXT, email TEXT,
+        latitude REAL, longitude REAL, house_value REAL, has_insurance BOOLEAN
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE earthquake_events (
+        id INTEGER PRIMARY KEY, time TEXT, latitude REAL, longitude REAL, depth REAL, magnitude REAL,
+        place TEXT, event_id TEXT UNIQUE, status TEXT, time_ms INTEGER, updated_ms INTEGER
+    )
+    ''')
+    conn.executemany(
+        "INSERT INTO demographics (person_id, first_name, email, latitude, longitude, house_value, has_insurance) "
+        "VALUES (?, ?, ?, ?, ?, ?, 0)",
+        [("p1", "ana", "ana@example.com", 35.7, -117.5, 9e5), ("p2", "ben", "ben@example.com", 35.8, -117.6, 9e5)]
+    )
+    migrate_demographics_updated_ms(conn)
+    now = now_ms()
+    conn.executemany(
+        "INSERT INTO earthquake_events (event_id, latitude, longitude, depth, magnitude, time_ms, updated_ms) "
+        "VALUES (?, 35.75, -117.55, 8.0, 5.0, ?, ?)",
+        [("recent", now - DAY_MS, now - DAY_MS), ("old", now - 40 * DAY_MS, now - 40 * DAY_MS)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+def test_people_are_loaded_once_and_reloaded_only_on_change(tmp_path, monkeypatch):
+    path = database(tmp_path)
+    engine = TargetingEngine(min_house_value=0, db_path=path)
+    loads = []
+    monkeypatch.setattr(engine, "_load_people", lambda original=engine._load_people: loads.append(1) or original())
+
+    assert engine.sync("v1").summary()["added"] == 4
+    assert engine.sync("v2").summary()["added"] == 0
+    assert loads == []
+
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE demographics SET latitude = 10.0 WHERE person_id = 'p2'")
+    conn.commit()
+    conn.close()
+    delta = engine.sync("v3")
+    assert loads == [1]
+    assert delta.summary()["removed"] == 2
+
+def test_recency_window_drops_old_events(tmp_path):
+    engine = TargetingEngine(min_house_value=0, db_path=database(tmp_path), days=30)
+    engine.sync()
+    result = engine.result()
+    assert {event["event_id"] for event in result["sources"]["earthquake"]} == {"recent"}
+    assert result["summary"]["criteria"]["days"] == 30.0
+
+    # The window moves past the remaining event, so its targets are removed
+    engine.days = 0.5
+    assert engine.sync().summary()["removed"] == 2